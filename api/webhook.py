@@ -1,7 +1,8 @@
 # api/webhook
 import os
 import asyncio
-from fastapi import FastAPI, Request, HTTPException
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request, HTTPException, Response
 from telegram import Update
 from telegram.ext import Application, MessageHandler, filters, PreCheckoutQueryHandler, ChatMemberHandler, CommandHandler
 import orjson  # Для JSON parse (как в webhook.py)
@@ -9,71 +10,179 @@ from datetime import datetime, timezone
 from authorization.subscription import save_user_data, welcome_new_user, handle_buttons, successful_payment, pre_checkout  # Импорт handlers из subscription (без handle_user_message)
 from authorization.webhook import webhook_update  # , format_filters_response Импорт webhook_update и format
 from authorization.support import handle_support_text  # Отдельный импорт для handle_user_message
+from authorization.payloads import MAX_NETLIFY_BODY, PayloadError, decode_netlify_body
 from utils.logger import logger
-from utils.telegram_utils import retry_on_timeout
-from config import TELEGRAM_TOKEN
+from utils.redis_client import close_redis, redis_client
+from utils.bot_info import build_bot, load_bot_info, save_bot_info
+from utils.outbound import OutboundDispatcher, deliver, stream_lengths
+from utils import metrics
+from utils.metrics import timed_handler, track_update
+from utils.update_queue import UpdateQueue, QueueFull
+from utils.update_processor import PerChatUpdateProcessor
+from monitoring.subscription_manager import SubscriptionManager
+from monitoring.expiry_sweeper import ExpirySweeper
+from monitoring.ingestion import CURSORS_KEY, ListingPoller
+from monitoring.sharding import ShardLeases
+from monitoring.notifier import ListingNotifier
+from config import TELEGRAM_TOKEN, TELEGRAM_API_URL, OUTBOUND_QUEUE, WEBHOOK_ACK_FAST, MAX_CONCURRENT_UPDATES, LISTINGS_SOURCE_URL, SHARD_COUNT
 from config import SUPPORT_CHAT_ID
 
-app = FastAPI(
-    docs_url=None,
-    redoc_url=None,
-    openapi_url=None
-)
-
-# Global Application (lazy init в эндпоинтах для serverless cold starts)
+# Global Application: создаётся в lifespan до первого запроса; lazy init в эндпоинтах —
+# запасной путь для рантаймов, которые не вызывают lifespan
 application = None
+_init_lock = asyncio.Lock()
 
 async def init_application():
     """Async helper: инициализирует Application, добавляет handlers и логирует."""
     global application
-    if application is not None:  # Избегаем повторной init
-        return
-    application = Application.builder().token(TELEGRAM_TOKEN).build()
+    async with _init_lock:  # Параллельные первые запросы не должны инициализировать дважды
+        if application is not None:  # Избегаем повторной init
+            return
+        application = await build_application()
+
+async def build_application():
+    bot = build_bot(TELEGRAM_TOKEN, TELEGRAM_API_URL)
+    # Данные бота из Redis вместо getMe: на холодном старте на один запрос к Telegram меньше
+    cached = await load_bot_info(bot)
+    # Разные чаты обрабатываются параллельно, апдейты одного чата — строго по порядку.
+    # Updater не нужен: апдейты приходят через вебхук FastAPI
+    application = (
+        Application.builder()
+        .bot(bot)
+        .updater(None)
+        .concurrent_updates(PerChatUpdateProcessor(MAX_CONCURRENT_UPDATES))
+        .build()
+    )
     await application.initialize()  # Обязательно для v21+: инициализирует bot и internals
+    if not cached:
+        await save_bot_info(bot)
     # Add handlers from bot.py (как в startup, но здесь)
     application.add_handler(MessageHandler(
         filters.Chat(SUPPORT_CHAT_ID) & filters.TEXT & ~filters.COMMAND,
-        handle_support_text
+        timed_handler(handle_support_text)
     ))
 
-    application.add_handler(MessageHandler(filters.StatusUpdate.WEB_APP_DATA, webhook_update))
-    application.add_handler(ChatMemberHandler(welcome_new_user, ChatMemberHandler.MY_CHAT_MEMBER))
-    application.add_handler(MessageHandler(filters.SUCCESSFUL_PAYMENT, successful_payment))
-    application.add_handler(PreCheckoutQueryHandler(pre_checkout))
-    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_buttons))
+    # timed_handler: время каждого handler'а — в /metrics (bot_handler_duration_seconds)
+    application.add_handler(MessageHandler(filters.StatusUpdate.WEB_APP_DATA, timed_handler(webhook_update)))
+    application.add_handler(ChatMemberHandler(timed_handler(welcome_new_user), ChatMemberHandler.MY_CHAT_MEMBER))
+    application.add_handler(MessageHandler(filters.SUCCESSFUL_PAYMENT, timed_handler(successful_payment)))
+    application.add_handler(PreCheckoutQueryHandler(timed_handler(pre_checkout)))
+    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, timed_handler(handle_buttons)))
+    # Шардирование: воркер берёт в аренду часть шардов subscribed_users и работает только с ними
+    application.shards = ShardLeases() if SHARD_COUNT else None
+    if application.shards is not None:
+        await application.shards.start()
+    # Полная загрузка подписчиков — только здесь, дальше кэш живёт на дельтах из Redis pub/sub
+    application.subscription_manager = SubscriptionManager(application.shards)
+    await application.subscription_manager.start()
+    # Отправитель исходящих из Redis Streams (handlers при OUTBOUND_QUEUE=1 только ставят в очередь)
+    application.outbound = OutboundDispatcher(application.bot) if OUTBOUND_QUEUE else None
+    if application.outbound is not None:
+        await application.outbound.start()
+    # Снятие истёкших подписок по индексу subscription_expiry и уведомление stop_expired
+    application.expiry_sweeper = ExpirySweeper(application.bot)
+    await application.expiry_sweeper.start()
+    # Опрос источника объявлений: новые объявления -> match_batch -> уведомления подписчикам
+    application.listing_poller = None
+    if LISTINGS_SOURCE_URL:
+        application.listing_notifier = ListingNotifier(application.bot, application.subscription_manager)
+        cursors_key = CURSORS_KEY if application.shards is None else f"{CURSORS_KEY}:{application.shards.worker_id}"
+        application.listing_poller = ListingPoller(application.subscription_manager, application.listing_notifier,
+                                                   cursors_key=cursors_key)
+        await application.listing_poller.start()
+    # Ack-fast режим: /telegram-webhook только ставит апдейт в очередь, обработка — в воркерах
+    application.update_queue = UpdateQueue(process_update) if WEBHOOK_ACK_FAST else None
+    if application.update_queue is not None:
+        await application.update_queue.start()
+    register_gauges(application)
     logger.info("Bot application initialized on cold start")
+    return application
+
+def register_gauges(application):
+    """Глубины очередей и размеры кэшей: снимаются только при запросе /metrics."""
+    metrics.gauge("bot_updates_in_progress_chats", "Чатов с апдейтом в обработке или в ожидании",
+                  lambda: len(application.update_processor._chat_locks))
+    metrics.gauge("subscription_cache_subscribers", "Подписчиков в кэше SubscriptionManager",
+                  lambda: len(application.subscription_manager))
+    metrics.gauge("subscribed_users", "Размер множества subscribed_users в Redis (SCARD при скрейпе)",
+                  lambda: redis_client.scard("subscribed_users"))
+    if application.update_queue is not None:
+        metrics.gauge("update_queue_depth", "Апдейтов в очереди ack-fast режима", lambda: application.update_queue.depth)
+    if application.outbound is not None:
+        metrics.gauge("outbound_stream_length", "Записей в потоках исходящих", stream_lengths, label="stream")
+    if application.listing_poller is not None:
+        notifier = application.listing_notifier
+        metrics.gauge("digest_pending_chats", "Чатов с недособранным дайджестом", lambda: len(notifier._pending))
+        metrics.gauge("digest_sending", "Дайджестов в отправке", lambda: len(notifier._sending))
+
+async def process_update(update: Update):
+    """Обработка апдейта через update_processor: лимит параллельности и порядок внутри чата."""
+    with track_update():  # время апдейта и команды Redis в нём — в /metrics
+        await application.update_processor.process_update(update, application.process_update(update))
+
+async def shutdown():
+    """Останавливает фоновые задачи и закрывает пул Redis при остановке процесса."""
+    if application is not None:
+        # Сначала дообрабатываем принятые апдейты — им ещё нужны Redis и отправитель
+        if application.update_queue is not None:
+            await application.update_queue.stop()
+        if application.listing_poller is not None:
+            await application.listing_poller.stop()
+            await application.listing_notifier.stop()  # недособранные дайджесты — сразу
+        await application.expiry_sweeper.stop()
+        await application.subscription_manager.stop()
+        if application.shards is not None:
+            await application.shards.stop()  # шарды сразу достаются остальным, не дожидаясь TTL
+        if application.outbound is not None:
+            await application.outbound.stop()
+    await close_redis()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Инициализация при старте процесса, а не в первом запросе от Telegram/Netlify
+    await init_application()
+    yield
+    await shutdown()
+
+app = FastAPI(
+    docs_url=None,
+    redoc_url=None,
+    openapi_url=None,
+    lifespan=lifespan,
+)
 
 @app.post("/webhook")  # POST от Netlify (web_app_data)
 async def netlify_webhook(request: Request):
     global application
+    # Размер и схема тела проверяются до init, Redis и Telegram: мусор отвечает 4xx сразу
+    length = request.headers.get("content-length", "")
+    if length.isdigit() and int(length) > MAX_NETLIFY_BODY:
+        raise HTTPException(status_code=413, detail="Body is too large")
+    try:
+        data = decode_netlify_body(await request.body())
+    except PayloadError as e:
+        logger.warning("Invalid Netlify body: %s", e, extra={"event": "invalid_netlify_body"})
+        raise HTTPException(status_code=400, detail=str(e))
     if application is None:
         await init_application()  # Lazy init перед использованием bot
     try:
-        body = await request.body()
-        data = orjson.loads(body)  # Как в webhook.py
-        chat_id = data.get('chat_id')  # From Netlify payload
-        if 'url' in data:
-            save_user_data(chat_id, {"filters_url": data["url"]})
+        chat_id = data.chat_id  # From Netlify payload
+        if data.url is not None:
             utc_timestamp = int(datetime.now(timezone.utc).timestamp())
             logger.info("💾 Saving filters_timestamp as: %s (UTC)", utc_timestamp)
-            save_user_data(chat_id, {"filters_timestamp": str(utc_timestamp)})
-            # Send confirmation (from webhook.py)
-            #message = format_filters_response(data) убрал потому что from authorization.webhook import webhook_update  # , format_filters_response 
-            async def send_confirmation():
-                await application.bot.send_message(chat_id=chat_id, text=message)
-            await retry_on_timeout(send_confirmation, chat_id=chat_id, message_text="Фильтры сохранены!")
+            await save_user_data(chat_id, {"filters_url": data.url, "filters_timestamp": str(utc_timestamp)})
+            # Подтверждение — тем же путём, что и ответ поддержки (очередь отправки или retry_on_timeout)
+            await deliver(application.bot, "send_message", {"chat_id": chat_id, "text": "✅ Фильтры сохранены!"})
             return {"status": "filters saved"}
-        elif 'supportMessage' in data:
-            message = data["supportMessage"]
-            async def send_support():
-                await application.bot.send_message('6770986953', f"📩 Поддержка от {chat_id}:\n{message}")
-                await application.bot.send_message(chat_id, "✅ Ваше сообщение отправлено в поддержку.")
-            await retry_on_timeout(send_support, chat_id=chat_id, message_text="Support sent!")
+        elif data.support_message is not None:
+            message = data.support_message
+            await deliver(application.bot, "send_message", {"chat_id": '6770986953', "text": f"📩 Поддержка от {chat_id}:\n{message}"})
+            await deliver(application.bot, "send_message", {"chat_id": chat_id, "text": "✅ Ваше сообщение отправлено в поддержку."})
             return {"status": "support sent"}
         else:
             return {"status": "ok", "error": "No url or supportMessage"}
     except Exception as e:
-        logger.error(f"Webhook error: {e}")
+        logger.error("Webhook error: %s", e, extra={"event": "netlify_webhook_error"})
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/telegram-webhook")  # POST от Telegram (updates).
@@ -86,6 +195,11 @@ async def telegram_webhook(request: Request):
         update_json = orjson.loads(body)
         update = Update.de_json(update_json, application.bot)  # Теперь bot готов
 
+        if application.update_queue is not None:
+            # Повтор уже принятого апдейта тоже подтверждаем, иначе Telegram будет слать его снова
+            await application.update_queue.put(update)
+            return {"ok": True}
+
         # Создаём новый цикл событий, если старый закрыт
         loop = asyncio.get_event_loop()
         if loop.is_closed():
@@ -93,12 +207,25 @@ async def telegram_webhook(request: Request):
             asyncio.set_event_loop(loop)
 
         # Обрабатываем обновление в текущем цикле
-        await application.process_update(update)
+        await process_update(update)
         return {"ok": True}
+    except QueueFull:
+        logger.warning("⚠️ Update queue is full, asking Telegram to retry")
+        raise HTTPException(status_code=503, detail="Update queue is full")
     except Exception as e:
-        logger.error(f"Telegram webhook error: {e}")
+        logger.error("Telegram webhook error: %s", e, extra={"event": "telegram_webhook_error"})
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/telegram-webhook/stats")  # Глубина и лаг очереди апдейтов (ack-fast режим)
+async def telegram_webhook_stats():
+    if application is None or application.update_queue is None:
+        return {"enabled": False}
+    return {"enabled": True, **application.update_queue.stats()}
+
+@app.get("/metrics")  # Prometheus: латентность handlers, Redis, лимиты и очереди
+async def metrics_endpoint():
+    return Response(await metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=int(os.getenv("PORT", 3000)))
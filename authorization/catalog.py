@@ -0,0 +1,52 @@
+# authorization/catalog.py
+from types import MappingProxyType
+from telegram import KeyboardButton, ReplyKeyboardMarkup
+from utils.translations import translations
+
+# Всё, что раньше собиралось на каждый апдейт, строится один раз при импорте из translations.
+# Объекты telegram неизменяемы, поэтому их можно отдавать всем апдейтам без копирования.
+
+LANGUAGES = ("ru", "en")
+STATUSES = ("running", "stopped")
+SETTINGS_URL = "https://realfind.netlify.app/#/settings"
+SUPPORT_URL = "https://realfind.netlify.app/#/support"
+INVOICE_AMOUNT = 2500  # Telegram Stars
+
+
+def _keyboard(status: str, lang: str) -> ReplyKeyboardMarkup:
+    status_btn = translations['stop_button'][lang] if status == "running" else translations['start_button'][lang]
+    return ReplyKeyboardMarkup([
+        [KeyboardButton(translations['settings_button'][lang], web_app={"url": SETTINGS_URL}), KeyboardButton(status_btn)],
+        [KeyboardButton(translations['free_button'][lang]), KeyboardButton(translations['support_button'][lang], web_app={"url": SUPPORT_URL})]
+    ], resize_keyboard=True)
+
+
+# Текст кнопки -> (action, lang): классификация нажатия одним поиском в dict
+BUTTON_ACTIONS = {
+    translations[f'{action}_button'][lang]: (action, lang)
+    for action in ("start", "stop", "free")
+    for lang in LANGUAGES
+}
+
+# (lang, status) -> клавиатура статуса
+KEYBOARDS = {(lang, status): _keyboard(status, lang) for lang in LANGUAGES for status in STATUSES}
+
+# lang -> параметры send_invoice без chat_id и payload (они свои у каждого пользователя).
+# Шаблон собирается один раз при импорте и общий для всех апдейтов, поэтому только для
+# чтения: вызов добавляет chat_id и payload в копию. prices — готовые JSON-значения, а не
+# LabeledPrice: те PTB и очередь исходящих переводили бы через to_dict() на каждой отправке
+INVOICES = {
+    lang: MappingProxyType({
+        "title": translations['invoice_title'][lang],
+        "description": translations['invoice_description'][lang],
+        "provider_token": "",
+        "currency": "XTR",
+        "prices": ({"label": translations['invoice_label'][lang], "amount": INVOICE_AMOUNT},),
+        "start_parameter": "toggle-bot-status",
+    })
+    for lang in LANGUAGES
+}
+
+
+def keyboard(status: str, lang: str) -> ReplyKeyboardMarkup:
+    return KEYBOARDS[(lang, "running" if status == "running" else "stopped")]
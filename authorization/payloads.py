@@ -0,0 +1,204 @@
+# authorization/payloads.py
+"""
+Типизированный разбор входящих payload'ов: web_app_data (type=settings / support)
+и тело POST /webhook от Netlify.
+
+msgspec декодирует JSON сразу в Struct'ы и проверяет типы за один проход;
+__post_init__ там же приводит значения к виду, в котором их хранит бот
+(границы — каноническими строками, own_ads — "1"/"0"), и проверяет
+диапазоны. Всё некорректное или слишком большое отклоняется PayloadError
+до любых обращений к Redis и Telegram.
+"""
+import math
+import msgspec
+import orjson
+from monitoring.filter_codec import district_registry
+from monitoring.filters import RANGE_FIELDS
+
+MAX_WEB_APP_DATA = 4096  # больше Telegram в web_app_data не передаёт
+MAX_NETLIFY_BODY = 16 * 1024
+MAX_SUPPORT_MESSAGE = 3500  # с заголовком пересылки укладывается в 4096 символов сообщения
+MAX_DISTRICTS = 64
+MAX_NAME_LENGTH = 100  # id и название района
+MAX_URL_LENGTH = 2048
+MAX_CODE = 0xFFFF  # city и deal_type — u16 в monitoring.filter_codec
+# Верхние пределы границ по RANGE_FIELDS: всё больше — опечатка или мусор
+RANGE_LIMITS = {"price": 10**9, "floor": 300, "rooms": 100, "bedrooms": 100}
+LANGUAGES = ("ru", "en")
+
+
+class PayloadError(ValueError):
+    """Payload не разобран: битый JSON, неверные типы, значения вне диапазонов или слишком большой."""
+
+
+class UnknownPayloadType(PayloadError):
+    """web_app_data с type, который бот не обрабатывает."""
+
+
+def _code(value, name: str) -> str:
+    """city / deal_type: целое 1..MAX_CODE -> каноническая строка."""
+    if value.__class__ is str:
+        if value.isdigit() and value[0] != "0" and len(value) <= 5 and int(value) <= MAX_CODE:
+            return value  # частый случай: "1"
+        value = value.strip()
+        if not value.isdigit():
+            raise ValueError(f"{name} must be a positive integer, got {value!r}")
+        value = int(value)
+    if not 0 < value <= MAX_CODE:
+        raise ValueError(f"{name} out of range: {value}")
+    return str(value)
+
+
+def _bound(value, name: str, limit: int) -> str:
+    """Граница диапазона: "" (не задана) или неотрицательное число не больше limit, канонической строкой."""
+    if value.__class__ is str:
+        if not value:
+            return ""
+        if value.isdigit() and value[0] != "0" and len(value) <= 10 and int(value) <= limit:
+            return value  # частый случай: "500"
+        value = value.strip()
+        if not value:
+            return ""
+        try:
+            value = float(value)
+        except ValueError:
+            raise ValueError(f"{name} is not a number: {value!r}") from None
+    elif value is None:
+        return ""
+    elif value.__class__ is int and 0 <= value <= limit:
+        return str(value)
+    if not math.isfinite(value) or not 0 <= value <= limit:
+        raise ValueError(f"{name} out of range: {value}")
+    return str(int(value)) if value == int(value) else repr(float(value))
+
+
+# (поле от, поле до, предел) по RANGE_FIELDS — имена собраны заранее, не на каждый payload
+_RANGES = tuple((f"{field}_from", f"{field}_to", RANGE_LIMITS[field]) for field in RANGE_FIELDS)
+# own_ads -> "1"/"0"; True/False совпадают с 1/0 как ключи
+_OWN_ADS = {"1": "1", "0": "0", 1: "1", 0: "0"}
+
+
+Bound = str | int | float | None
+
+
+class SettingsPayload(msgspec.Struct, tag="settings", tag_field="type"):
+    """Настройки фильтра из WebApp. После разбора все поля — строки в формате settings."""
+
+    city: str | int
+    deal_type: str | int
+    price_from: Bound
+    price_to: Bound
+    floor_from: Bound
+    floor_to: Bound
+    rooms_from: Bound
+    rooms_to: Bound
+    bedrooms_from: Bound
+    bedrooms_to: Bound
+    own_ads: str | int | bool
+    districts: dict[str, str] = {}
+    language: str = "ru"
+
+    def __post_init__(self):
+        self.city = _code(self.city, "city")
+        self.deal_type = _code(self.deal_type, "deal_type")
+        for low_name, high_name, limit in _RANGES:
+            low = _bound(getattr(self, low_name), low_name, limit)
+            high = _bound(getattr(self, high_name), high_name, limit)
+            if low and high and float(low) > float(high):
+                low, high = high, low  # перепутанные от/до — тот же диапазон
+            setattr(self, low_name, low)
+            setattr(self, high_name, high)
+        own_ads = _OWN_ADS.get(self.own_ads)
+        if own_ads is None:
+            raise ValueError(f"own_ads must be 0 or 1, got {self.own_ads!r}")
+        self.own_ads = own_ads
+        if self.districts:
+            if len(self.districts) > MAX_DISTRICTS:
+                raise ValueError(f"too many districts: {len(self.districts)}")
+            if any(len(key) > MAX_NAME_LENGTH or len(name) > MAX_NAME_LENGTH for key, name in self.districts.items()):
+                raise ValueError("district id or name is too long")
+            # Реестр районов заполнен — новый id бит уже не получит (окончательно решает ALLOCATE_LUA)
+            if district_registry.full and any(key not in district_registry.bits for key in self.districts):
+                raise ValueError("unknown district")
+        if self.language not in LANGUAGES:
+            self.language = "en"
+
+    def settings(self) -> dict:
+        """settings в прежнем формате: monitoring.filter_codec.storage_fields и ответ пользователю."""
+        return {
+            "city": self.city,
+            "districts": self.districts,
+            "deal_type": self.deal_type,
+            "price_from": self.price_from,
+            "price_to": self.price_to,
+            "floor_from": self.floor_from,
+            "floor_to": self.floor_to,
+            "rooms_from": self.rooms_from,
+            "rooms_to": self.rooms_to,
+            "bedrooms_from": self.bedrooms_from,
+            "bedrooms_to": self.bedrooms_to,
+            "own_ads": self.own_ads,
+        }
+
+
+class SupportPayload(msgspec.Struct, tag="support", tag_field="type"):
+    """Вопрос в поддержку из WebApp; пустое сообщение — не ошибка разбора, на него отвечает handler."""
+
+    message: str | None = None
+
+    def __post_init__(self):
+        # "message": null из WebApp — то же, что пустое сообщение
+        self.message = (self.message or "").strip()
+        if len(self.message) > MAX_SUPPORT_MESSAGE:
+            raise ValueError(f"support message is too long: {len(self.message)} chars")
+
+
+class NetlifyBody(msgspec.Struct):
+    """POST /webhook: сохранённые фильтры (url) или сообщение в поддержку (supportMessage)."""
+
+    chat_id: int
+    url: str | None = None
+    support_message: str | None = msgspec.field(default=None, name="supportMessage")
+
+    def __post_init__(self):
+        if not 0 < abs(self.chat_id) < 2**63:
+            raise ValueError(f"chat_id out of range: {self.chat_id}")
+        if self.url is not None and (len(self.url) > MAX_URL_LENGTH or not self.url.startswith(("https://", "http://"))):
+            raise ValueError("url must be an http(s) URL of reasonable length")
+        if self.support_message is not None:
+            self.support_message = self.support_message.strip()
+            if not self.support_message or len(self.support_message) > MAX_SUPPORT_MESSAGE:
+                raise ValueError(f"supportMessage must be 1..{MAX_SUPPORT_MESSAGE} chars")
+
+
+WEB_APP_TYPES = ("settings", "support")
+_web_app_decoder = msgspec.json.Decoder(SettingsPayload | SupportPayload)
+# strict=False: Netlify присылает chat_id и строкой, и числом
+_netlify_decoder = msgspec.json.Decoder(NetlifyBody, strict=False)
+
+
+def decode_web_app_data(data: str | bytes) -> SettingsPayload | SupportPayload:
+    if isinstance(data, str):
+        data = data.encode()  # лимит Telegram — в байтах, а кириллица занимает по 2 байта на символ
+    if len(data) > MAX_WEB_APP_DATA:
+        raise PayloadError(f"web_app_data is too large: {len(data)} bytes")
+    try:
+        return _web_app_decoder.decode(data)
+    except msgspec.DecodeError as e:
+        # Холодный путь: отличаем неизвестный type от битых данных, чтобы ответить пользователю точнее
+        try:
+            kind = orjson.loads(data).get("type")
+        except (orjson.JSONDecodeError, AttributeError):
+            kind = None
+        if isinstance(kind, str) and kind not in WEB_APP_TYPES:
+            raise UnknownPayloadType(kind) from None
+        raise PayloadError(str(e)) from None
+
+
+def decode_netlify_body(body: bytes) -> NetlifyBody:
+    if len(body) > MAX_NETLIFY_BODY:
+        raise PayloadError(f"body is too large: {len(body)} bytes")
+    try:
+        return _netlify_decoder.decode(body)
+    except msgspec.DecodeError as e:
+        raise PayloadError(str(e)) from None
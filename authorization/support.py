@@ -3,12 +3,13 @@ from telegram import Update
 from telegram.ext import ContextTypes
 import re
 from utils.logger import logger
+from utils.outbound import deliver
 from utils.translations import translations
 from authorization.subscription import get_user_data, get_user_language
 
 async def handle_support_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
     logger.debug("📥 handle_support_text triggered")
-    logger.debug(f"👤 From user: {update.effective_user.id}, chat: {update.effective_chat.id}")
+    logger.debug("👤 From user: %s, chat: %s", update.effective_user.id, update.effective_chat.id)
 
     # Check if this is a reply to a support message
     if update.message.reply_to_message:
@@ -17,38 +18,34 @@ async def handle_support_text(update: Update, context: ContextTypes.DEFAULT_TYPE
         if user_id_match:
             user_id = int(user_id_match.group(1))
             reply = update.message.text or ""
+            # Язык отправителя (администратора) — читаем один раз на апдейт
+            admin_data = await get_user_data(update.effective_chat.id)
+            admin_lang = get_user_language(update, admin_data)
             if not reply.strip():
                 logger.warning("⚠️ Empty reply message, ignoring")
-                user_data = get_user_data(update.effective_chat.id)
-                lang = get_user_language(update, user_data)
-                error_text = translations['support_empty_reply'][lang]
-                await update.message.reply_text(error_text)
+                error_text = translations['support_empty_reply'][admin_lang]
+                await deliver(context.bot, "send_message", {"chat_id": update.effective_chat.id, "text": error_text, "reply_to_message_id": update.message.message_id})
                 return
 
-            logger.debug(f"📤 Sending reply to user {user_id}: {reply}")
+            logger.debug("📤 Sending reply to user %s: %s", user_id, reply)
 
             try:
                 # Получаем язык получателя (user_id)
-                user_data = get_user_data(user_id)
+                user_data = await get_user_data(user_id)
                 lang = get_user_language(update, user_data)
                 reply_text = translations['support_reply'][lang].format(reply=reply)
-                await context.bot.send_message(
-                    chat_id=user_id,
-                    text=reply_text,
-                    disable_web_page_preview=True
-                )
-                # Получаем язык отправителя (администратора)
-                admin_data = get_user_data(update.effective_chat.id)
-                admin_lang = get_user_language(update, admin_data)
+                await deliver(context.bot, "send_message", {
+                    "chat_id": user_id,
+                    "text": reply_text,
+                    "disable_web_page_preview": True
+                })
                 success_text = translations['support_reply_sent'][admin_lang]
-                await update.message.reply_text(success_text)
-                logger.info(f"✅ Ответ отправлен пользователю {user_id}: {reply}")
+                await deliver(context.bot, "send_message", {"chat_id": update.effective_chat.id, "text": success_text, "reply_to_message_id": update.message.message_id})
+                logger.info("✅ Ответ отправлен пользователю %s: %s", user_id, reply, extra={"event": "support_reply_sent"})
             except Exception as e:
-                logger.exception(f"❌ Ошибка при отправке ответа пользователю {user_id}: {e}")
-                admin_data = get_user_data(update.effective_chat.id)
-                admin_lang = get_user_language(update, admin_data)
+                logger.exception("❌ Ошибка при отправке ответа пользователю %s: %s", user_id, e)
                 error_text = translations['support_reply_error'][admin_lang].format(error=str(e))
-                await update.message.reply_text(error_text)
+                await deliver(context.bot, "send_message", {"chat_id": update.effective_chat.id, "text": error_text, "reply_to_message_id": update.message.message_id})
         else:
             logger.debug("ℹ️ Not a reply to a support message, ignoring")
     else:
@@ -0,0 +1,123 @@
+# authorization/transitions.py
+import time
+from utils.redis_client import redis_client
+
+INACTIVITY_TTL = int(1.2 * 30 * 24 * 60 * 60)  # 1.2 месяца
+TRIAL_TTL = 2 * 24 * 60 * 60  # 48 часов
+SUBSCRIPTION_PERIOD = 30 * 24 * 60 * 60  # 30 дней за оплату
+CHANGES_CHANNEL = "subscriptions:changed"  # сюда публикуется chat_id после каждого изменения
+EXPIRY_KEY = "subscription_expiry"  # ZSET chat_id -> subscription_end для участников subscribed_users
+# Флаги "триал использован": хэши trials:<chat_id % TRIAL_BUCKETS> с полями chat_id вместо
+# отдельного ключа trial_used:<chat_id> на пользователя. Корзин столько, чтобы и при ~2 млн
+# пользователей в каждой было меньше hash-max-listpack-entries (128) — хэш остаётся listpack
+TRIAL_BUCKETS = 16384
+LEGACY_TRIAL_PREFIX = "trial_used:"
+
+
+def trial_key(chat_id: int) -> str:
+    return f"trials:{int(chat_id) % TRIAL_BUCKETS}"
+
+
+# Все переходы подписки выполняются одним скриптом на стороне Redis:
+# чтение состояния, запись хэша, TTL и членство в subscribed_users — атомарно и за один RTT.
+# KEYS: user:<id>, subscribed_users, trials:<корзина>, subscription_expiry, trial_used:<id> (до миграции)
+# ARGV: event, chat_id, now, inactivity_ttl, канал изменений, затем пары параметров события.
+# Ключ пользователя живёт не меньше INACTIVITY_TTL (чтобы нельзя было повторно взять триал) и до конца подписки.
+TRANSITION_LUA = """
+local user, subscribed, trial, expiry, legacy_trial = KEYS[1], KEYS[2], KEYS[3], KEYS[4], KEYS[5]
+local event, chat_id = ARGV[1], ARGV[2]
+local now, inactivity_ttl, channel = tonumber(ARGV[3]), tonumber(ARGV[4]), ARGV[5]
+local params = {}
+for i = 6, #ARGV, 2 do params[ARGV[i]] = ARGV[i + 1] end
+
+local sub_end = tonumber(redis.call('HGET', user, 'subscription_end') or '0') or 0
+local status = redis.call('HGET', user, 'bot_status') or 'stopped'
+local result = 'ok'
+
+if event == 'start' then
+  if sub_end > now then
+    status = 'running'
+    redis.call('HSET', user, 'bot_status', status)
+  else
+    result = 'inactive'
+  end
+elseif event == 'stop' then
+  status = 'stopped'
+  redis.call('HSET', user, 'bot_status', status)
+elseif event == 'trial' then
+  if sub_end > now then
+    result = 'active'
+  elseif redis.call('HEXISTS', trial, chat_id) == 1 then
+    result = 'used'
+  elseif redis.call('EXISTS', legacy_trial) == 1 then
+    -- ещё не перенесён utils.redis_memory migrate: переносим сейчас
+    redis.call('HSET', trial, chat_id, 1)
+    redis.call('DEL', legacy_trial)
+    result = 'used'
+  else
+    redis.call('HSET', trial, chat_id, 1)
+    status = 'stopped'
+    sub_end = now + tonumber(params['ttl'])
+    redis.call('HSET', user, 'bot_status', status, 'subscription_end', sub_end)
+  end
+elseif event == 'payment' then
+  status = params['status']
+  sub_end = math.max(sub_end, now) + tonumber(params['period'])
+  redis.call('HSET', user, 'bot_status', status, 'subscription_end', sub_end)
+elseif event == 'settings' then
+  -- пустое значение удаляет поле (например, settings после перехода на компактный filter)
+  for field, value in pairs(params) do
+    if value == '' then redis.call('HDEL', user, field) else redis.call('HSET', user, field, value) end
+  end
+else
+  return redis.error_reply('unknown transition ' .. event)
+end
+
+local changed = result == 'ok'
+if changed then
+  redis.call('EXPIRE', user, math.max(inactivity_ttl, sub_end - now))
+end
+if status == 'running' and sub_end > now then
+  changed = redis.call('SADD', subscribed, chat_id) == 1 or changed
+  redis.call('ZADD', expiry, sub_end, chat_id)
+else
+  changed = redis.call('SREM', subscribed, chat_id) == 1 or changed
+  redis.call('ZREM', expiry, chat_id)
+end
+if changed then
+  redis.call('PUBLISH', channel, chat_id)
+end
+return {result, status, tostring(sub_end)}
+"""
+
+_transition_script = redis_client.register_script(TRANSITION_LUA)
+
+
+async def transition(chat_id: int, event: str, params: dict | None = None, user=None) -> dict:
+    """
+    Выполняет переход подписки за один round-trip.
+
+    event: start | stop | trial | payment | settings.
+    params: trial -> {"ttl"}, payment -> {"status", "period"}, settings -> поля хэша
+    (пустая строка — удалить поле).
+    Если передан UserContext, его данные обновляются результатом перехода.
+
+    Возвращает {"result", "bot_status", "subscription_end"}, где result —
+    ok | inactive (start без подписки) | active / used (trial недоступен).
+    """
+    args = [event, chat_id, int(time.time()), INACTIVITY_TTL, CHANGES_CHANNEL]
+    for key, value in (params or {}).items():
+        args += [key, value]
+    result, status, sub_end = await _transition_script(
+        keys=[f"user:{chat_id}", "subscribed_users", trial_key(chat_id), EXPIRY_KEY, f"{LEGACY_TRIAL_PREFIX}{chat_id}"],
+        args=args,
+    )
+    if user is not None and result == "ok":
+        user.apply({"bot_status": status, "subscription_end": sub_end})
+        if event == "settings":
+            for field, value in params.items():
+                if value == "":
+                    user.data.pop(field, None)
+                else:
+                    user.data[field] = value
+    return {"result": result, "bot_status": status, "subscription_end": int(sub_end)}
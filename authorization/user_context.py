@@ -0,0 +1,29 @@
+# authorization/user_context.py
+from utils.redis_client import redis_client
+
+
+class UserContext:
+    """
+    Снимок хэша user:<chat_id> на время одного апдейта: один HGETALL в load().
+
+    Только чтение — все записи идут через authorization.transitions.transition(),
+    которая обновляет снимок результатом перехода (apply). Сколько команд Redis
+    сделал апдейт, считает utils.metrics.track_update.
+    """
+
+    __slots__ = ("chat_id", "data")
+
+    def __init__(self, chat_id: int, data: dict | None = None):
+        self.chat_id = chat_id
+        self.data = data if data is not None else {}
+
+    @classmethod
+    async def load(cls, chat_id: int) -> "UserContext":
+        return cls(chat_id, await redis_client.hgetall(f"user:{chat_id}"))
+
+    def get(self, field: str, default=None):
+        return self.data.get(field, default)
+
+    def apply(self, mapping: dict):
+        """Обновляет снимок тем, что уже записано в Redis (результатом transition)."""
+        self.data.update(mapping)
@@ -1,17 +1,18 @@
 # authorization/webhook.py
-import orjson
 import time
 from telegram import Update
 from telegram.ext import ContextTypes
 from config import SUPPORT_CHAT_ID
-from authorization.subscription import save_user_data, send_status_message # get_user_data, get_user_language возможно нужен
+from authorization.subscription import send_status_message # get_user_data, get_user_language возможно нужен
+from authorization.user_context import UserContext
+from authorization.transitions import transition
+from authorization.payloads import PayloadError, SupportPayload, UnknownPayloadType, decode_web_app_data
+from monitoring.filter_codec import RegistryFull, storage_fields
 from utils.logger import logger
+from utils.outbound import deliver
 from utils.redis_client import redis_client
-from utils.telegram_utils import retry_on_timeout
 from utils.translations import translations
 
-INACTIVITY_TTL = int(1.2 * 30 * 24 * 60 * 60)  # 1.2 месяца
-
 #def format_filters_response(data: dict, language: str = "ru") -> str:
 #    """Форматирует ответ с настройками фильтров недвижимости для пользователя."""
     # Маппинг значений
@@ -60,32 +61,45 @@ INACTIVITY_TTL = int(1.2 * 30 * 24 * 60 * 60)  # 1.2 месяца
     #    f"Только от владельцев: {own_ads}\n"
     #)
 
+def _language(stored: str | None, update: Update) -> str:
+    """Язык ответа: сохранённый в user:<id>, иначе язык клиента Telegram; всё кроме ru/en — en."""
+    lang = stored if stored is not None else update.effective_user.language_code[:2]
+    return lang if lang in ['ru', 'en'] else 'en'
+
+
 async def webhook_update(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not update.message or not update.message.web_app_data:
         return  # Not a WebApp message
 
     user_id = update.effective_user.id
+    # Разбор и проверка payload (один проход msgspec) — до чтения user:<id>, transition() и любых отправок:
+    # на битый payload только HGET языка для ответа, без HGETALL всего хэша
     try:
-        payload = orjson.loads(update.message.web_app_data.data)
-        logger.debug(f"📩 Received Web App data for user_id={user_id}: {payload}")
-
-        # Получаем язык пользователя
-        user_data = redis_client.hgetall(f"user:{user_id}")
-        lang = user_data.get("language", update.effective_user.language_code[:2])
-        lang = lang if lang in ['ru', 'en'] else 'en'
-        logger.info(f"Selected language for user_id={user_id}: {lang}")
-
-        # Dispatch based on type
-        data_type = payload.get("type")
-        
-        if data_type == "support":
+        payload = decode_web_app_data(update.message.web_app_data.data)
+    except UnknownPayloadType as e:
+        logger.warning("Unknown type in WebApp data for user_id=%s: %s", user_id, e, extra={"event": "unknown_web_app_type"})
+        lang = _language(await redis_client.hget(f"user:{user_id}", "language"), update)
+        await deliver(context.bot, "send_message", {"chat_id": user_id, "text": translations['unknown_type'][lang]})
+        return
+    except PayloadError as e:
+        logger.warning("Invalid Web App data format for user_id=%s: %s", user_id, e, extra={"event": "invalid_web_app_data"})
+        lang = _language(await redis_client.hget(f"user:{user_id}", "language"), update)
+        await deliver(context.bot, "send_message", {"chat_id": user_id, "text": translations['invalid_data'][lang]})
+        return
+
+    # Один HGETALL на апдейт: язык, статус и подписка берутся из контекста
+    user = await UserContext.load(user_id)
+    lang = _language(user.get("language"), update)
+    logger.info("Selected language for user_id=%s: %s", user_id, lang, extra={"event": "language_selected"})
+    try:
+        logger.debug("📩 Received Web App data for user_id=%s: %s", user_id, payload)
+
+        if isinstance(payload, SupportPayload):
             # Handle support message
-            message = (payload.get("message") or "").strip()
+            message = payload.message
             if not message:
                 error_text = translations['support_empty'][lang]
-                async def send_error():
-                    return await context.bot.send_message(chat_id=user_id, text=error_text)
-                await retry_on_timeout(send_error, chat_id=user_id, message_text=error_text)
+                await deliver(context.bot, "send_message", {"chat_id": user_id, "text": error_text})
                 return
 
             try:
@@ -96,72 +110,44 @@ async def webhook_update(update: Update, context: ContextTypes.DEFAULT_TYPE):
                     f"ID пользователя: {user_id}\n\n"
                     f"{message}"
                 )
-                await context.bot.send_message(SUPPORT_CHAT_ID, forward_text)
+                await deliver(context.bot, "send_message", {"chat_id": SUPPORT_CHAT_ID, "text": forward_text})
 
                 # Confirm to user
                 response_text = translations['support_sent'][lang]
-                async def send_confirmation():
-                    return await context.bot.send_message(chat_id=user_id, text=response_text)
-                await retry_on_timeout(send_confirmation, chat_id=user_id, message_text=response_text)
+                await deliver(context.bot, "send_message", {"chat_id": user_id, "text": response_text})
             except Exception as e:
-                logger.exception(f"Ошибка при пересылке сообщения поддержки для user_id={user_id}")
+                logger.exception("Ошибка при пересылке сообщения поддержки для user_id=%s", user_id)
                 error_text = translations['processing_error'][lang]
-                async def send_error():
-                    return await context.bot.send_message(chat_id=user_id, text=error_text)
-                await retry_on_timeout(send_error, chat_id=user_id, message_text=error_text)
-        
-        elif data_type == "settings":
-            # Handle settings update (original logic)
-            logger.info(f"Payload city: {payload.get('city')}")
-
-            # Проверяем наличие необходимых полей
-            required_keys = {"city", "deal_type", "price_from", "price_to", "floor_from", "floor_to", "rooms_from", "rooms_to", "bedrooms_from", "bedrooms_to", "own_ads"}
-            if not required_keys.issubset(payload.keys()):
-                logger.warning(f"Invalid Web App data format for user_id={user_id}: {payload}")
+                await deliver(context.bot, "send_message", {"chat_id": user_id, "text": error_text})
+
+        else:
+            # Handle settings update: поля уже проверены и приведены к строкам формата settings
+            settings = payload.settings()
+            try:
+                fields = await storage_fields(settings)
+            except RegistryFull as e:
+                logger.warning("Rejected districts for user_id=%s: %s", user_id, e, extra={"event": "invalid_web_app_data"})
                 error_text = translations['invalid_data'][lang]
-                async def send_error():
-                    return await context.bot.send_message(chat_id=user_id, text=error_text)
-                await retry_on_timeout(send_error, chat_id=user_id, message_text=error_text)
+                await deliver(context.bot, "send_message", {"chat_id": user_id, "text": error_text})
                 return
-
-            # Формируем настройки
-            settings = {
-                "city": payload["city"],
-                "districts": payload.get("districts", {}),
-                "deal_type": payload["deal_type"],
-                "price_from": str(payload["price_from"]),
-                "price_to": str(payload["price_to"]),
-                "floor_from": str(payload["floor_from"]),
-                "floor_to": str(payload["floor_to"]),
-                "rooms_from": str(payload["rooms_from"]),
-                "rooms_to": str(payload["rooms_to"]),
-                "bedrooms_from": str(payload["bedrooms_from"]),
-                "bedrooms_to": str(payload["bedrooms_to"]),
-                "own_ads": str(payload["own_ads"])
-            }
-            # Сохраняем настройки и язык в user:<user_id>
-            user_data = {
-                "settings": orjson.dumps(settings),
+            # Сохраняем настройки (компактный filter, см. monitoring.filter_codec) и язык в user:<user_id>
+            # (TTL и subscribed_users — в том же скрипте)
+            state = await transition(user_id, "settings", {
+                **fields,
                 "filters_timestamp": str(int(time.time())),
-                "language": payload.get("language", "ru")  # Save language from payload
-            }
-            save_user_data(user_id, user_data)
-            redis_client.expire(f"user:{user_id}", INACTIVITY_TTL)  # Ensure TTL is set
-
-            user_data = redis_client.hgetall(f"user:{user_id}")
-            if user_data.get("bot_status", "stopped") == "running":
-                redis_client.sadd("subscribed_users", user_id)
-                logger.info(f"✅ Added user_id={user_id} to subscribed_users")
-            logger.info(f"✅ Saved settings for user_id={user_id}: {settings}")
-            logger.info(f"📋 Current subscribed_users: {redis_client.smembers('subscribed_users')}")
-            
-            # Проверяем подписку и статус бота
-            subscription_end = user_data.get("subscription_end", "0")
-            bot_status = user_data.get("bot_status", "stopped")
-            logger.info(f"Webhook update for user_id={user_id}: subscription_end={subscription_end}, bot_status={bot_status}")
-
-            # Force cache refresh
-            await context.application.subscription_manager.refresh_subscriptions()
+                "language": payload.language  # Save language from payload
+            }, user=user)
+            # Одна структурированная запись вместо дампа настроек; полные настройки — только на уровне DEBUG,
+            # размер subscribed_users — gauge в /metrics
+            subscribed = state["bot_status"] == "running" and state["subscription_end"] > int(time.time())
+            logger.info("✅ Saved settings for user_id=%s: city=%s, deal_type=%s, subscribed=%s",
+                        user_id, settings["city"], settings["deal_type"], subscribed,
+                        extra={"event": "settings_saved", "chat_id": user_id, "subscribed": subscribed,
+                               "subscription_end": state["subscription_end"], "bot_status": state["bot_status"]})
+            logger.debug("📋 Settings for user_id=%s: %s", user_id, settings)
+
+            # Обновляем кэш только для этого пользователя — в фоне, ответ не ждёт перечитывания
+            context.application.subscription_manager.refresh_subscriptions(chat_ids=[user_id])
 
             # Формируем ответ
             city_map = {"1": "Тбилиси", "2": "Батуми", "3": "Кутаиси"}
@@ -184,20 +170,9 @@ async def webhook_update(update: Update, context: ContextTypes.DEFAULT_TYPE):
             bedrooms_to = settings.get("bedrooms_to") or ("Не указано" if lang == "ru" else "Not specified"),
             own_ads = ("Да" if settings.get("own_ads") == "1" else "Нет") if lang == "ru" else ("Yes" if settings.get("own_ads") == "1" else "No")
             )
-            async def send_confirmation():
-                return await context.bot.send_message(chat_id=user_id, text=response_text)
-            await retry_on_timeout(send_confirmation, chat_id=user_id, message_text=response_text)
-
-        else:
-            logger.warning(f"Unknown type in WebApp data for user_id={user_id}: {data_type}")
-            error_text = translations['unknown_type'][lang]
-            async def send_error():
-                return await context.bot.send_message(chat_id=user_id, text=error_text)
-            await retry_on_timeout(send_error, chat_id=user_id, message_text=error_text)
+            await deliver(context.bot, "send_message", {"chat_id": user_id, "text": response_text})
 
     except Exception as e:
-        logger.error(f"❌ Error processing Web App data for user_id={user_id}: {e}", exc_info=True)
+        logger.error("❌ Error processing Web App data for user_id=%s: %s", user_id, e, exc_info=True)
         error_text = translations['processing_error'][lang]
-        async def send_error():
-            return await send_status_message(user_id, context, error_text)
-        await retry_on_timeout(send_error, chat_id=user_id, message_text=error_text)
+        await send_status_message(user, context, error_text, lang)
@@ -0,0 +1,101 @@
+# benchmarks/_redis.py
+import os
+import socket
+import threading
+
+
+def redis_url() -> str:
+    """BENCH_REDIS_URL, если задан, иначе поднимает fakeredis TCP-сервер в фоне."""
+    url = os.getenv("BENCH_REDIS_URL")
+    if url:
+        return url
+    from fakeredis import TcpFakeServer  # только для бенчмарков, не в requirements
+    from fakeredis._clients._tcp_server import TCPFakeRequestHandler
+    from redis.exceptions import ResponseError
+
+    class RequestHandler(TCPFakeRequestHandler):
+        # fakeredis рвёт соединение после любой ошибки (например NOSCRIPT перед SCRIPT LOAD),
+        # настоящий Redis просто отвечает ошибкой и продолжает
+        def setup(self):
+            super().setup()
+            read_response = self.current_client.read_response
+
+            def safe_read_response():
+                try:
+                    return read_response()
+                except ResponseError as e:
+                    return e
+
+            self.current_client.read_response = safe_read_response
+
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    server = TcpFakeServer(("127.0.0.1", port), server_type="redis")
+    server.RequestHandlerClass = RequestHandler
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"redis://127.0.0.1:{port}/0"
+
+
+def redis_url_process() -> str:
+    """
+    Как redis_url(), но fakeredis — в отдельном процессе: его аллокации и GIL
+    не смешиваются с измерениями клиента (tracemalloc, время).
+    """
+    url = os.getenv("BENCH_REDIS_URL")
+    if url:
+        return url
+    import atexit
+    import subprocess
+    import sys
+
+    code = "import threading; from benchmarks._redis import redis_url; print(redis_url(), flush=True); threading.Event().wait()"
+    proc = subprocess.Popen([sys.executable, "-c", code], stdout=subprocess.PIPE, text=True)
+    atexit.register(proc.terminate)
+    return proc.stdout.readline().strip()
+
+
+def with_latency(url: str, latency_ms: float) -> str:
+    """
+    Поднимает TCP-прокси, добавляющий latency_ms к каждому ответу Redis
+    (имитация сетевого RTT до облачного Redis). Возвращает URL прокси.
+    """
+    if latency_ms <= 0:
+        return url
+    import asyncio
+    from urllib.parse import urlparse
+
+    target = urlparse(url)
+    delay = latency_ms / 1000
+    ready = threading.Event()
+    bound = {}
+
+    async def pipe(reader, writer, delayed):
+        try:
+            while data := await reader.read(65536):
+                if delayed:
+                    await asyncio.sleep(delay)
+                writer.write(data)
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def handle(client_reader, client_writer):
+        server_reader, server_writer = await asyncio.open_connection(target.hostname, target.port)
+        await asyncio.gather(
+            pipe(client_reader, server_writer, False),
+            pipe(server_reader, client_writer, True),
+        )
+
+    async def serve():
+        server = await asyncio.start_server(handle, "127.0.0.1", 0)
+        bound["port"] = server.sockets[0].getsockname()[1]
+        ready.set()
+        await server.serve_forever()
+
+    threading.Thread(target=asyncio.run, args=(serve(),), daemon=True).start()
+    ready.wait()
+    return f"redis://127.0.0.1:{bound['port']}{target.path or '/0'}"
@@ -0,0 +1,48 @@
+# benchmarks/_synthetic.py
+"""Синтетические settings подписчиков и объявления в формате WebApp / monitoring.filters."""
+import random
+
+CITIES = ("1", "2", "3")
+CITY_WEIGHTS = (0.7, 0.2, 0.1)
+DEAL_TYPES = ("1", "2")
+DISTRICTS_PER_CITY = 30
+PRICE_RANGE = {"1": (30_000, 500_000), "2": (300, 3_000)}  # продажа / аренда, $
+
+
+def _district_ids(city: str) -> list:
+    return [f"{city}{i:02d}" for i in range(DISTRICTS_PER_CITY)]
+
+
+def _range(rng: random.Random, low: int, high: int, open_share: float = 0.3):
+    start = rng.randint(low, high)
+    end = rng.randint(start, high)
+    return ("" if rng.random() < open_share else str(start)), ("" if rng.random() < open_share else str(end))
+
+
+def make_settings(rng: random.Random) -> dict:
+    city = rng.choices(CITIES, CITY_WEIGHTS)[0]
+    deal_type = rng.choice(DEAL_TYPES)
+    districts = {} if rng.random() < 0.3 else {d: f"District {d}" for d in rng.sample(_district_ids(city), rng.randint(1, 3))}
+    price_from, price_to = _range(rng, *PRICE_RANGE[deal_type])
+    floor_from, floor_to = _range(rng, 1, 25, 0.6)
+    rooms_from, rooms_to = _range(rng, 1, 6, 0.5)
+    bedrooms_from, bedrooms_to = _range(rng, 1, 4, 0.6)
+    return {
+        "city": city, "districts": districts, "deal_type": deal_type,
+        "price_from": price_from, "price_to": price_to,
+        "floor_from": floor_from, "floor_to": floor_to,
+        "rooms_from": rooms_from, "rooms_to": rooms_to,
+        "bedrooms_from": bedrooms_from, "bedrooms_to": bedrooms_to,
+        "own_ads": "1" if rng.random() < 0.2 else "0",
+    }
+
+
+def make_listing(rng: random.Random, listing_id: int) -> dict:
+    city = rng.choices(CITIES, CITY_WEIGHTS)[0]
+    deal_type = rng.choice(DEAL_TYPES)
+    rooms = rng.randint(1, 6)
+    return {
+        "id": listing_id, "city": city, "district": rng.choice(_district_ids(city)), "deal_type": deal_type,
+        "price": rng.randint(*PRICE_RANGE[deal_type]), "floor": rng.randint(1, 25),
+        "rooms": rooms, "bedrooms": max(1, rooms - 1), "owner": rng.random() < 0.4,
+    }
@@ -0,0 +1,87 @@
+# benchmarks/batch_matcher.py
+"""
+Пакетное сопоставление страницы объявлений (FilterColumns, NumPy) против
+попарных Python-сравнений matches() на тех же фильтрах.
+
+Цикл опроса — это правки подписчиков за цикл (--changes) плюс сопоставление
+страницы. "rebuild cycle" — как раньше: любая правка сбрасывает колонки и
+цикл платит полную пересборку; "patch cycle" — правки пишутся в строки
+(upsert/remove), пересборка происходит по needs_rebuild и тоже входит в цифру
+(среднее по --cycles циклам).
+
+    python -m benchmarks.batch_matcher --sizes 10000 100000 --page 50 --changes 20
+"""
+import argparse
+import random
+import time
+
+from benchmarks._synthetic import make_listing, make_settings
+from monitoring.batch_matcher import FilterColumns
+from monitoring.filters import matches, parse_filter
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--page", type=int, default=50, help="объявлений за цикл опроса")
+    parser.add_argument("--changes", type=int, default=20, help="изменённых подписчиков за цикл")
+    parser.add_argument("--cycles", type=int, default=50)
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    listings = [make_listing(rng, i) for i in range(args.page)]
+    print(f"{'subscribers':>11} {'columns s':>9} {'per-pair ms':>12} {'batch ms':>9} {'speedup':>8} {'matches':>8}"
+          f" {'rebuild cycle ms':>17} {'patch cycle ms':>15}")
+    for size in args.sizes:
+        filters = [(chat_id, parse_filter(make_settings(rng))) for chat_id in range(size)]
+
+        started = time.perf_counter()
+        columns = FilterColumns(filters)
+        build = time.perf_counter() - started
+
+        started = time.perf_counter()
+        expected = {(i, chat_id) for i, listing in enumerate(listings) for chat_id, flt in filters if matches(flt, listing)}
+        per_pair = time.perf_counter() - started
+
+        started = time.perf_counter()
+        listing_rows, chat_ids = columns.match_batch(listings)
+        batch = time.perf_counter() - started
+
+        assert set(zip(listing_rows.tolist(), chat_ids.tolist())) == expected, "пакетный результат расходится с попарным"
+        rebuild_cycle = build + batch  # старое поведение: каждая правка — полная пересборка
+        patch_cycle = _patch_cycles(rng, dict(filters), columns, listings, args.changes, args.cycles)
+        print(f"{size:>11,} {build:>9.2f} {per_pair * 1e3:>12,.1f} {batch * 1e3:>9,.1f} {per_pair / batch:>7.0f}x {len(expected):>8,}"
+              f" {rebuild_cycle * 1e3:>17,.1f} {patch_cycle * 1e3:>15,.1f}")
+
+
+def _patch_cycles(rng, filters: dict, columns, listings, changes: int, cycles: int) -> float:
+    """Средняя цена цикла с правкой строк, включая пересборки по needs_rebuild."""
+    next_id = len(filters)
+    started = time.perf_counter()
+    for _ in range(cycles):
+        for _ in range(changes):
+            roll = rng.random()
+            if roll < 0.1:  # отписка
+                chat_id = rng.randrange(next_id)
+                filters.pop(chat_id, None)
+                columns.remove(chat_id)
+                continue
+            if roll < 0.2:  # новый подписчик
+                chat_id, next_id = next_id, next_id + 1
+            else:  # изменённый фильтр
+                chat_id = rng.randrange(next_id)
+            filters[chat_id] = parse_filter(make_settings(rng))
+            columns.upsert(chat_id, filters[chat_id])
+        if columns.needs_rebuild:
+            columns = FilterColumns(filters.items())
+        columns.match_batch(listings)
+    elapsed = (time.perf_counter() - started) / cycles
+
+    listing_rows, chat_ids = columns.match_batch(listings)
+    expected = {(i, chat_id) for i, listing in enumerate(listings) for chat_id, flt in filters.items() if matches(flt, listing)}
+    assert set(zip(listing_rows.tolist(), chat_ids.tolist())) == expected, "правленые колонки расходятся с попарным"
+    return elapsed
+
+
+if __name__ == "__main__":
+    main()
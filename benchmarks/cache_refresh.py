@@ -0,0 +1,108 @@
+# benchmarks/cache_refresh.py
+"""
+Обновление кэша подписчиков после пачки одновременных изменений (одновременный
+Start у --changes пользователей): прежний путь — handler ждёт refresh_chat, и
+listener канала перечитывает того же пользователя ещё раз — против очереди
+refresh_subscriptions (запросы handlers и канала сливаются в одно
+перечитывание). Redis — BENCH_REDIS_URL или fakeredis в отдельном процессе,
+--latency-ms добавляет RTT через прокси.
+
+    python -m benchmarks.cache_refresh --subscribers 5000 --changes 200 --latency-ms 1
+"""
+import argparse
+import asyncio
+import os
+import random
+import time
+
+import orjson
+
+from benchmarks._redis import redis_url_process, with_latency
+from benchmarks._synthetic import make_settings
+
+os.environ.setdefault("TELEGRAM_TOKEN", "0:bench")
+os.environ["REDIS_URL"] = redis_url_process()
+
+
+def pipelines_and_reads(metrics) -> tuple[int, int]:
+    """Пока только чтения кэша идут через pipeline: (pipeline'ов, HMGET)."""
+    pipelines = metrics.REDIS_ROUNDTRIP_SECONDS.series.get("PIPELINE")
+    hmget = metrics.REDIS_COMMANDS.series.get("HMGET")
+    return sum(pipelines.counts) if pipelines is not None else 0, hmget.value if hmget is not None else 0
+
+
+async def seed(redis_client, subscribers: int):
+    rng = random.Random(5)
+    end = str(int(time.time()) + 86400)
+    for start in range(0, subscribers, 1000):
+        pipe = redis_client.pipeline(transaction=False)
+        for chat_id in range(start, min(start + 1000, subscribers)):
+            pipe.hset(f"user:{chat_id}", mapping={"bot_status": "running", "subscription_end": end, "language": "ru",
+                                                  "settings": orjson.dumps(make_settings(rng)).decode()})
+            pipe.sadd("subscribed_users", chat_id)
+        await pipe.execute()
+
+
+async def burst(label: str, manager, redis_client, metrics, chat_ids: list, press):
+    """Все chat_id меняют статус одновременно; press(chat_id) — что делает handler после изменения."""
+    for chat_id in chat_ids:
+        manager.subscribers.pop(chat_id, None)
+    before = pipelines_and_reads(metrics)
+    replies = []
+
+    async def handler(chat_id: int):
+        started = time.perf_counter()
+        await redis_client.hset(f"user:{chat_id}", "language", "en")  # изменение, как transition()
+        await press(chat_id)
+        replies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(handler(chat_id) for chat_id in chat_ids))
+    while any(manager.subscribers.get(chat_id, {}).get("language") != "en" for chat_id in chat_ids):
+        await asyncio.sleep(0.001)
+    consistent = time.perf_counter() - started
+    await asyncio.sleep(0.2)  # дождаться хвоста (второе чтение из канала в прежнем пути)
+    after = pipelines_and_reads(metrics)
+    replies.sort()
+    print(f"{label:<28} reply p50 {replies[len(replies) // 2] * 1e3:6.2f} ms  p99 {replies[int(len(replies) * 0.99)] * 1e3:6.2f} ms  "
+          f"cache consistent {consistent * 1e3:7.1f} ms  pipelines {after[0] - before[0]:5,}  HMGET {after[1] - before[1]:5,}")
+    for chat_id in chat_ids:
+        await redis_client.hset(f"user:{chat_id}", "language", "ru")
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--subscribers", type=int, default=5000)
+    parser.add_argument("--changes", type=int, default=200)
+    parser.add_argument("--latency-ms", type=float, default=1.0)
+    args = parser.parse_args()
+    os.environ["REDIS_URL"] = with_latency(os.environ["REDIS_URL"], args.latency_ms)
+
+    from monitoring.subscription_manager import REFRESH_BATCH, REFRESH_REQUESTS, SubscriptionManager
+    from utils import metrics
+    from utils.logger import logger
+    from utils.redis_client import redis_client
+    logger.setLevel("WARNING")
+
+    await seed(redis_client, args.subscribers)
+    manager = SubscriptionManager()
+    await manager.load_all()
+    chat_ids = random.Random(9).sample(range(args.subscribers), args.changes)
+    print(f"{args.subscribers:,} subscribers, {args.changes} simultaneous changes, +{args.latency_ms} ms RTT\n")
+
+    async def legacy(chat_id: int):
+        await manager.refresh_chat(chat_id)  # handler ждёт перечитывания
+        asyncio.create_task(manager.refresh_chat(chat_id))  # сообщение из канала изменений
+
+    async def queued(chat_id: int):
+        manager.refresh_subscriptions(chat_ids=[chat_id])  # handler
+        manager.refresh_subscriptions((str(chat_id),))  # сообщение из канала изменений
+
+    for _ in range(2):  # прогрев, затем замер
+        await burst("await refresh_chat + channel", manager, redis_client, metrics, chat_ids, legacy)
+        await burst("refresh_subscriptions queue", manager, redis_client, metrics, chat_ids, queued)
+    print(f"\nrefresh_subscriptions: {REFRESH_REQUESTS.value:,} requests -> {sum(REFRESH_BATCH.counts):,} refreshes")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,195 @@
+# benchmarks/cold_start.py
+"""
+Холодный старт: время импорта api.webhook в чистом интерпретаторе и время от запуска
+uvicorn до первого ответа 200 на /telegram-webhook. Telegram подменяется локальной
+заглушкой Bot API (с задержкой --api-latency-ms), Redis — BENCH_REDIS_URL или fakeredis
+в отдельном процессе.
+
+Для каждого --users Redis заполняется подписчиками (доля --legacy-share ещё в JSON
+settings — их переведёт migrate_legacy, индекса истечений нет — его заполнит backfill).
+Первый запуск идёт без данных бота (getMe) и делает всю работу старта; для него кроме
+первого ответа меряется, когда кэш подписчиков загружен (gauge в /metrics) и когда
+backfill закончен. Следующие запуски — с закэшированными данными бота.
+
+    python -m benchmarks.cold_start --api-latency-ms 150 --users 0 10000 100000
+"""
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import redis
+
+from benchmarks._redis import redis_url_process
+from benchmarks._synthetic import make_settings
+
+TOKEN = "123456:bench"
+BOT_USER = {"id": 123456, "is_bot": True, "first_name": "Bench", "username": "bench_bot"}
+BACKFILL_FLAG = "subscription_expiry:backfilled"  # monitoring.expiry_sweeper: модули бота здесь не импортируем
+SEED_BATCH = 5000
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_fake_api(latency: float) -> tuple[str, dict]:
+    calls = {}
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("Content-Length") or 0))
+            method = self.path.rsplit("/", 1)[-1]
+            calls[method] = calls.get(method, 0) + 1
+            time.sleep(latency)
+            result = BOT_USER if method == "getMe" else True
+            body = json.dumps({"ok": True, "result": result}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_address[1]}/bot", calls
+
+
+def import_time(env: dict) -> float:
+    code = "import time; t = time.perf_counter(); import api.webhook; print(time.perf_counter() - t)"
+    out = subprocess.run([sys.executable, "-c", code], env=env, check=True, capture_output=True, text=True)
+    return float(out.stdout.strip().splitlines()[-1])
+
+
+def seed(url: str, users: int, legacy_share: float):
+    import random
+
+    os.environ.setdefault("TELEGRAM_TOKEN", TOKEN)  # config читает окружение при импорте кодека
+    os.environ.setdefault("REDIS_URL", url)
+    from monitoring.filter_codec import encode_filter
+    from monitoring.filters import parse_filter
+
+    rng = random.Random(users)
+    client = redis.Redis.from_url(url)
+    client.flushdb()
+    for start in range(0, users, SEED_BATCH):
+        pipe = client.pipeline(transaction=False)
+        chat_ids = range(start, min(users, start + SEED_BATCH))
+        for chat_id in chat_ids:
+            fields = {"bot_status": "running", "subscription_end": "4000000000", "language": "ru"}
+            settings = make_settings(rng)
+            if rng.random() < legacy_share:
+                fields["settings"] = json.dumps(settings)
+            else:
+                # Без районов: реестр районов в пустом Redis не заполнен
+                fields["filter"] = encode_filter(parse_filter({**settings, "districts": {}}), 0)
+            pipe.hset(f"user:{chat_id}", mapping=fields)
+        pipe.sadd("subscribed_users", *chat_ids)
+        pipe.execute()
+    return client
+
+
+def _cache_size(port: int) -> int | None:
+    with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics", timeout=30) as response:
+        for line in response.read().decode().splitlines():
+            if line.startswith("subscription_cache_subscribers "):
+                return int(float(line.split()[1]))
+    return None
+
+
+def time_to_first_response(env: dict, update_id: int, users: int = 0, client=None) -> tuple[float, float, float]:
+    """(первый ответ, кэш подписчиков загружен, backfill закончен) в секундах от запуска uvicorn."""
+    port = free_port()
+    update = {
+        "update_id": update_id,
+        "message": {
+            "message_id": 1,
+            "date": int(time.time()),
+            "chat": {"id": 1001, "type": "private"},
+            "from": {"id": 1001, "is_bot": False, "first_name": "U", "language_code": "ru"},
+            "text": "hello",
+        },
+    }
+    request = urllib.request.Request(
+        f"http://127.0.0.1:{port}/telegram-webhook",
+        data=json.dumps(update).encode(),
+        headers={"Content-Type": "application/json"},
+    )
+    started = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "api.webhook:app", "--port", str(port), "--log-level", "warning"],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        while True:
+            try:
+                with urllib.request.urlopen(request, timeout=30) as response:
+                    if response.status == 200:
+                        first = time.perf_counter() - started
+                        break
+            except urllib.error.HTTPError:
+                raise
+            except (urllib.error.URLError, ConnectionError):
+                if proc.poll() is not None:
+                    raise RuntimeError("uvicorn exited before the first response")
+                time.sleep(0.005)
+        loaded = backfilled = first
+        if client is not None:
+            while _cache_size(port) != users:
+                time.sleep(0.01)
+            loaded = time.perf_counter() - started
+            while not client.exists(BACKFILL_FLAG):
+                time.sleep(0.01)
+            backfilled = time.perf_counter() - started
+        return first, loaded, backfilled
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--api-latency-ms", type=float, default=150, help="имитация RTT до api.telegram.org")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--users", type=int, nargs="+", default=[0, 10_000, 100_000], help="подписчиков в Redis")
+    parser.add_argument("--legacy-share", type=float, default=0.1, help="доля подписчиков без компактного filter")
+    args = parser.parse_args()
+
+    url = redis_url_process()
+    api_url, calls = start_fake_api(args.api_latency_ms / 1000)
+    env = {**os.environ, "TELEGRAM_TOKEN": TOKEN, "REDIS_URL": url, "TELEGRAM_API_URL": api_url}
+
+    imports = sorted(import_time(env) for _ in range(args.runs))
+    print(f"import api.webhook:      {imports[len(imports) // 2] * 1000:.0f}ms (median of {args.runs})")
+    update_id = 0
+    for users in args.users:
+        client = seed(url, users, args.legacy_share)
+        get_me = calls.get("getMe", 0)
+        update_id += 1
+        cold, loaded, backfilled = time_to_first_response(env, update_id, users, client if users else None)
+        print(f"{users:>7,} users, no cache: first response {cold * 1000:.0f}ms, cache loaded {loaded * 1000:.0f}ms, "
+              f"backfilled {backfilled * 1000:.0f}ms (getMe calls: {calls.get('getMe', 0) - get_me})")
+        get_me = calls.get("getMe", 0)
+        warm = []
+        for _ in range(args.runs):
+            update_id += 1
+            warm.append(time_to_first_response(env, update_id)[0])
+        warm.sort()
+        print(f"{users:>7,} users, cached:   first response {warm[len(warm) // 2] * 1000:.0f}ms "
+              f"(getMe calls: {calls.get('getMe', 0) - get_me})")
+
+
+if __name__ == "__main__":
+    main()
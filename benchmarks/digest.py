@@ -0,0 +1,76 @@
+# benchmarks/digest.py
+"""
+Всплеск совпадений через ListingNotifier: каждое объявление отдельным сообщением
+(--max-delay 0) против дайджеста. Bot API — заглушка с задержкой --api-latency-ms,
+лимиты — настоящий rate_limiter (1 msg/s на чат, 30 msg/s всего), Redis для
+SeenListings — BENCH_REDIS_URL или fakeredis. Печатает вызовы Bot API на
+доставленное объявление и время до доставки всего всплеска.
+
+    python -m benchmarks.digest --chats 20 --per-chat 5 --max-delay 0.5
+"""
+import argparse
+import asyncio
+import os
+import time
+
+import numpy as np
+
+from benchmarks._redis import redis_url
+
+os.environ.setdefault("TELEGRAM_TOKEN", "0:bench")
+os.environ["REDIS_URL"] = redis_url()
+os.environ["OUTBOUND_QUEUE"] = "0"  # считаем вызовы Bot API, а не записи в очереди
+
+from monitoring.notifier import ListingNotifier  # noqa: E402
+
+
+class FakeBot:
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.calls = 0
+
+    async def send_message(self, **params):
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+
+
+class Manager:
+    def __init__(self, chats: int):
+        self.subscribers = {chat_id: {"language": "ru"} for chat_id in range(1, chats + 1)}
+
+
+async def run(name: str, chats: int, per_chat: int, max_delay: float, max_items: int, latency: float, offset: int):
+    bot = FakeBot(latency)
+    notifier = ListingNotifier(bot, Manager(chats), max_delay=max_delay, max_items=max_items)
+    listings = [{"id": str(offset + i), "title": f"Listing {i}", "price": 100_000.0 + i, "url": f"https://example.com/{i}"}
+                for i in range(per_chat)]
+    # Каждое объявление страницы совпало со всеми чатами
+    rows = np.repeat(np.arange(per_chat), chats)
+    chat_ids = np.tile(np.arange(1, chats + 1), per_chat)
+    started = time.perf_counter()
+    accepted = await notifier(listings, rows, chat_ids)
+    await asyncio.sleep(0)
+    while notifier._pending or notifier._sending:
+        await asyncio.sleep(0.01)
+    elapsed = time.perf_counter() - started
+    print(f"{name:<22} delivered {accepted:5}  API calls {bot.calls:5}  calls/listing {bot.calls / accepted:.2f}  "
+          f"all delivered in {elapsed:.2f}s")
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chats", type=int, default=20)
+    parser.add_argument("--per-chat", type=int, default=5, help="совпадений на чат во всплеске")
+    parser.add_argument("--max-delay", type=float, default=0.5)
+    parser.add_argument("--max-items", type=int, default=10)
+    parser.add_argument("--api-latency-ms", type=float, default=30)
+    args = parser.parse_args()
+
+    latency = args.api_latency_ms / 1000
+    await run("per listing", args.chats, args.per_chat, 0, args.max_items, latency, 0)
+    await run(f"digest {args.max_delay}s/{args.max_items}", args.chats, args.per_chat, args.max_delay, args.max_items,
+              latency, 1_000_000)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
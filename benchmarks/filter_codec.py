@@ -0,0 +1,93 @@
+# benchmarks/filter_codec.py
+"""
+Версия 0 (JSON settings в хэше + dict-записи в кэше) против текущей
+(компактный filter + SubscriberFilter): байты в Redis, память кэша и время
+разбора при полной загрузке подписчиков. Проверяет, что encode -> decode
+возвращает тот же фильтр.
+
+    python -m benchmarks.filter_codec --size 100000
+"""
+import argparse
+import os
+import random
+import time
+import tracemalloc
+
+os.environ.setdefault("TELEGRAM_TOKEN", "0:bench")
+os.environ.setdefault("REDIS_URL", "redis://127.0.0.1:6379/0")  # соединение не открывается
+
+import orjson  # noqa: E402
+
+from benchmarks._synthetic import make_settings  # noqa: E402
+from monitoring.filter_codec import FILTER_VERSION, DistrictRegistry, decode_filter, encode_filter  # noqa: E402
+from monitoring.filters import INF, RANGE_FIELDS, _bound, parse_filter  # noqa: E402
+
+
+def legacy_record(settings_json: bytes) -> dict:
+    """Запись кэша и фильтр в том виде, в каком они были в версии 0."""
+    settings = orjson.loads(settings_json)
+    return {
+        "settings": settings,
+        "filter": {
+            "city": str(settings.get("city") or ""),
+            "deal_type": str(settings.get("deal_type") or ""),
+            "districts": frozenset(str(d) for d in (settings.get("districts") or {})),
+            "ranges": tuple(
+                (_bound(settings.get(f"{field}_from"), -INF), _bound(settings.get(f"{field}_to"), INF))
+                for field in RANGE_FIELDS
+            ),
+            "own_ads": str(settings.get("own_ads")) == "1",
+        },
+        "language": "ru",
+        "subscription_end": 1900000000,
+    }
+
+
+def compact_record(encoded: str, registry: DistrictRegistry) -> dict:
+    return {"filter": decode_filter(encoded, registry), "language": "ru", "subscription_end": 1900000000}
+
+
+def measure(build, values: list) -> tuple[float, int]:
+    started = time.perf_counter()
+    records = [build(value) for value in values]
+    elapsed = time.perf_counter() - started
+    del records
+    tracemalloc.start()
+    records = [build(value) for value in values]
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del records
+    return elapsed, size
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=int, default=100_000)
+    args = parser.parse_args()
+
+    rng = random.Random(3)
+    settings = [make_settings(rng) for _ in range(args.size)]
+    registry = DistrictRegistry()
+    districts = sorted({district for s in settings for district in s["districts"]})
+    registry.apply({district: bit for bit, district in enumerate(districts)})
+
+    legacy_values = [orjson.dumps(s) for s in settings]
+    compact_values = []
+    for s in settings:
+        flt = parse_filter(s)
+        encoded = encode_filter(flt, registry.mask(flt.districts))
+        assert decode_filter(encoded, registry) == flt, "encode -> decode изменил фильтр"
+        compact_values.append(encoded)
+
+    legacy_time, legacy_mem = measure(legacy_record, legacy_values)
+    compact_time, compact_mem = measure(lambda value: compact_record(value, registry), compact_values)
+
+    n = args.size
+    print(f"subscribers:      {n:,}")
+    print(f"redis bytes/user: v0 {sum(map(len, legacy_values)) / n:,.0f}  v{FILTER_VERSION} {sum(map(len, compact_values)) / n:,.0f}")
+    print(f"cache bytes/user: v0 {legacy_mem / n:,.0f}  v{FILTER_VERSION} {compact_mem / n:,.0f}  (x{legacy_mem / compact_mem:.1f})")
+    print(f"parse µs/user:    v0 {legacy_time / n * 1e6:,.2f}  v{FILTER_VERSION} {compact_time / n * 1e6:,.2f}  (x{legacy_time / compact_time:.1f})")
+
+
+if __name__ == "__main__":
+    main()
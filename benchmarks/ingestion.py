@@ -0,0 +1,156 @@
+# benchmarks/ingestion.py
+"""
+ListingPoller против локальной заглушки источника, которая отдаёт записанные
+страницы по протоколу monitoring.ingestion (after/limit/cursor) с задержкой
+--latency-ms. Записи — JSON {"<city>:<deal_type>": [объявление, ...]} из
+--record или синтетические (--save сохраняет их для повторных прогонов).
+
+Сценарий: первый цикл только запоминает курсоры, затем в ленты "публикуется"
+--new объявлений и идёт цикл за ними, затем холостой цикл. Печатает запросы,
+TCP-соединения (keep-alive пул), объявления и совпадения на каждый цикл.
+
+    python -m benchmarks.ingestion --subscribers 5000 --new 2000 --latency-ms 20
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from benchmarks._redis import redis_url
+from benchmarks._synthetic import make_listing, make_settings
+
+os.environ.setdefault("TELEGRAM_TOKEN", "0:bench")
+os.environ["REDIS_URL"] = redis_url()
+
+from monitoring.filters import parse_filter  # noqa: E402
+from monitoring.ingestion import ListingPoller  # noqa: E402
+from monitoring.subscription_manager import SubscriptionManager  # noqa: E402
+
+
+class StubSource:
+    """Записанные ленты; видны первые visible[feed] объявлений каждой."""
+
+    def __init__(self, record: dict, latency: float):
+        self.record = record
+        self.visible = {feed: 0 for feed in record}
+        self.latency = latency
+        self.requests = 0
+        self.connections = 0
+        self.items = 0
+
+    def page(self, query: dict) -> dict:
+        feed = f"{query['city'][0]}:{query['deal_type'][0]}"
+        listings = self.record.get(feed, [])[:self.visible.get(feed, 0)]
+        limit = int(query["limit"][0])
+        if "after" in query:
+            after = int(query["after"][0])
+            items = [listing for listing in listings if listing["id"] > after][:limit]
+        else:
+            items = listings[-limit:]
+        self.items += len(items)
+        return {"items": items, "cursor": str(items[-1]["id"]) if items else query.get("after", [None])[0]}
+
+    def serve(self) -> str:
+        source = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive
+
+            def setup(self):
+                source.connections += 1
+                super().setup()
+
+            def do_GET(self):
+                source.requests += 1
+                time.sleep(source.latency)
+                body = json.dumps(source.page(parse_qs(urlparse(self.path).query))).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return f"http://127.0.0.1:{server.server_address[1]}/listings"
+
+
+def synthetic_record(rng: random.Random, history: int, new: int) -> dict:
+    record = {}
+    for listing_id in range(1, history + new + 1):
+        listing = make_listing(rng, listing_id)
+        listing["url"] = f"https://example.com/{listing_id}"
+        record.setdefault(f"{listing['city']}:{listing['deal_type']}", []).append(listing)
+    return record
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--subscribers", type=int, default=5000)
+    parser.add_argument("--history", type=int, default=5000, help="объявлений в лентах до первого цикла")
+    parser.add_argument("--new", type=int, default=2000, help="объявлений, появившихся после первого цикла")
+    parser.add_argument("--page-size", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--latency-ms", type=float, default=20)
+    parser.add_argument("--record", help="JSON с записанными лентами")
+    parser.add_argument("--save", help="сохранить синтетические ленты в JSON")
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    if args.record:
+        with open(args.record) as f:
+            record = json.load(f)
+    else:
+        record = synthetic_record(rng, args.history, args.new)
+        if args.save:
+            with open(args.save, "w") as f:
+                json.dump(record, f)
+    total = {feed: len(listings) for feed, listings in record.items()}
+    share = args.history / (args.history + args.new)
+
+    source = StubSource(record, args.latency_ms / 1000)
+    manager = SubscriptionManager()
+    manager.subscribers = {
+        chat_id: {"filter": parse_filter(make_settings(rng)), "language": "ru", "subscription_end": 4_000_000_000}
+        for chat_id in range(args.subscribers)
+    }
+    matched = []
+
+    async def sink(listings, listing_rows, chat_ids):
+        matched.append(len(chat_ids))
+
+    poller = ListingPoller(manager, sink, source_url=source.serve(), interval=3600,
+                           concurrency=args.concurrency, page_size=args.page_size)
+    await poller.start()
+    poller._task.cancel()  # циклы запускаем вручную
+
+    print(f"feeds: {len(poller.feeds())}, subscribers: {args.subscribers:,}, page {args.page_size}, "
+          f"concurrency {args.concurrency}, latency {args.latency_ms:.0f}ms")
+    cycles = (
+        ("bootstrap", lambda: {feed: int(n * share) for feed, n in total.items()}),
+        ("new", lambda: total),
+        ("idle", lambda: total),
+    )
+    for name, visible in cycles:
+        source.visible = visible()
+        before = (source.requests, source.connections, source.items)
+        matched.clear()
+        started = time.perf_counter()
+        ingested = await poller.poll()
+        elapsed = time.perf_counter() - started
+        requests, connections, items = (now - was for now, was in zip((source.requests, source.connections, source.items), before))
+        print(f"{name:<10} {elapsed * 1e3:7.0f}ms  requests {requests:4}  new connections {connections:3}  "
+              f"items sent {items:6,}  ingested {ingested:6,}  matches {sum(matched):,}")
+    await poller.stop()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,118 @@
+# benchmarks/log_pipeline.py
+"""
+Цена логов одного апдейта для event loop: прежний логгер (f-строки и
+синхронный StreamHandler) против utils.logger (очередь, ленивое
+форматирование, выборка, подавление повторов).
+
+На апдейт пишутся записи, как в handle_buttons и webhook_update: выбранный
+язык, изменение subscribed_users, обновление кэша и сохранение настроек
+(прежде — полный дамп settings). Вывод идёт в поток, каждая запись в который
+стоит --write-ms (медленный stderr / сборщик логов под нагрузкой).
+
+    python -m benchmarks.log_pipeline --updates 5000 --write-ms 0.2
+"""
+import argparse
+import logging
+import os
+import random
+import time
+
+os.environ.setdefault("TELEGRAM_TOKEN", "0:bench")
+os.environ.setdefault("REDIS_URL", "redis://localhost:6379/0")
+
+from benchmarks._synthetic import make_settings  # noqa: E402
+from utils import logger as log_module  # noqa: E402
+from utils.logger import LOG_DROPPED, EventFilter, logger  # noqa: E402
+
+
+class SlowStream:
+    """Поток вывода, каждая запись в который занимает delay секунд."""
+
+    def __init__(self, delay: float):
+        self.delay = delay
+        self.lines = 0
+
+    def write(self, text: str):
+        if text.strip():
+            self.lines += 1
+            time.sleep(self.delay)
+
+    def flush(self):
+        pass
+
+
+def legacy_logger(stream) -> logging.Logger:
+    legacy = logging.getLogger("bench_legacy")
+    legacy.propagate = False
+    handler = logging.StreamHandler(stream)
+    handler.setFormatter(logging.Formatter("%(asctime)s | %(levelname)s | %(name)s | %(message)s"))
+    legacy.addHandler(handler)
+    legacy.setLevel(logging.INFO)
+    return legacy
+
+
+def legacy_update(log, chat_id: int, settings: dict):
+    log.info(f"Selected language for chat_id={chat_id}: ru")
+    log.info(f"➕ Added chat_id={chat_id} to subscribed_users")
+    log.info(f"🔄 Cache refreshed after start for chat_id={chat_id}")
+    log.info(f"✅ Saved settings for user_id={chat_id}: {settings}")
+    log.info(f"Webhook update for user_id={chat_id}: subscription_end=4000000000, bot_status=running")
+
+
+def new_update(chat_id: int, settings: dict):
+    logger.info("Selected language for chat_id=%s: %s", chat_id, "ru", extra={"event": "language_selected"})
+    logger.info("➕ Added chat_id=%s to subscribed_users", chat_id, extra={"event": "subscriber_added", "chat_id": chat_id})
+    logger.info("🔄 Cache refreshed after start for chat_id=%s", chat_id, extra={"event": "cache_refreshed"})
+    logger.info("✅ Saved settings for user_id=%s: city=%s, deal_type=%s, subscribed=%s",
+                chat_id, settings["city"], settings["deal_type"], True,
+                extra={"event": "settings_saved", "chat_id": chat_id, "subscribed": True,
+                       "subscription_end": 4000000000, "bot_status": "running"})
+
+
+def run(label: str, update, updates: int, settings: list, stream: SlowStream):
+    started = time.perf_counter()
+    for i in range(updates):
+        update(100_000 + i, settings[i % len(settings)])
+    elapsed = time.perf_counter() - started
+    print(f"{label:<34} {elapsed / updates * 1e6:8.1f} us per update in the event loop")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--updates", type=int, default=5000)
+    parser.add_argument("--write-ms", type=float, default=0.2, help="стоимость записи одной строки в вывод")
+    args = parser.parse_args()
+    rng = random.Random(1)
+    settings = [make_settings(rng) for _ in range(1000)]
+
+    print(f"{args.updates:,} updates, {args.write_ms} ms per written line\n")
+    legacy_stream = SlowStream(args.write_ms / 1000)
+    legacy = legacy_logger(legacy_stream)
+    run("f-strings + StreamHandler", lambda chat_id, s: legacy_update(legacy, chat_id, s), args.updates, settings, legacy_stream)
+    print(f"{'':<34} {legacy_stream.lines:,} lines written")
+
+    handler, configured = logger.handlers[0], logger.event_filter
+    # Сначала только очередь и ленивое форматирование, без выборки и подавления повторов
+    logger.event_filter = EventFilter({}, limit=10**9, window=1)
+    handler.filters = [logger.event_filter]
+    queue_only(args, settings)
+    logger.event_filter = configured
+    handler.filters = [configured]
+    queue_only(args, settings, "utils.logger (+ sampling, dedupe)")
+
+
+def queue_only(args, settings, label: str = "utils.logger (queue, lazy format)"):
+    stream = SlowStream(args.write_ms / 1000)
+    log_module.listener.handlers[0].setStream(stream)
+    before = {reason: counter.value for reason, counter in LOG_DROPPED.series.items()}
+    run(label, new_update, args.updates, settings, stream)
+    started = time.perf_counter()
+    log_module.log_queue.join()  # дождаться, пока поток вывода допишет очередь
+    print(f"{'':<34} {stream.lines:,} lines written by the listener thread "
+          f"(drained {time.perf_counter() - started:.1f}s after the loop)")
+    print(f"{'':<34} dropped: " + ", ".join(f"{reason} {counter.value - before.get(reason, 0):,}"
+                                             for reason, counter in LOG_DROPPED.series.items()))
+
+if __name__ == "__main__":
+    main()
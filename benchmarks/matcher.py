@@ -0,0 +1,51 @@
+# benchmarks/matcher.py
+"""
+match(listing) индексом SubscriberIndex против линейного прохода по всем фильтрам.
+
+    python -m benchmarks.matcher --sizes 10000 100000 1000000
+"""
+import argparse
+import random
+import time
+
+from benchmarks._synthetic import make_listing, make_settings
+from monitoring.filters import matches, parse_filter
+from monitoring.matcher import SubscriberIndex
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--listings", type=int, default=200)
+    parser.add_argument("--linear-listings", type=int, default=20, help="линейный проход дорогой — меряем на меньшей выборке")
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    listings = [make_listing(rng, i) for i in range(args.listings)]
+    print(f"{'subscribers':>11} {'build s':>8} {'index µs/listing':>17} {'linear µs/listing':>18} {'speedup':>8} {'avg hits':>9}")
+    for size in args.sizes:
+        filters = [(chat_id, parse_filter(make_settings(rng))) for chat_id in range(size)]
+
+        started = time.perf_counter()
+        index = SubscriberIndex()
+        index.rebuild(filters)
+        for listing in listings:  # прогрев: ленивое построение деревьев цен
+            index.match(listing)
+        build = time.perf_counter() - started
+
+        started = time.perf_counter()
+        hits = sum(len(index.match(listing)) for listing in listings)
+        indexed = (time.perf_counter() - started) / len(listings)
+
+        sample = listings[:args.linear_listings]
+        started = time.perf_counter()
+        expected = [[chat_id for chat_id, flt in filters if matches(flt, listing)] for listing in sample]
+        linear = (time.perf_counter() - started) / len(sample)
+        for listing, chat_ids in zip(sample, expected):
+            assert sorted(chat_ids) == sorted(index.match(listing)), "индекс расходится с линейным проходом"
+
+        print(f"{size:>11,} {build:>8.2f} {indexed * 1e6:>17,.0f} {linear * 1e6:>18,.0f} {linear / indexed:>7.0f}x {hits / len(listings):>9,.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+# benchmarks/metrics.py
+"""
+Накладные расходы метрик (utils.metrics) на горячем пути: observe/inc,
+handle_buttons с timed_handler + track_update против голого handler'а
+и команда Redis через InstrumentedRedis против redis.asyncio.Redis на том же
+пуле. Telegram подменяется заглушкой, Redis — BENCH_REDIS_URL или fakeredis.
+Затем время рендера /metrics и его фрагмент.
+
+    python -m benchmarks.metrics --updates 2000
+"""
+import argparse
+import asyncio
+import os
+import time
+import timeit
+
+import redis.asyncio as redis
+
+from benchmarks._redis import redis_url_process
+
+os.environ.setdefault("TELEGRAM_TOKEN", "0:bench")
+os.environ["REDIS_URL"] = redis_url_process()
+
+from benchmarks.update_roundtrips import TEXTS, StubBot, StubSubscriptionManager, make_update  # noqa: E402
+from authorization.subscription import handle_buttons  # noqa: E402
+from utils import metrics, telegram_utils  # noqa: E402
+from utils.logger import logger  # noqa: E402
+from utils.redis_client import redis_client, redis_pool  # noqa: E402
+from types import SimpleNamespace  # noqa: E402
+
+# Меряем метрики, а не лимиты Telegram и запись логов
+telegram_utils.rate_limiter = telegram_utils.RateLimiter(messages_per_second=10**9, global_messages_per_second=10**9)
+logger.setLevel("WARNING")
+
+
+def micro():
+    histogram, counter = metrics.histogram("bench_seconds", "bench"), metrics.counter("bench_total", "bench")
+    n = 1_000_000
+    for name, stmt in (("Histogram.observe", lambda: histogram.observe(0.003)), ("Counter.inc", counter.inc)):
+        print(f"{name:<28} {timeit.timeit(stmt, number=n) / n * 1e9:6.0f} ns")
+
+    def tracked():
+        with metrics.track_update():
+            pass
+    print(f"{'track_update enter/exit':<28} {timeit.timeit(tracked, number=n) / n * 1e9:6.0f} ns")
+    print(f"{'record_redis (1 command)':<28} {timeit.timeit(lambda: metrics.record_redis('HGET', ('HGET',), 0.001), number=n) / n * 1e9:6.0f} ns")
+
+
+async def per_call(func, n: int) -> float:
+    started = time.perf_counter()
+    for _ in range(n):
+        await func()
+    return (time.perf_counter() - started) / n * 1e6
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--updates", type=int, default=2000)
+    args = parser.parse_args()
+
+    plain = redis.Redis(connection_pool=redis_pool)
+    await redis_client.set("bench:key", "1")
+    for _ in range(2):  # прогрев, затем чередование, чтобы шум fakeredis делился поровну
+        plain_us = await per_call(lambda: plain.get("bench:key"), args.updates)
+        instrumented_us = await per_call(lambda: redis_client.get("bench:key"), args.updates)
+    print(f"\nGET: redis.asyncio.Redis {plain_us:6.1f} us, InstrumentedRedis {instrumented_us:6.1f} us")
+
+    context = SimpleNamespace(bot=StubBot(), application=SimpleNamespace(subscription_manager=StubSubscriptionManager()))
+    chat_id = 1001
+    await redis_client.hset(f"user:{chat_id}", mapping={"bot_status": "stopped", "subscription_end": "4000000000", "language": "ru"})
+    update = make_update(chat_id, TEXTS["start_button"])
+    timed = metrics.timed_handler(handle_buttons)
+
+    async def bare():
+        await handle_buttons(update, context)
+
+    async def instrumented():
+        with metrics.track_update():
+            await timed(update, context)
+
+    for _ in range(2):
+        bare_us = await per_call(bare, args.updates)
+        instrumented_us = await per_call(instrumented, args.updates)
+    print(f"handle_buttons: bare {bare_us:6.1f} us, timed_handler + track_update {instrumented_us:6.1f} us "
+          f"({instrumented_us - bare_us:+.1f} us)")
+
+    started = time.perf_counter()
+    text = await metrics.render()
+    print(f"\nrender /metrics: {(time.perf_counter() - started) * 1e3:.2f} ms, {len(text):,} bytes")
+    for line in text.splitlines():
+        if line.startswith(("bot_update_redis_commands_bucket", "bot_handler_duration_seconds_count", "redis_commands_total")):
+            print(" ", line)
+    print()
+    micro()  # после рендера: миллионы синтетических записей не попадают в фрагмент выше
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,142 @@
+# benchmarks/payloads.py
+"""
+Пропускная способность разбора web_app_data и тела POST /webhook: прежний путь
+(orjson.loads, required_keys как множество, str() по каждому полю, без проверки
+диапазонов) против authorization.payloads (msgspec Struct'ы с нормализацией
+и проверкой диапазонов за один проход). Плюс доля и цена отказа на битых данных.
+
+    python -m benchmarks.payloads --payloads 20000
+"""
+import argparse
+import os
+import random
+import time
+
+import orjson
+
+from benchmarks._synthetic import make_settings
+
+os.environ.setdefault("TELEGRAM_TOKEN", "0:bench")
+os.environ.setdefault("REDIS_URL", "redis://localhost:6379/0")
+
+from authorization.payloads import PayloadError, decode_netlify_body, decode_web_app_data  # noqa: E402
+
+REQUIRED_KEYS = {"city", "deal_type", "price_from", "price_to", "floor_from", "floor_to", "rooms_from", "rooms_to",
+                 "bedrooms_from", "bedrooms_to", "own_ads"}
+
+
+def legacy_web_app(data: str):
+    """Разбор из webhook_update до перехода на authorization.payloads."""
+    payload = orjson.loads(data)
+    if payload.get("type") == "support":
+        return (payload.get("message") or "").strip()
+    if not REQUIRED_KEYS.issubset(payload.keys()):
+        raise ValueError("invalid")
+    return {
+        "city": payload["city"],
+        "districts": payload.get("districts", {}),
+        "deal_type": payload["deal_type"],
+        "price_from": str(payload["price_from"]),
+        "price_to": str(payload["price_to"]),
+        "floor_from": str(payload["floor_from"]),
+        "floor_to": str(payload["floor_to"]),
+        "rooms_from": str(payload["rooms_from"]),
+        "rooms_to": str(payload["rooms_to"]),
+        "bedrooms_from": str(payload["bedrooms_from"]),
+        "bedrooms_to": str(payload["bedrooms_to"]),
+        "own_ads": str(payload["own_ads"]),
+    }, payload.get("language", "ru")
+
+
+def new_web_app(data: str):
+    payload = decode_web_app_data(data)
+    return payload.settings() if hasattr(payload, "settings") else payload.message
+
+
+def legacy_netlify(body: bytes):
+    data = orjson.loads(body)
+    return data.get("chat_id"), data.get("url"), data.get("supportMessage")
+
+
+def new_netlify(body: bytes):
+    data = decode_netlify_body(body)
+    return data.chat_id, data.url, data.support_message
+
+
+def make_web_app_data(rng: random.Random) -> str:
+    if rng.random() < 0.1:
+        return orjson.dumps({"type": "support", "message": "Не приходят объявления " * rng.randint(1, 5)}).decode()
+    settings = make_settings(rng)
+    # WebApp шлёт числа то строками, то числами
+    for key, value in settings.items():
+        if key.endswith(("_from", "_to")) and value and rng.random() < 0.5:
+            settings[key] = int(value)
+    return orjson.dumps({"type": "settings", "language": rng.choice(("ru", "en")), **settings}).decode()
+
+
+def make_invalid(rng: random.Random) -> str:
+    settings = {"type": "settings", **make_settings(rng)}
+    broken = rng.choice(("missing", "type", "range", "garbage", "oversized"))
+    if broken == "missing":
+        del settings["price_to"]
+    elif broken == "type":
+        settings["rooms_from"] = ["1"]
+    elif broken == "range":
+        settings["floor_to"] = "-5"
+    elif broken == "garbage":
+        return '{"type": "settings", "city": '
+    else:
+        settings["districts"] = {f"d{i}": "x" * 90 for i in range(60)}
+    return orjson.dumps(settings).decode()
+
+
+def throughput(func, items: list) -> tuple[float, int]:
+    rejected = 0
+    started = time.perf_counter()
+    for item in items:
+        try:
+            func(item)
+        except (ValueError, KeyError, TypeError):  # PayloadError — тоже ValueError
+            rejected += 1
+    return (time.perf_counter() - started) / len(items), rejected
+
+
+def report(title: str, legacy, new, items: list):
+    for _ in range(2):  # прогрев
+        legacy_s, legacy_rejected = throughput(legacy, items)
+        new_s, new_rejected = throughput(new, items)
+    print(title)
+    print(f"  legacy  {legacy_s * 1e6:6.2f} us  {1 / legacy_s:10,.0f} /s  rejected {legacy_rejected:,}/{len(items):,}")
+    print(f"  msgspec {new_s * 1e6:6.2f} us  {1 / new_s:10,.0f} /s  rejected {new_rejected:,}/{len(items):,}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--payloads", type=int, default=20_000)
+    args = parser.parse_args()
+    rng = random.Random(3)
+
+    valid = [make_web_app_data(rng) for _ in range(args.payloads)]
+    report("web_app_data, valid (10% support)", legacy_web_app, new_web_app, valid)
+    invalid = [make_invalid(rng) for _ in range(args.payloads)]
+    report("web_app_data, malformed (missing field, wrong type, out of range, bad JSON, oversized)",
+           legacy_web_app, new_web_app, invalid)
+
+    bodies = [orjson.dumps({"chat_id": str(rng.randint(10**8, 8 * 10**9)), "url": f"https://example.netlify.app/f/{i}"})
+              if i % 2 else orjson.dumps({"chat_id": rng.randint(10**8, 8 * 10**9), "supportMessage": "Помогите с фильтром"})
+              for i in range(args.payloads)]
+    report("Netlify body", legacy_netlify, new_netlify, bodies)
+
+    # Нормализация: значения сохраняются в том же виде, что и прежде, только канонически
+    sample = decode_web_app_data(orjson.dumps({"type": "settings", "city": 1, "deal_type": "2", "price_from": " 500 ",
+                                               "price_to": 300.0, "floor_from": "", "floor_to": None, "rooms_from": 2,
+                                               "rooms_to": "", "bedrooms_from": "", "bedrooms_to": "", "own_ads": True}))
+    print(f"\nnormalized: {sample.settings()}")
+    try:
+        decode_web_app_data(orjson.dumps({"type": "settings", **make_settings(rng), "price_to": "1e12"}))
+    except PayloadError as e:
+        print(f"rejected:   {e}")
+
+
+if __name__ == "__main__":
+    main()
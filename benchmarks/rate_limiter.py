@@ -0,0 +1,99 @@
+# benchmarks/rate_limiter.py
+"""
+RateLimiter (token bucket) против прежней реализации на списках таймстемпов:
+накладные расходы на вызов, точность ожидания и память на миллионе чатов.
+
+    python -m benchmarks.rate_limiter
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+import tracemalloc
+from collections import defaultdict
+
+os.environ.setdefault("TELEGRAM_TOKEN", "0:bench")
+os.environ.setdefault("REDIS_URL", "redis://localhost:6379/0")
+
+from utils.telegram_utils import RateLimiter  # noqa: E402
+
+
+class LegacyRateLimiter:
+    """Реализация до перехода на token bucket (списки таймстемпов + опрос раз в 100 мс)."""
+
+    def __init__(self, messages_per_second=1, global_messages_per_second=30):
+        self.chat_timestamps = defaultdict(list)
+        self.global_timestamps = []
+        self.messages_per_second = messages_per_second
+        self.global_messages_per_second = global_messages_per_second
+
+    async def wait_for_slot(self, chat_id):
+        current_time = time.time()
+        self.chat_timestamps[chat_id] = [t for t in self.chat_timestamps[chat_id] if current_time - t < 1]
+        self.global_timestamps = [t for t in self.global_timestamps if current_time - t < 1]
+        while len(self.chat_timestamps[chat_id]) >= self.messages_per_second:
+            await asyncio.sleep(0.1)
+            current_time = time.time()
+            self.chat_timestamps[chat_id] = [t for t in self.chat_timestamps[chat_id] if current_time - t < 1]
+        while len(self.global_timestamps) >= self.global_messages_per_second:
+            await asyncio.sleep(0.1)
+            current_time = time.time()
+            self.global_timestamps = [t for t in self.global_timestamps if current_time - t < 1]
+        self.chat_timestamps[chat_id].append(current_time)
+        self.global_timestamps.append(current_time)
+
+
+async def overhead(limiter, calls: int) -> float:
+    """мкс на wait_for_slot без ожидания (разные чаты, глобальный лимит не мешает)."""
+    started = time.perf_counter()
+    for chat_id in range(calls):
+        await limiter.wait_for_slot(chat_id)
+    return (time.perf_counter() - started) / calls * 1e6
+
+
+async def lateness(limiter, messages: int) -> float:
+    """Средняя задержка сверх идеального расписания 1 msg/s для одного чата, мс."""
+    started = time.monotonic()
+    late = 0.0
+    for i in range(messages):
+        await limiter.wait_for_slot(42)
+        late += max(0.0, time.monotonic() - started - i)
+    return late / messages * 1e3
+
+
+async def memory(chats: int, max_chats: int) -> tuple:
+    limiter = RateLimiter(global_messages_per_second=1e9, max_chats=max_chats)
+    tracemalloc.start()
+    for chat_id in range(chats):
+        await limiter.wait_for_slot(chat_id)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return len(limiter.chat_buckets), peak
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=20_000)
+    parser.add_argument("--messages", type=int, default=5)
+    parser.add_argument("--chats", type=int, default=1_000_000)
+    parser.add_argument("--max-chats", type=int, default=10_000)
+    args = parser.parse_args()
+
+    legacy_us = await overhead(LegacyRateLimiter(global_messages_per_second=1e9), args.calls)
+    bucket_us = await overhead(RateLimiter(global_messages_per_second=1e9), args.calls)
+    print(f"overhead ({args.calls:,} chats): legacy {legacy_us:,.1f} µs/call, token bucket {bucket_us:,.1f} µs/call")
+
+    legacy_ms = await lateness(LegacyRateLimiter(), args.messages)
+    bucket_ms = await lateness(RateLimiter(), args.messages)
+    print(f"lateness at 1 msg/s:     legacy {legacy_ms:.1f} ms/msg, token bucket {bucket_ms:.1f} ms/msg")
+
+    buckets, peak = await memory(args.chats, args.max_chats)
+    print(f"memory ({args.chats:,} chats):  {buckets:,} buckets kept, peak {peak / 2**20:.1f} MiB")
+    if buckets > args.max_chats:
+        print(f"FAIL: {buckets} buckets > max_chats={args.max_chats}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,75 @@
+# benchmarks/redis_concurrency.py
+"""
+Сравнивает синхронный redis-клиент (блокирует event loop) и redis.asyncio с пулом
+на всплеске конкурентных апдейтов. Каждый "апдейт" делает столько же HGETALL,
+сколько нажатие "Старт" в handle_buttons.
+
+    python -m benchmarks.redis_concurrency --updates 500 --pool 20 --latency-ms 2
+"""
+import argparse
+import asyncio
+import time
+
+import redis
+import redis.asyncio as aredis
+
+from benchmarks._redis import redis_url, with_latency
+
+CALLS_PER_UPDATE = 5
+
+
+async def run_sync(url: str, updates: int) -> float:
+    client = redis.from_url(url, decode_responses=True)
+
+    async def update(i):
+        for _ in range(CALLS_PER_UPDATE):
+            client.hgetall(f"user:{i}")
+        await asyncio.sleep(0)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(update(i) for i in range(updates)))
+    elapsed = time.perf_counter() - start
+    client.close()
+    return elapsed
+
+
+async def run_async(url: str, updates: int, pool_size: int) -> float:
+    pool = aredis.BlockingConnectionPool.from_url(url, max_connections=pool_size, decode_responses=True)
+    client = aredis.Redis(connection_pool=pool)
+
+    async def update(i):
+        for _ in range(CALLS_PER_UPDATE):
+            await client.hgetall(f"user:{i}")
+
+    start = time.perf_counter()
+    await asyncio.gather(*(update(i) for i in range(updates)))
+    elapsed = time.perf_counter() - start
+    await client.aclose()
+    await pool.disconnect()
+    return elapsed
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--updates", type=int, default=500)
+    parser.add_argument("--pool", type=int, default=20)
+    parser.add_argument("--latency-ms", type=float, default=2, help="имитация RTT до Redis")
+    args = parser.parse_args()
+
+    url = redis_url()
+    seed = redis.from_url(url, decode_responses=True)
+    for i in range(args.updates):
+        seed.hset(f"user:{i}", mapping={"bot_status": "running", "subscription_end": "1900000000", "language": "ru"})
+
+    url = with_latency(url, args.latency_ms)
+    sync_time = await run_sync(url, args.updates)
+    async_time = await run_async(url, args.updates, args.pool)
+    total = args.updates * CALLS_PER_UPDATE
+    print(f"sync client:  {sync_time:.3f}s  ({total / sync_time:,.0f} cmd/s)")
+    print(f"async pool:   {async_time:.3f}s  ({total / async_time:,.0f} cmd/s, pool={args.pool})")
+    print(f"RTT:          {args.latency_ms}ms")
+    print(f"speedup:      x{sync_time / async_time:.2f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
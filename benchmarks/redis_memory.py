@@ -0,0 +1,89 @@
+# benchmarks/redis_memory.py
+"""
+Память Redis до и после utils.redis_memory migrate на синтетических пользователях
+в прежней раскладке: JSON settings в user:<id> (у части уже дописан filter и
+удалён settings менеджером подписок — хэш при этом остаётся hashtable) и
+отдельный ключ trial_used:<id> у взявших триал.
+
+Нужен настоящий Redis (MEMORY USAGE, OBJECT ENCODING): BENCH_REDIS_URL.
+Базу BENCH_REDIS_URL бенчмарк очищает (FLUSHDB).
+
+    BENCH_REDIS_URL=redis://localhost:6379/15 python -m benchmarks.redis_memory --users 100000
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+
+import orjson
+
+from benchmarks._synthetic import make_settings
+
+if not os.getenv("BENCH_REDIS_URL"):
+    sys.exit("BENCH_REDIS_URL is required: fakeredis has no MEMORY USAGE / OBJECT ENCODING")
+os.environ.setdefault("TELEGRAM_TOKEN", "0:bench")
+os.environ["REDIS_URL"] = os.environ["BENCH_REDIS_URL"]
+
+from monitoring.filter_codec import storage_fields  # noqa: E402
+from utils.redis_client import redis_client  # noqa: E402
+from utils.redis_memory import compact_users, migrate_trials, print_report, report  # noqa: E402
+
+SEED_BATCH = 2000
+
+
+async def seed(users: int, migrated_share: float, trial_share: float):
+    rng = random.Random(42)
+    now = int(time.time())
+    pipe = redis_client.pipeline(transaction=False)
+    for _ in range(users):
+        chat_id = rng.randint(100_000_000, 8_000_000_000)
+        key = f"user:{chat_id}"
+        settings = make_settings(rng)
+        pipe.hset(key, mapping={
+            "bot_status": rng.choice(("running", "stopped")), "subscription_end": str(now + rng.randint(-10**6, 3 * 10**6)),
+            "language": rng.choice(("ru", "en")), "filters_timestamp": str(now - rng.randint(0, 10**6)),
+            "settings": orjson.dumps(settings),
+        })
+        if rng.random() < migrated_share:
+            # Как migrate_legacy: filter дописан, settings удалён — но хэш уже hashtable
+            pipe.hset(key, "filter", (await storage_fields(settings))["filter"])
+            pipe.hdel(key, "settings")
+        pipe.expire(key, 3_000_000)
+        if rng.random() < trial_share:
+            pipe.set(f"trial_used:{chat_id}", "true")
+        if len(pipe) >= SEED_BATCH:
+            await pipe.execute()
+    await pipe.execute()
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--migrated-share", type=float, default=0.5, help="доля уже переведённых на filter менеджером")
+    parser.add_argument("--trial-share", type=float, default=0.6)
+    parser.add_argument("--sample", type=int, default=2000)
+    args = parser.parse_args()
+
+    await redis_client.flushdb()
+    await seed(args.users, args.migrated_share, args.trial_share)
+    used_before = (await redis_client.info("memory"))["used_memory"]
+    print("before:")
+    print_report(await report(args.sample), args.users)
+
+    started = time.perf_counter()
+    moved = await migrate_trials()
+    checked, rewritten = await compact_users()
+    print(f"\nmigrate: {moved:,} trial flags moved, {rewritten:,}/{checked:,} user hashes rewritten "
+          f"in {time.perf_counter() - started:.1f}s")
+
+    used_after = (await redis_client.info("memory"))["used_memory"]
+    print("\nafter:")
+    print_report(await report(args.sample), args.users)
+    print(f"\nINFO used_memory: {used_before / 2**20:.1f} MiB -> {used_after / 2**20:.1f} MiB "
+          f"({(used_before - used_after) / args.users:.0f} B per user saved)")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
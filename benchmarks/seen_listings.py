@@ -0,0 +1,70 @@
+# benchmarks/seen_listings.py
+"""
+SeenListings на синтетическом потоке: отмечает --listings объявлений каждому из
+--users пользователей пачками (как результат match_batch), затем проверяет, что
+все они считаются отправленными (ложных "новое" быть не должно), и меряет долю
+ложных "уже видели" на свежих id и байты в Redis против множества listing_id.
+
+    python -m benchmarks.seen_listings --users 20 --listings 300 --probes 10000
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+from benchmarks._redis import redis_url
+
+os.environ.setdefault("TELEGRAM_TOKEN", "0:bench")
+os.environ["REDIS_URL"] = redis_url()
+
+from monitoring.seen_listings import SeenListings  # noqa: E402
+from utils.redis_client import redis_client  # noqa: E402
+
+BATCH = 500  # пар (chat_id, listing_id) за один check_and_mark
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--listings", type=int, default=300, help="отмечается каждому пользователю")
+    parser.add_argument("--probes", type=int, default=10000, help="свежих id на проверку ложных срабатываний (отмечаются после замера памяти)")
+    args = parser.parse_args()
+
+    seen = SeenListings()
+    pairs = [(chat_id, 10_000_000 + listing) for listing in range(args.listings) for chat_id in range(args.users)]
+    started = time.perf_counter()
+    for offset in range(0, len(pairs), BATCH):
+        await seen.check_and_mark(pairs[offset:offset + BATCH])
+    elapsed = time.perf_counter() - started
+
+    repeated = []
+    for offset in range(0, len(pairs), BATCH):
+        repeated += await seen.check_and_mark(pairs[offset:offset + BATCH])
+    false_new = sum(repeated)
+
+    bitmap_bytes = 0
+    for chat_id in range(args.users):
+        for key in seen.keys(chat_id):
+            bitmap_bytes += await redis_client.strlen(key)
+
+    probes = [(chat_id, 90_000_000 + i) for i in range(args.probes // args.users) for chat_id in range(args.users)]
+    fresh = []
+    for offset in range(0, len(probes), BATCH):
+        fresh += await seen.check_and_mark(probes[offset:offset + BATCH])
+    false_seen = len(fresh) - sum(fresh)
+
+    set_bytes = sum(len(str(listing_id)) for _, listing_id in pairs)  # только сами id, без накладных SET
+
+    stages = ", ".join(f"{total}:{bits}b/k{k}" for total, _, bits, k in seen.stages)
+    print(f"bloom:       stages (cumulative capacity:m/k) {stages}, {seen.buckets} buckets, "
+          f"worst case {seen.bytes_per_user:,} B/user")
+    print(f"mark:        {len(pairs) / elapsed:,.0f} pairs/s ({BATCH} per round-trip)")
+    print(f"false new:   {false_new} of {len(repeated):,} repeats")
+    print(f"false seen:  {false_seen / len(fresh):.4%} of {len(fresh):,} fresh ids (target {seen.fp_rate:.4%})")
+    print(f"redis B/user: bitmaps {bitmap_bytes / args.users:,.0f}  vs raw ids in a SET >= {set_bytes / args.users:,.0f}")
+    sys.exit(1 if false_new else 0)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
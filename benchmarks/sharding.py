@@ -0,0 +1,156 @@
+# benchmarks/sharding.py
+"""
+Шардирование подписчиков несколькими локальными процессами на одном Redis
+(BENCH_REDIS_URL или fakeredis в отдельном процессе).
+
+Сначала один воркер, затем --workers воркеров: шарды перераспределяются по
+арендам, у каждого в кэше и в match_batch только свои подписчики. Затем один
+воркер убивается (SIGKILL, без release), и меряется время, за которое его
+шарды забирают остальные.
+
+    python -m benchmarks.sharding --subscribers 20000 --workers 4 --shards 64 --ttl 3
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+
+from benchmarks._redis import redis_url_process
+from benchmarks._synthetic import make_listing, make_settings
+
+os.environ.setdefault("TELEGRAM_TOKEN", "0:bench")
+os.environ["REDIS_URL"] = os.environ["BENCH_REDIS_URL"] = redis_url_process()
+
+LISTINGS = 500  # объявлений в пачке match_batch у каждого воркера
+STATUS_EVERY = 0.25  # сек между отчётами воркера
+
+
+async def worker(name: str, shards: int, ttl: float):
+    from monitoring.sharding import ShardLeases
+    from monitoring.subscription_manager import SubscriptionManager
+
+    rng = random.Random(7)
+    listings = [make_listing(rng, i) for i in range(LISTINGS)]
+    leases = ShardLeases(worker_id=name, shards=shards, ttl=ttl)
+    await leases.start()
+    manager = SubscriptionManager(leases)
+    await manager.start()
+    await manager.ready.wait()
+    while True:
+        reloading = manager._refresher is not None  # полная перезагрузка идёт через очередь перечитываний
+        started = time.perf_counter()
+        _, chat_ids = manager.match_batch(listings)
+        match_ms = (time.perf_counter() - started) * 1e3
+        print(json.dumps({
+            "worker": name, "owned": sorted(leases.owned), "subscribers": len(manager),
+            "reloading": reloading, "matches": len(chat_ids), "match_ms": match_ms,
+        }), flush=True)
+        await asyncio.sleep(STATUS_EVERY)
+
+
+class Worker:
+    def __init__(self, name: str, args):
+        self.name = name
+        self.status = None
+        self.proc = subprocess.Popen(
+            [sys.executable, "-m", "benchmarks.sharding", "--worker", name, "--shards", str(args.shards), "--ttl", str(args.ttl)],
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True, env=os.environ.copy(),
+        )
+        threading.Thread(target=self._read, daemon=True).start()
+
+    def _read(self):
+        for line in self.proc.stdout:
+            if line.startswith("{"):
+                self.status = json.loads(line)
+
+
+def covered(statuses: list, shards: int) -> bool:
+    """Все шарды в аренде ровно у одного воркера."""
+    owned = [shard for s in statuses for shard in s["owned"]]
+    return len(owned) == shards and len(set(owned)) == shards
+
+
+def settled(workers: list, shards: int, subscribers: int) -> bool:
+    statuses = [w.status for w in workers]
+    if any(s is None or s["reloading"] for s in statuses):
+        return False
+    return covered(statuses, shards) and sum(s["subscribers"] for s in statuses) == subscribers
+
+
+def wait_covered(workers: list, args, timeout: float = 60) -> float:
+    started = time.perf_counter()
+    while not covered([w.status for w in workers], args.shards):
+        if time.perf_counter() - started > timeout:
+            raise TimeoutError([w.status for w in workers])
+        time.sleep(0.05)
+    return time.perf_counter() - started
+
+
+def wait_settled(workers: list, args, timeout: float = 60) -> float:
+    started = time.perf_counter()
+    while not settled(workers, args.shards, args.subscribers):
+        if time.perf_counter() - started > timeout:
+            raise TimeoutError([w.status for w in workers])
+        time.sleep(0.05)
+    time.sleep(STATUS_EVERY * 2)  # свежий замер match_batch после перезагрузки
+    return time.perf_counter() - started
+
+
+def report(title: str, workers: list, elapsed: float):
+    statuses = [w.status for w in workers]
+    print(f"{title} (settled in {elapsed:.2f}s)")
+    for s in statuses:
+        print(f"  {s['worker']:<4} shards {len(s['owned']):3}  subscribers {s['subscribers']:7,}  "
+              f"match_batch({LISTINGS}) {s['match_ms']:7.1f}ms  matches {s['matches']:8,}")
+    print(f"  total matches {sum(s['matches'] for s in statuses):,}, slowest worker {max(s['match_ms'] for s in statuses):.1f}ms")
+
+
+async def seed(subscribers: int):
+    from monitoring.filter_codec import storage_fields
+    from utils.redis_client import redis_client
+
+    rng = random.Random(42)
+    pipe = redis_client.pipeline(transaction=False)
+    for chat_id in range(1, subscribers + 1):
+        fields = await storage_fields(make_settings(rng))
+        pipe.hset(f"user:{chat_id}", mapping={"bot_status": "running", "subscription_end": "4000000000", "language": "ru", **fields})
+        pipe.sadd("subscribed_users", chat_id)
+        if len(pipe) >= 5000:
+            await pipe.execute()
+    await pipe.execute()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--subscribers", type=int, default=20_000)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--shards", type=int, default=64)
+    parser.add_argument("--ttl", type=float, default=3, help="TTL аренды, сек")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.worker:
+        asyncio.run(worker(args.worker, args.shards, args.ttl))
+        return
+
+    asyncio.run(seed(args.subscribers))
+    workers = [Worker("w0", args)]
+    try:
+        report("1 worker", workers, wait_settled(workers, args))
+        workers += [Worker(f"w{i}", args) for i in range(1, args.workers)]
+        report(f"{args.workers} workers", workers, wait_settled(workers, args))
+        victim = workers.pop()
+        victim.proc.kill()
+        print(f"{victim.name} killed: its shards leased again after {wait_covered(workers, args):.2f}s")
+        report(f"{victim.name} killed, ttl {args.ttl}s", workers, wait_settled(workers, args))
+    finally:
+        for w in workers:
+            w.proc.kill()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+# benchmarks/subscriber_loader.py
+"""
+Полная загрузка подписчиков: SMEMBERS + один pipeline HMGET на весь набор
+против потокового scan_subscribers (SSCAN + pipeline HMGET пачками).
+Меряет время и пиковую память клиента, Redis — BENCH_REDIS_URL или fakeredis
+в отдельном процессе.
+
+    python -m benchmarks.subscriber_loader --members 100000 --batch 1000
+"""
+import argparse
+import asyncio
+import os
+import time
+import tracemalloc
+
+from benchmarks._redis import redis_url_process
+
+os.environ.setdefault("TELEGRAM_TOKEN", "0:bench")
+os.environ["REDIS_URL"] = redis_url_process()
+os.environ.setdefault("REDIS_SOCKET_TIMEOUT", "120")  # один pipeline на 100k HMGET к fakeredis идёт дольше 5 с
+
+from monitoring.subscriber_scan import scan_subscribers  # noqa: E402
+from monitoring.subscription_manager import SUBSCRIBER_FIELDS  # noqa: E402
+from utils.redis_client import redis_client  # noqa: E402
+
+SEED_BATCH = 5000
+
+
+async def seed(members: int):
+    for start in range(0, members, SEED_BATCH):
+        pipe = redis_client.pipeline(transaction=False)
+        chat_ids = range(start, min(members, start + SEED_BATCH))
+        for chat_id in chat_ids:
+            pipe.hset(f"user:{chat_id}", mapping={
+                "bot_status": "running", "subscription_end": "4000000000", "language": "ru",
+                "filter": "AQEBAAIAZAAAAAAAAIAAAACAAAAAgAAAAIAAAACAAAAAgAAAAIAD", "filters_timestamp": "1700000000",
+            })
+        pipe.sadd("subscribed_users", *chat_ids)
+        await pipe.execute()
+
+
+async def load_smembers() -> int:
+    chat_ids = [int(chat_id) for chat_id in await redis_client.smembers("subscribed_users")]
+    pipe = redis_client.pipeline(transaction=False)
+    for chat_id in chat_ids:
+        pipe.hmget(f"user:{chat_id}", SUBSCRIBER_FIELDS)
+    return len(dict(zip(chat_ids, await pipe.execute())))
+
+
+async def load_stream(batch_size: int) -> int:
+    loaded = {}
+    async for batch in scan_subscribers(SUBSCRIBER_FIELDS, batch_size):
+        loaded.update(batch)
+    return len(loaded)
+
+
+async def measure(coro) -> tuple[int, float, int]:
+    tracemalloc.start()
+    started = time.perf_counter()
+    loaded = await coro
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return loaded, elapsed, peak
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--members", type=int, default=100_000)
+    parser.add_argument("--batch", type=int, default=1000)
+    args = parser.parse_args()
+
+    await seed(args.members)
+    started = time.perf_counter()
+    size = await redis_client.scard("subscribed_users")
+    gauge = time.perf_counter() - started
+    print(f"members:  {size:,} (SCARD gauge {gauge * 1e3:.2f}ms)")
+    for name, coro in (("smembers", load_smembers()), (f"sscan/{args.batch}", load_stream(args.batch))):
+        loaded, elapsed, peak = await measure(coro)
+        print(f"{name:<12} {elapsed:.2f}s  peak {peak / 2**20:,.1f} MiB  loaded {loaded:,}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
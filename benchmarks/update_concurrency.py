@@ -0,0 +1,74 @@
+# benchmarks/update_concurrency.py
+"""
+Нагрузочный тест обработки апдейтов: последовательно (как без concurrent_updates),
+SimpleUpdateProcessor из PTB (параллельно, без порядка) и PerChatUpdateProcessor.
+Обработчик спит случайное время (Redis + Telegram), поэтому без блокировки чата
+апдейты одного пользователя завершаются не по порядку. Падает, если
+PerChatUpdateProcessor нарушил порядок внутри чата.
+
+    python -m benchmarks.update_concurrency --chats 200 --per-chat 5 --latency-ms 20
+"""
+import argparse
+import asyncio
+import random
+import sys
+import time
+from types import SimpleNamespace
+
+from telegram.ext import SimpleUpdateProcessor
+
+from utils.update_processor import PerChatUpdateProcessor
+
+
+def make_updates(chats: int, per_chat: int) -> list:
+    # Чаты перемешаны, но внутри чата update_id идут по возрастанию
+    rng = random.Random(0)
+    updates = []
+    for seq in range(per_chat):
+        order = list(range(chats))
+        rng.shuffle(order)
+        updates += [SimpleNamespace(update_id=seq * chats + chat, effective_chat=SimpleNamespace(id=chat)) for chat in order]
+    return updates
+
+
+async def run(processor, updates: list, latency: float) -> tuple[float, int]:
+    done = {}  # chat_id -> update_id в порядке завершения обработки
+    rng = random.Random(1)
+
+    async def handle(update):
+        await asyncio.sleep(latency * rng.uniform(0.5, 1.5))
+        done.setdefault(update.effective_chat.id, []).append(update.update_id)
+
+    async with processor:
+        start = time.perf_counter()
+        await asyncio.gather(*(processor.process_update(u, handle(u)) for u in updates))
+        elapsed = time.perf_counter() - start
+    violations = sum(ids != sorted(ids) for ids in done.values())
+    return elapsed, violations
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chats", type=int, default=200)
+    parser.add_argument("--per-chat", type=int, default=5)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--latency-ms", type=float, default=20, help="среднее время обработки апдейта")
+    args = parser.parse_args()
+
+    updates = make_updates(args.chats, args.per_chat)
+    latency = args.latency_ms / 1000
+    sequential, _ = await run(PerChatUpdateProcessor(1), updates, latency)
+    unordered, unordered_violations = await run(SimpleUpdateProcessor(args.concurrency), updates, latency)
+    per_chat, per_chat_violations = await run(PerChatUpdateProcessor(args.concurrency), updates, latency)
+
+    total = len(updates)
+    print(f"updates:      {total} ({args.chats} chats x {args.per_chat}), latency ~{args.latency_ms}ms")
+    print(f"sequential:   {sequential:.3f}s  ({total / sequential:,.0f} upd/s)")
+    print(f"unordered:    {unordered:.3f}s  ({total / unordered:,.0f} upd/s), chats out of order: {unordered_violations}")
+    print(f"per-chat:     {per_chat:.3f}s  ({total / per_chat:,.0f} upd/s), chats out of order: {per_chat_violations}")
+    print(f"speedup:      x{sequential / per_chat:.2f} (concurrency={args.concurrency})")
+    sys.exit(1 if per_chat_violations else 0)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
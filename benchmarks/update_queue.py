@@ -0,0 +1,117 @@
+# benchmarks/update_queue.py
+"""
+Ack-fast очередь апдейтов (utils.update_queue) под нагрузкой с одним «горячим»
+чатом: --hot апдейтов одного чата (каждый дольше --hot-ms, как при лимите
+1 сообщение/с на чат) вперемешку с апдейтами --cold чатов по --cold-ms.
+
+Прежняя схема — общая asyncio.Queue, воркеры ждут process_update, а тот ждёт
+блокировку чата в PerChatUpdateProcessor: горячий чат занимает всех воркеров.
+UpdateQueue раскладывает апдейты по чатам, и горячий чат держит одного воркера.
+Redis (SET NX дедупликации) — BENCH_REDIS_URL или fakeredis.
+
+    python -m benchmarks.update_queue --hot 40 --hot-ms 200 --cold 400 --cold-ms 10 --workers 16
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from types import SimpleNamespace
+
+from benchmarks._redis import redis_url
+
+os.environ.setdefault("TELEGRAM_TOKEN", "0:bench")
+os.environ["REDIS_URL"] = redis_url()
+
+from utils.logger import logger  # noqa: E402
+from utils.update_processor import PerChatUpdateProcessor  # noqa: E402
+from utils.update_queue import UpdateQueue  # noqa: E402
+
+HOT_CHAT = 1
+
+
+class SharedQueue:
+    """Схема до раскладки по чатам: общая очередь и воркеры, ждущие обработку апдейта целиком."""
+
+    def __init__(self, process, workers: int):
+        self.process = process
+        self.queue = asyncio.Queue()
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(workers)]
+
+    async def put(self, update):
+        self.queue.put_nowait(update)
+
+    async def _work(self):
+        while True:
+            update = await self.queue.get()
+            try:
+                await self.process(update)
+            finally:
+                self.queue.task_done()
+
+    async def join(self):
+        await self.queue.join()
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+
+
+def make_updates(hot: int, cold: int, base_id: int) -> list:
+    # Горячий чат присылает всё сразу, холодные — следом, по одному апдейту
+    updates = [SimpleNamespace(update_id=base_id + i, effective_chat=SimpleNamespace(id=HOT_CHAT)) for i in range(hot)]
+    updates += [SimpleNamespace(update_id=base_id + hot + i, effective_chat=SimpleNamespace(id=1000 + i)) for i in range(cold)]
+    return updates
+
+
+async def run(label: str, make_queue, updates: list, args) -> bool:
+    processor = PerChatUpdateProcessor(64)
+    received, latency, order = {}, {"hot": [], "cold": []}, []
+
+    async def handle(update):
+        chat_id = update.effective_chat.id
+        await asyncio.sleep((args.hot_ms if chat_id == HOT_CHAT else args.cold_ms) / 1000)
+        latency["hot" if chat_id == HOT_CHAT else "cold"].append(time.perf_counter() - received[update.update_id])
+        if chat_id == HOT_CHAT:
+            order.append(update.update_id)
+
+    async def process(update):
+        await processor.process_update(update, handle(update))
+
+    queue = make_queue(process)
+    if isinstance(queue, UpdateQueue):
+        await queue.start()
+    started = time.perf_counter()
+    for update in updates:
+        received[update.update_id] = time.perf_counter()
+        await queue.put(update)
+    await queue.join()
+    elapsed = time.perf_counter() - started
+    await queue.stop()
+    cold = sorted(latency["cold"])
+    in_order = order == sorted(order)
+    print(f"{label:<30} cold p50 {cold[len(cold) // 2] * 1e3:7.1f} ms  p99 {cold[int(len(cold) * 0.99)] * 1e3:7.1f} ms  "
+          f"max {cold[-1] * 1e3:7.1f} ms  total {elapsed:5.2f}s  hot chat in order: {in_order}")
+    return in_order
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--hot", type=int, default=40, help="апдейтов горячего чата")
+    parser.add_argument("--hot-ms", type=float, default=200)
+    parser.add_argument("--cold", type=int, default=400, help="холодных чатов по одному апдейту")
+    parser.add_argument("--cold-ms", type=float, default=10)
+    parser.add_argument("--workers", type=int, default=16)
+    args = parser.parse_args()
+    logger.setLevel("WARNING")
+
+    print(f"hot chat: {args.hot} x {args.hot_ms} ms, cold chats: {args.cold} x {args.cold_ms} ms, {args.workers} workers\n")
+    ok = await run("shared queue (before)", lambda process: SharedQueue(process, args.workers),
+                   make_updates(args.hot, args.cold, 0), args)
+    ok &= await run("UpdateQueue (per-chat)", lambda process: UpdateQueue(process, maxsize=10**6, workers=args.workers),
+                    make_updates(args.hot, args.cold, 10**6), args)
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
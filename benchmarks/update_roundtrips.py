@@ -0,0 +1,94 @@
+# benchmarks/update_roundtrips.py
+"""
+Считает round-trip'ы в Redis на одно нажатие кнопки и падает, если их больше
+бюджета. Telegram подменяется заглушкой, Redis — BENCH_REDIS_URL или fakeredis.
+
+    python -m benchmarks.update_roundtrips
+"""
+import asyncio
+import os
+import sys
+from types import SimpleNamespace
+
+from benchmarks._redis import redis_url
+
+os.environ.setdefault("TELEGRAM_TOKEN", "0:bench")
+os.environ["REDIS_URL"] = redis_url()
+
+from authorization.subscription import handle_buttons  # noqa: E402
+from utils.redis_client import redis_client, redis_pool  # noqa: E402
+from utils.translations import translations  # noqa: E402
+
+# Бюджет round-trip'ов на апдейт: загрузка контекста + один скрипт transition();
+# обычный текст (не кнопка) в Redis не ходит вообще
+BUDGET = {
+    "start_button": 2,
+    "stop_button": 2,
+    "free_button": 2,
+    "plain_text": 0,
+}
+TEXTS = {button: translations[button]["ru"] for button in BUDGET if button in translations}
+TEXTS["plain_text"] = "Привет"
+
+
+class StubBot:
+    async def send_message(self, **kwargs):
+        return None
+
+    async def send_invoice(self, **kwargs):
+        return None
+
+
+class StubSubscriptionManager:
+    def refresh_subscriptions(self, **kwargs):
+        return None
+
+
+def make_update(chat_id: int, text: str):
+    return SimpleNamespace(
+        message=SimpleNamespace(chat_id=chat_id, text=text),
+        effective_user=SimpleNamespace(language_code="ru"),
+        effective_chat=SimpleNamespace(id=chat_id),
+    )
+
+
+async def count_roundtrips(coro) -> int:
+    calls = 0
+    get_connection = redis_pool.get_connection
+
+    async def counting_get_connection(*args, **kwargs):
+        nonlocal calls
+        calls += 1
+        return await get_connection(*args, **kwargs)
+
+    redis_pool.get_connection = counting_get_connection
+    try:
+        await coro
+    finally:
+        redis_pool.get_connection = get_connection
+    return calls
+
+
+async def main():
+    context = SimpleNamespace(
+        bot=StubBot(),
+        application=SimpleNamespace(subscription_manager=StubSubscriptionManager()),
+    )
+    chat_id = 1001
+    await redis_client.hset(f"user:{chat_id}", mapping={"bot_status": "stopped", "subscription_end": "4000000000", "language": "ru"})
+
+    # Первый вызов transition() делает SCRIPT LOAD — меряем установившийся режим
+    for button in BUDGET:
+        await handle_buttons(make_update(chat_id, TEXTS[button]), context)
+
+    failed = False
+    for button, budget in BUDGET.items():
+        roundtrips = await count_roundtrips(handle_buttons(make_update(chat_id, TEXTS[button]), context))
+        status = "ok" if roundtrips <= budget else "OVER BUDGET"
+        failed |= roundtrips > budget
+        print(f"{button:<14} {roundtrips} round-trips (budget {budget})  {status}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -6,6 +6,68 @@ TELEGRAM_TOKEN = os.getenv("TELEGRAM_TOKEN")
 REDIS_URL = os.getenv("REDIS_URL")
 WEBHOOK_URL = f"https://{os.getenv('VERCEL_URL', 'localhost:3000')}/{TELEGRAM_TOKEN}"  # Vercel auto VERCEL_URL, fallback for local
 PORT = int(os.getenv("PORT", 3000))  # Vercel PORT auto
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "https://api.telegram.org/bot")  # свой Bot API сервер / заглушка в бенчмарках
+
+# Пул соединений Redis (общий для всех handlers)
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", 20))
+REDIS_POOL_TIMEOUT = float(os.getenv("REDIS_POOL_TIMEOUT", 5))  # сколько ждать свободное соединение, сек
+REDIS_SOCKET_TIMEOUT = float(os.getenv("REDIS_SOCKET_TIMEOUT", 5))
+
+# memory — лимиты Telegram на процесс; redis — глобальный лимит общий для всех воркеров
+RATE_LIMITER_BACKEND = os.getenv("RATE_LIMITER_BACKEND", "memory")
+
+# 1 — handlers только ставят сообщения в Redis Streams, отправляет OutboundDispatcher
+OUTBOUND_QUEUE = os.getenv("OUTBOUND_QUEUE", "0") == "1"
+OUTBOUND_WORKERS = int(os.getenv("OUTBOUND_WORKERS", 4))
+
+# 1 — /telegram-webhook кладёт апдейт в очередь и сразу отвечает 200, обрабатывают воркеры
+WEBHOOK_ACK_FAST = os.getenv("WEBHOOK_ACK_FAST", "0") == "1"
+UPDATE_QUEUE_SIZE = int(os.getenv("UPDATE_QUEUE_SIZE", 1000))
+UPDATE_WORKERS = int(os.getenv("UPDATE_WORKERS", 16))
+
+# Как часто снимать истёкшие подписки (сек)
+EXPIRY_SWEEP_INTERVAL = float(os.getenv("EXPIRY_SWEEP_INTERVAL", 60))
+
+# Уже отправленные объявления (monitoring.seen_listings): в каждом из SEEN_BUCKETS бакетов окна INACTIVITY_TTL
+# масштабируемый Bloom-фильтр — ступени от SEEN_INITIAL_CAPACITY объявлений, удваиваясь, до SEEN_CAPACITY
+# на бакет; доля ложных "уже видели" — SEEN_FP_RATE
+SEEN_CAPACITY = int(os.getenv("SEEN_CAPACITY", 1000))
+SEEN_INITIAL_CAPACITY = int(os.getenv("SEEN_INITIAL_CAPACITY", 64))
+SEEN_FP_RATE = float(os.getenv("SEEN_FP_RATE", 0.001))
+SEEN_BUCKETS = int(os.getenv("SEEN_BUCKETS", 4))
+
+# Источник объявлений (monitoring.ingestion); пустой — опрос выключен
+LISTINGS_SOURCE_URL = os.getenv("LISTINGS_SOURCE_URL", "")
+INGEST_INTERVAL = float(os.getenv("INGEST_INTERVAL", 30))  # сек между циклами опроса
+INGEST_CONCURRENCY = int(os.getenv("INGEST_CONCURRENCY", 4))  # одновременных запросов к источнику (и keep-alive соединений)
+INGEST_PAGE_SIZE = int(os.getenv("INGEST_PAGE_SIZE", 100))
+
+# Дайджест (monitoring.notifier): совпадения чата копятся до DIGEST_MAX_DELAY сек или DIGEST_MAX_ITEMS штук
+# и уходят одним сообщением; 0 — каждое объявление отдельным сообщением сразу
+DIGEST_MAX_DELAY = float(os.getenv("DIGEST_MAX_DELAY", 30))
+DIGEST_MAX_ITEMS = int(os.getenv("DIGEST_MAX_ITEMS", 10))
+
+# Шардирование подписчиков (monitoring.sharding): 0 — один воркер обрабатывает всех.
+# SHARD_WORKER_ID — стабильное имя узла (по нему же хранятся курсоры опроса), по умолчанию hostname-pid
+SHARD_COUNT = int(os.getenv("SHARD_COUNT", 0))
+SHARD_LEASE_TTL = float(os.getenv("SHARD_LEASE_TTL", 15))  # сек без heartbeat, после которых шарды воркера забирают другие
+SHARD_WORKER_ID = os.getenv("SHARD_WORKER_ID", "")
+
+# Логи (utils.logger): json — строка orjson на запись, text — человекочитаемый формат для локального запуска.
+# LOG_SAMPLE_RATES — "событие=доля,..." для частых событий; одно событие пишется не больше
+# LOG_DUPLICATE_LIMIT раз за LOG_DUPLICATE_WINDOW сек, остальные только считаются
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")
+LOG_SAMPLE_RATES = os.getenv("LOG_SAMPLE_RATES", "language_selected=0.01,cache_refreshed=0.1")
+LOG_DUPLICATE_LIMIT = int(os.getenv("LOG_DUPLICATE_LIMIT", 20))
+LOG_DUPLICATE_WINDOW = float(os.getenv("LOG_DUPLICATE_WINDOW", 10))
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", 10_000))  # записей в очереди на вывод; сверх — отбрасываются
+
+# Обновление кэша подписчиков из handlers (monitoring.subscription_manager): запросы за REFRESH_DEBOUNCE сек
+# собираются в одно перечитывание, пока оно идёт — копятся в следующее
+REFRESH_DEBOUNCE = float(os.getenv("REFRESH_DEBOUNCE", 0.05))
+
+# Сколько апдейтов обрабатывается одновременно (внутри одного чата — всегда по одному)
+MAX_CONCURRENT_UPDATES = int(os.getenv("MAX_CONCURRENT_UPDATES", 64))
 
 
 if not TELEGRAM_TOKEN:
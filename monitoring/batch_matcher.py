@@ -0,0 +1,171 @@
+# monitoring/batch_matcher.py
+import numpy as np
+from monitoring.filters import RANGE_FIELDS
+
+CHUNK_CELLS = 4_000_000  # максимум ячеек listing×subscriber в одной булевой матрице
+COMPACT_SHARE = 0.25  # доля мёртвых и дописанных строк, после которой колонки выгоднее пересобрать
+COMPACT_MIN = 1024  # на малых наборах пересборка дешёвая — не чаще, чем раз в столько изменений
+
+
+class FilterColumns:
+    """
+    Фильтры всех подписчиков колонками NumPy для пакетного сопоставления.
+
+    Подписчики отсортированы по (city, deal_type), так что корзина — это срез.
+    Районы хранятся битовыми масками uint64 по реестру районов (district -> бит),
+    числовые диапазоны — матрицами lows/highs формы (len(RANGE_FIELDS), n).
+
+    Изменения одного подписчика не пересобирают колонки: upsert() переписывает
+    его строку на месте, если корзина та же, иначе помечает строку мёртвой
+    (маска alive) и дописывает новую в хвост — хвостовые строки корзины
+    сопоставляются отдельным списком индексов. Когда мёртвых и дописанных
+    строк становится больше COMPACT_SHARE, needs_rebuild подсказывает владельцу
+    пересобрать колонки целиком.
+    """
+
+    def __init__(self, items):
+        items = sorted(items, key=lambda item: (item[1].city, item[1].deal_type))
+        n = len(items)
+        self.chat_ids = np.fromiter((chat_id for chat_id, _ in items), dtype=np.int64, count=n)
+        self.own_ads = np.fromiter((flt.own_ads for _, flt in items), dtype=bool, count=n)
+        ranges = np.array([flt.bounds for _, flt in items], dtype=np.float64).reshape(n, len(RANGE_FIELDS), 2)
+        self.lows = np.ascontiguousarray(ranges[:, :, 0].T)
+        self.highs = np.ascontiguousarray(ranges[:, :, 1].T)
+        self.alive = np.ones(n, dtype=bool)
+
+        self.district_bits = {}
+        for _, flt in items:
+            for district in flt.districts:
+                self.district_bits.setdefault(district, len(self.district_bits))
+        self.district_masks = np.zeros((n, max(1, -(-len(self.district_bits) // 64))), dtype=np.uint64)
+        self.any_district = np.zeros(n, dtype=bool)
+        self.buckets = {}  # (city, deal_type) -> (start, stop) в отсортированной части
+        self.rows = {}  # chat_id -> (строка, корзина) живых подписчиков
+        for row, (chat_id, flt) in enumerate(items):
+            if not flt.districts:
+                self.any_district[row] = True
+            for district in flt.districts:
+                bit = self.district_bits[district]
+                self.district_masks[row, bit // 64] |= np.uint64(1 << (bit % 64))
+            key = (flt.city, flt.deal_type)
+            start, _ = self.buckets.get(key, (row, row))
+            self.buckets[key] = (start, row + 1)
+            self.rows[chat_id] = (row, key)
+        self.size = n  # занятые строки, включая мёртвые; массивы могут быть длиннее (запас под дописывание)
+        self.sorted_rows = n
+        self.dead = 0
+        self.tail = {}  # корзина -> дописанные строки
+
+    def __len__(self):
+        return len(self.rows)
+
+    @property
+    def needs_rebuild(self) -> bool:
+        changed = self.dead + self.size - self.sorted_rows
+        return changed > max(COMPACT_MIN, COMPACT_SHARE * self.sorted_rows)
+
+    def upsert(self, chat_id: int, flt):
+        """Новый или изменённый фильтр подписчика: O(1) без пересборки колонок."""
+        key = (flt.city, flt.deal_type)
+        entry = self.rows.get(chat_id)
+        if entry is not None:
+            row, old_key = entry
+            if old_key == key:
+                self._write_row(row, flt)
+                return
+            self._kill(row)
+        row = self.size
+        if row == len(self.chat_ids):
+            self._grow()
+        self.size += 1
+        self.chat_ids[row] = chat_id
+        self.alive[row] = True
+        self._write_row(row, flt)
+        self.rows[chat_id] = (row, key)
+        self.tail.setdefault(key, []).append(row)
+
+    def remove(self, chat_id: int):
+        entry = self.rows.pop(chat_id, None)
+        if entry is not None:
+            self._kill(entry[0])
+
+    def _kill(self, row: int):
+        self.alive[row] = False
+        self.dead += 1
+
+    def _write_row(self, row: int, flt):
+        self.own_ads[row] = flt.own_ads
+        self.lows[:, row] = flt.bounds[0::2]
+        self.highs[:, row] = flt.bounds[1::2]
+        self.any_district[row] = not flt.districts
+        self.district_masks[row] = 0
+        for district in flt.districts:
+            bit = self.district_bits.setdefault(district, len(self.district_bits))
+            if bit // 64 >= self.district_masks.shape[1]:
+                extra = np.zeros((len(self.district_masks), 1), dtype=np.uint64)
+                self.district_masks = np.hstack((self.district_masks, extra))
+            self.district_masks[row, bit // 64] |= np.uint64(1 << (bit % 64))
+
+    def _grow(self):
+        """Запас строк под дописывание — удвоением, как у list."""
+        extra = max(16, len(self.chat_ids))
+        self.chat_ids = np.concatenate((self.chat_ids, np.zeros(extra, dtype=np.int64)))
+        self.own_ads = np.concatenate((self.own_ads, np.zeros(extra, dtype=bool)))
+        self.alive = np.concatenate((self.alive, np.zeros(extra, dtype=bool)))
+        self.any_district = np.concatenate((self.any_district, np.zeros(extra, dtype=bool)))
+        self.lows = np.ascontiguousarray(np.hstack((self.lows, np.zeros((len(RANGE_FIELDS), extra)))))
+        self.highs = np.ascontiguousarray(np.hstack((self.highs, np.zeros((len(RANGE_FIELDS), extra)))))
+        self.district_masks = np.vstack((self.district_masks, np.zeros((extra, self.district_masks.shape[1]), dtype=np.uint64)))
+
+    def _district_ok(self, listings: list, rows: slice | np.ndarray) -> np.ndarray:
+        masks, any_district = self.district_masks[rows], self.any_district[rows]
+        result = np.empty((len(listings), len(any_district)), dtype=bool)
+        for i, listing in enumerate(listings):
+            bit = self.district_bits.get(str(listing.get("district")))
+            if bit is None:
+                result[i] = any_district
+            else:
+                in_district = (masks[:, bit // 64] >> np.uint64(bit % 64)) & np.uint64(1)
+                result[i] = in_district.astype(bool) | any_district
+        return result
+
+    def _match_chunk(self, listings: list, rows: slice | np.ndarray) -> np.ndarray:
+        values = np.array([[listing.get(field) for field in RANGE_FIELDS] for listing in listings], dtype=np.float64)
+        owner = np.array([bool(listing.get("owner")) for listing in listings])[:, None]
+        mask = self._district_ok(listings, rows)
+        mask &= self.alive[rows]
+        mask &= owner | ~self.own_ads[rows]
+        for i in range(len(RANGE_FIELDS)):
+            x = values[:, i:i + 1]
+            # Нет значения у объявления (NaN) — поле не фильтрует
+            mask &= ((self.lows[i, rows] <= x) & (x <= self.highs[i, rows])) | np.isnan(x)
+        return mask
+
+    def match_batch(self, listings: list):
+        """
+        Сопоставляет пачку объявлений со всеми фильтрами.
+
+        Возвращает разреженное множество совпадений в виде двух массивов одной
+        длины: индекс объявления в listings и chat_id подписчика.
+        """
+        groups = {}
+        for index, listing in enumerate(listings):
+            groups.setdefault((str(listing.get("city")), str(listing.get("deal_type"))), []).append(index)
+        listing_rows, chat_ids = [], []
+        for key, indices in groups.items():
+            segments = []  # срез отсортированной части и дописанные строки корзины
+            if key in self.buckets:
+                segments.append(slice(*self.buckets[key]))
+            if key in self.tail:
+                segments.append(np.asarray(self.tail[key], dtype=np.int64))
+            for rows in segments:
+                count = rows.stop - rows.start if isinstance(rows, slice) else len(rows)
+                step = max(1, CHUNK_CELLS // count)
+                for offset in range(0, len(indices), step):
+                    chunk = indices[offset:offset + step]
+                    hit_listing, hit_row = np.nonzero(self._match_chunk([listings[i] for i in chunk], rows))
+                    listing_rows.append(np.asarray(chunk, dtype=np.int64)[hit_listing])
+                    chat_ids.append(self.chat_ids[rows][hit_row])
+        if not listing_rows:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        return np.concatenate(listing_rows), np.concatenate(chat_ids)
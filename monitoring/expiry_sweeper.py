@@ -0,0 +1,135 @@
+# monitoring/expiry_sweeper.py
+import asyncio
+import time
+from authorization.catalog import keyboard
+from authorization.transitions import CHANGES_CHANNEL, EXPIRY_KEY
+from monitoring.subscriber_scan import scan_subscribers
+from utils.logger import logger
+from utils.outbound import PRIORITY_LOW, deliver
+from utils.redis_client import redis_client
+from utils.translations import translations
+from config import EXPIRY_SWEEP_INTERVAL
+
+SWEEP_BATCH = 100  # пользователей за один вызов скрипта
+BACKFILL_FLAG = f"{EXPIRY_KEY}:backfilled"
+
+# Снимает с подписки пачку пользователей, которых sweep() прочитал из индекса истечения
+# (ZRANGEBYSCORE). Все ключи передаются в KEYS: user:<id> каждого — с третьего.
+# Пользователь, которого уже снял другой инстанс или чей score успели обновить, пропускается;
+# если подписку продлили, а индекс отстал — обновляется только score.
+# KEYS: subscription_expiry, subscribed_users, user:<id>...; ARGV: now, канал изменений, chat_id... (ARGV[i] — к KEYS[i]).
+# Возвращает {chat_id, language, ...} снятых — для уведомления.
+SWEEP_LUA = """
+local expiry, subscribed = KEYS[1], KEYS[2]
+local now, channel = tonumber(ARGV[1]), ARGV[2]
+local expired = {}
+for i = 3, #KEYS do
+  local user, chat_id = KEYS[i], ARGV[i]
+  local score = tonumber(redis.call('ZSCORE', expiry, chat_id))
+  if score and score <= now then
+    local sub_end = tonumber(redis.call('HGET', user, 'subscription_end') or '0') or 0
+    if sub_end > now and redis.call('HGET', user, 'bot_status') == 'running' then
+      redis.call('ZADD', expiry, sub_end, chat_id)
+    else
+      redis.call('ZREM', expiry, chat_id)
+      redis.call('SREM', subscribed, chat_id)
+      if redis.call('EXISTS', user) == 1 then
+        redis.call('HSET', user, 'bot_status', 'stopped')
+        table.insert(expired, chat_id)
+        table.insert(expired, redis.call('HGET', user, 'language') or '')
+      end
+      redis.call('PUBLISH', channel, chat_id)
+    end
+  end
+end
+return expired
+"""
+
+_sweep_script = redis_client.register_script(SWEEP_LUA)
+
+
+class ExpirySweeper:
+    """
+    Фоновое снятие истёкших подписок по индексу subscription_expiry.
+
+    Раз в interval секунд забирает истёкших пачками по SWEEP_BATCH (скрипт
+    атомарен и перепроверяет score, так что несколько инстансов не обработают
+    одного пользователя дважды) и отправляет им stop_expired с клавиатурой "Старт" через
+    deliver() — с лимитами rate_limiter и низким приоритетом очереди.
+    """
+
+    def __init__(self, bot, interval: float = EXPIRY_SWEEP_INTERVAL):
+        self.bot = bot
+        self.interval = interval
+        self._task = None
+
+    async def start(self):
+        # Backfill — первым шагом фоновой задачи: старт процесса не ждёт SSCAN всех подписчиков
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def backfill(self):
+        """
+        Однократно заполняет индекс для подписчиков, добавленных до его появления.
+
+        Флаг ставится только после полного прохода: если процесс упадёт посреди
+        SSCAN, следующий старт пройдёт заново. Повтор безопасен — ZADD NX не
+        трогает записи, которые уже поставили transition() или прошлый проход.
+        """
+        if await redis_client.exists(BACKFILL_FLAG):
+            return
+        added = 0
+        async for batch in scan_subscribers(("subscription_end",)):
+            mapping = {chat_id: int(fields[0] or 0) for chat_id, fields in batch}
+            added += await redis_client.zadd(EXPIRY_KEY, mapping, nx=True)
+        await redis_client.set(BACKFILL_FLAG, 1)
+        logger.info(f"⏳ Backfilled {added} subscribers into {EXPIRY_KEY}")
+
+    async def sweep(self) -> int:
+        """Снимает всех истёкших на сейчас; возвращает число уведомлённых."""
+        notified = 0
+        while True:
+            now = int(time.time())
+            # Пачка из индекса O(log n + batch), затем атомарное снятие со всеми ключами в KEYS
+            due = await redis_client.zrangebyscore(EXPIRY_KEY, "-inf", now, start=0, num=SWEEP_BATCH)
+            if not due:
+                break
+            expired = await _sweep_script(
+                keys=[EXPIRY_KEY, "subscribed_users", *(f"user:{chat_id}" for chat_id in due)],
+                args=[now, CHANGES_CHANNEL, *due],
+            )
+            for chat_id, lang in zip(expired[::2], expired[1::2]):
+                lang = lang if lang in ("ru", "en") else "en"
+                try:
+                    await deliver(self.bot, "send_message", {
+                        "chat_id": int(chat_id),
+                        "text": translations['stop_expired'][lang],
+                        "reply_markup": keyboard("stopped", lang),
+                    }, priority=PRIORITY_LOW)
+                    notified += 1
+                except Exception as e:
+                    logger.warning("⚠️ Expiry notice to chat_id=%s failed: %s", chat_id, e, extra={"event": "expiry_notice_failed"})
+            if len(due) < SWEEP_BATCH:
+                break
+        if notified:
+            logger.info(f"⏳ Expired {notified} subscriptions")
+        return notified
+
+    async def _run(self):
+        backfilled = False
+        while True:
+            try:
+                if not backfilled:
+                    await self.backfill()
+                    backfilled = True
+                await self.sweep()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("❌ Expiry sweep error")
+            await asyncio.sleep(self.interval)
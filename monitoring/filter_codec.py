@@ -0,0 +1,258 @@
+# monitoring/filter_codec.py
+"""
+Компактное хранение фильтра подписчика в поле filter хэша user:<id>.
+
+Версия 2 — заголовок (struct _HEADER) с битами заданных границ, сами
+заданные границы zigzag-varint'ами и маска районов по реестру
+district_registry (district -> номер бита) следом, всё в base64: клиент
+Redis работает с decode_responses=True. Так значение почти всегда короче
+hash-max-listpack-value (64 байта) и хэш user:<id> остаётся listpack.
+Версия 1 — та же запись с границами фиксированной длины (struct _RECORD),
+только читается. Версия 0 — прежний JSON в поле settings; такие
+пользователи читаются как раньше и переводятся на текущую версию в
+SubscriptionManager.load_all().
+"""
+import base64
+import math
+import struct
+import sys
+import orjson
+from monitoring.filters import INF, RANGE_FIELDS, SubscriberFilter, NO_DISTRICTS, parse_filter
+from utils.redis_client import redis_client
+
+FILTER_VERSION = 2
+REGISTRY_KEY = "district_registry"
+# Потолок реестра: бит выдаётся навсегда, а клиент может прислать любой id района. 256 районов
+# держат маску в 32 байтах, а FilterColumns.district_masks — в 4 словах uint64 на подписчика
+MAX_REGISTRY_DISTRICTS = 256
+OWN_ADS = 0x01
+_UNSET = -2**31  # граница не задана
+_INT32_MAX = 2**31 - 1
+_OPEN_BOUNDS = (-INF, INF) * len(RANGE_FIELDS)  # чем заменяется _UNSET на месте low / high
+# v1: version u8, flags u8, city u16, deal_type u16, (low, high) int32 по RANGE_FIELDS; дальше — маска районов
+_RECORD = struct.Struct(f"<BBHH{2 * len(RANGE_FIELDS)}i")
+# v2: version u8, flags u8, city u16, deal_type u16, биты заданных границ u8; дальше varint'ы границ и маска районов
+_HEADER = struct.Struct("<BBHHB")
+
+# Выдаёт номера битов районам атомарно (следующий бит = HLEN), чтобы все процессы видели один реестр.
+# KEYS: реестр; ARGV: потолок реестра, затем районы. Возвращает номера битов в том же порядке,
+# -1 — реестр заполнен и новому району бит не выдан.
+ALLOCATE_LUA = """
+local limit = tonumber(ARGV[1])
+local bits = {}
+for i = 2, #ARGV do
+  local bit = redis.call('HGET', KEYS[1], ARGV[i])
+  if not bit then
+    bit = redis.call('HLEN', KEYS[1])
+    if bit < limit then
+      redis.call('HSET', KEYS[1], ARGV[i], bit)
+    else
+      bit = -1
+    end
+  end
+  bits[i - 1] = tonumber(bit)
+end
+return bits
+"""
+
+# Перевод пользователя с версии 0 на 1: только если settings не менялся с момента чтения
+# и filter ещё не записан (иначе его уже сохранил новый код). KEYS: user:<id>; ARGV: filter, прочитанный settings.
+MIGRATE_LUA = """
+if redis.call('HEXISTS', KEYS[1], 'filter') == 0 and redis.call('HGET', KEYS[1], 'settings') == ARGV[2] then
+  redis.call('HSET', KEYS[1], 'filter', ARGV[1])
+  redis.call('HDEL', KEYS[1], 'settings')
+  return 1
+end
+return 0
+"""
+_migrate_script = redis_client.register_script(MIGRATE_LUA)
+
+
+class UnknownDistrict(LookupError):
+    """В маске есть бит, которого нет в локальной копии реестра — нужен registry.load()."""
+
+
+class RegistryFull(ValueError):
+    """Реестр районов заполнен (MAX_REGISTRY_DISTRICTS), а в фильтре есть район без бита."""
+
+    def __init__(self, districts):
+        super().__init__(f"district registry is full, unknown districts: {sorted(districts)}")
+        self.districts = frozenset(districts)
+
+
+class DistrictRegistry:
+    """Локальная копия district_registry: район <-> бит маски."""
+
+    def __init__(self):
+        self.bits = {}  # district -> bit
+        self.names = []  # bit -> district (интернированная строка)
+        self._script = redis_client.register_script(ALLOCATE_LUA)
+
+    def _set(self, district: str, bit: int):
+        district = sys.intern(district)
+        self.bits[district] = bit
+        if bit >= len(self.names):
+            self.names.extend([None] * (bit + 1 - len(self.names)))
+        self.names[bit] = district
+
+    def apply(self, mapping: dict):
+        """Содержимое HGETALL district_registry (можно получить в чужом pipeline)."""
+        for district, bit in mapping.items():
+            self._set(district, int(bit))
+
+    async def load(self):
+        self.apply(await redis_client.hgetall(REGISTRY_KEY))
+
+    @property
+    def full(self) -> bool:
+        """Локальная копия уже заполнена: новые районы будут отклонены (решает Redis, копия может отставать)."""
+        return len(self.bits) >= MAX_REGISTRY_DISTRICTS
+
+    async def allocate(self, districts) -> frozenset:
+        """
+        Выдаёт биты новым районам в Redis за один round-trip (известные — без запросов).
+        Возвращает районы, которым бит не достался из-за потолка реестра.
+        """
+        missing = [district for district in districts if district not in self.bits]
+        rejected = []
+        if missing:
+            bits = await self._script(keys=[REGISTRY_KEY], args=[MAX_REGISTRY_DISTRICTS, *missing])
+            for district, bit in zip(missing, bits):
+                if int(bit) < 0:
+                    rejected.append(district)
+                else:
+                    self._set(district, int(bit))
+        return frozenset(rejected)
+
+    def mask(self, districts) -> int:
+        """Маска районов, уже получивших биты через allocate()/load()."""
+        mask = 0
+        for district in districts:
+            mask |= 1 << self.bits[district]
+        return mask
+
+    def districts(self, mask: int) -> frozenset | None:
+        """Районы по маске или None, если в маске есть бит, которого нет в локальной копии."""
+        if not mask:
+            return NO_DISTRICTS
+        if mask.bit_length() > len(self.names):
+            return None
+        names = self.names
+        result = []
+        while mask:
+            low = mask & -mask
+            name = names[low.bit_length() - 1]
+            if name is None:
+                return None
+            result.append(name)
+            mask ^= low
+        return frozenset(result)
+
+
+district_registry = DistrictRegistry()
+
+
+def _pack_bound(value: float, low: bool) -> int:
+    if value in (INF, -INF):
+        return _UNSET
+    # Дробные границы округляются наружу, чтобы фильтр не стал строже
+    value = math.floor(value) if low else math.ceil(value)
+    return max(_UNSET + 1, min(_INT32_MAX, value))
+
+
+def _write_varint(out: bytearray, value: int):
+    value = (value << 1) ^ (value >> 63)  # zigzag: маленькие отрицательные — тоже в 1-2 байта
+    while value >= 0x80:
+        out.append(value & 0x7F | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def encode_filter(flt: SubscriberFilter, mask: int) -> str:
+    """
+    Фильтр -> значение поля filter. ValueError, если город или тип сделки не канонические
+    числа (такой фильтр остаётся в JSON, версия 0).
+    """
+    if not all(value.isdigit() and str(int(value)) == value for value in (flt.city, flt.deal_type)):
+        raise ValueError(f"non-numeric city/deal_type: {flt.city!r}/{flt.deal_type!r}")
+    bounds = [_pack_bound(value, i % 2 == 0) for i, value in enumerate(flt.bounds)]
+    present = sum(1 << i for i, bound in enumerate(bounds) if bound != _UNSET)
+    try:
+        out = bytearray(_HEADER.pack(FILTER_VERSION, OWN_ADS if flt.own_ads else 0, int(flt.city), int(flt.deal_type), present))
+    except struct.error as e:
+        raise ValueError(f"city/deal_type out of range: {flt.city!r}/{flt.deal_type!r}") from e
+    for bound in bounds:
+        if bound != _UNSET:
+            _write_varint(out, bound)
+    out += mask.to_bytes((mask.bit_length() + 7) // 8, "little")
+    return base64.b64encode(out).decode()
+
+
+def decode_filter(value: str, registry: DistrictRegistry = district_registry) -> SubscriberFilter:
+    """Значение поля filter (версии 1 или 2) -> фильтр. UnknownDistrict — реестр нужно перечитать."""
+    raw = base64.b64decode(value)
+    if raw[0] == 2:
+        _, flags, city, deal_type, present = _HEADER.unpack_from(raw)
+        pos = _HEADER.size
+        bounds = []
+        for i, open_bound in enumerate(_OPEN_BOUNDS):
+            if not present >> i & 1:
+                bounds.append(open_bound)
+                continue
+            # zigzag varint, развёрнут здесь: decode — горячий путь полной загрузки подписчиков
+            bound = shift = 0
+            while True:
+                byte = raw[pos]
+                pos += 1
+                bound |= (byte & 0x7F) << shift
+                if byte < 0x80:
+                    break
+                shift += 7
+            bounds.append((bound >> 1) ^ -(bound & 1))
+        bounds = tuple(bounds)
+    elif raw[0] == 1:
+        _, flags, city, deal_type, *bounds = _RECORD.unpack_from(raw)
+        pos = _RECORD.size
+        bounds = tuple(open_bound if bound == _UNSET else bound for bound, open_bound in zip(bounds, _OPEN_BOUNDS))
+    else:
+        raise ValueError(f"unsupported filter version {raw[0]}")
+    districts = registry.districts(int.from_bytes(raw[pos:], "little"))
+    if districts is None:
+        raise UnknownDistrict(value)
+    return SubscriberFilter(sys.intern(str(city)), sys.intern(str(deal_type)), districts, bounds, bool(flags & OWN_ADS))
+
+
+async def storage_fields(settings: dict) -> dict:
+    """
+    Поля хэша user:<id> для сохранения settings через transition("settings").
+    Пустое значение — удалить поле: остаётся только одна версия фильтра.
+    RegistryFull — в settings районы, которых нет в заполненном реестре.
+    """
+    flt = parse_filter(settings)
+    rejected = await district_registry.allocate(flt.districts)
+    if rejected:
+        raise RegistryFull(rejected)
+    try:
+        return {"filter": encode_filter(flt, district_registry.mask(flt.districts)), "settings": ""}
+    except ValueError:
+        return {"settings": orjson.dumps(settings), "filter": ""}
+
+
+async def migrate_legacy(items: list) -> int:
+    """
+    Переводит пользователей версии 0 на текущую версию одним pipeline.
+    items: (chat_id, прочитанный JSON settings, разобранный фильтр). Возвращает число переведённых.
+    """
+    rejected = await district_registry.allocate({district for _, _, flt in items for district in flt.districts})
+    pipe = redis_client.pipeline(transaction=False)
+    queued = 0
+    for chat_id, settings, flt in items:
+        if rejected and not rejected.isdisjoint(flt.districts):
+            continue  # районов нет в заполненном реестре — остаётся JSON
+        try:
+            encoded = encode_filter(flt, district_registry.mask(flt.districts))
+        except ValueError:
+            continue
+        await _migrate_script(keys=[f"user:{chat_id}"], args=[encoded, settings], client=pipe)
+        queued += 1
+    return sum(await pipe.execute()) if queued else 0
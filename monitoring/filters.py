@@ -0,0 +1,80 @@
+# monitoring/filters.py
+"""
+Фильтры подписчика из settings (authorization/webhook.py) и проверка объявления.
+
+Объявление — dict с ключами id, city, district, deal_type, price, floor,
+rooms, bedrooms, owner (bool). Отсутствующее числовое значение фильтр не режет.
+"""
+import sys
+
+INF = float("inf")
+RANGE_FIELDS = ("price", "floor", "rooms", "bedrooms")
+
+
+def _bound(value, default: float) -> float:
+    if value is None or value == "":
+        return default
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return default
+
+
+class SubscriberFilter:
+    """
+    Разобранный фильтр подписчика. __slots__ вместо dict, строки городов/районов
+    интернированы, а границы лежат одним плоским кортежем:
+    bounds = (low, high) по RANGE_FIELDS подряд.
+    """
+
+    __slots__ = ("city", "deal_type", "districts", "bounds", "own_ads")
+
+    def __init__(self, city: str, deal_type: str, districts: frozenset, bounds: tuple, own_ads: bool):
+        self.city = city
+        self.deal_type = deal_type
+        self.districts = districts
+        self.bounds = bounds
+        self.own_ads = own_ads
+
+    def __eq__(self, other):
+        if not isinstance(other, SubscriberFilter):
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name) for name in self.__slots__)
+
+    def __repr__(self):
+        return f"SubscriberFilter({', '.join(f'{name}={getattr(self, name)!r}' for name in self.__slots__)})"
+
+
+NO_DISTRICTS = frozenset()
+
+
+def parse_filter(settings: dict) -> SubscriberFilter:
+    """settings (строки из WebApp) -> нормализованный фильтр с числовыми границами."""
+    districts = settings.get("districts")
+    return SubscriberFilter(
+        sys.intern(str(settings.get("city") or "")),
+        sys.intern(str(settings.get("deal_type") or "")),
+        frozenset(sys.intern(str(d)) for d in districts) if districts else NO_DISTRICTS,
+        tuple(
+            bound
+            for field in RANGE_FIELDS
+            for bound in (_bound(settings.get(f"{field}_from"), -INF), _bound(settings.get(f"{field}_to"), INF))
+        ),
+        str(settings.get("own_ads")) == "1",
+    )
+
+
+def matches(flt: SubscriberFilter, listing: dict) -> bool:
+    """Эталонная проверка одного фильтра (для линейного прохода и досмотра кандидатов индекса)."""
+    if flt.city != str(listing.get("city")) or flt.deal_type != str(listing.get("deal_type")):
+        return False
+    if flt.districts and str(listing.get("district")) not in flt.districts:
+        return False
+    if flt.own_ads and not listing.get("owner"):
+        return False
+    bounds = flt.bounds
+    for i, field in enumerate(RANGE_FIELDS):
+        value = listing.get(field)
+        if value is not None and not bounds[2 * i] <= value <= bounds[2 * i + 1]:
+            return False
+    return True
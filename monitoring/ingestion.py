@@ -0,0 +1,166 @@
+# monitoring/ingestion.py
+"""
+Опрос источника объявлений и передача новых объявлений в матчер.
+
+Источник — HTTP JSON API (LISTINGS_SOURCE_URL):
+
+    GET {url}?city=<city>&deal_type=<deal_type>&limit=<n>[&after=<cursor>]
+    -> {"items": [объявление, ...], "cursor": "<курсор последнего из items>"}
+
+С after отдаются объявления новее курсора от старых к новым, без after —
+самая свежая страница. Поля объявления — как в monitoring.filters плюс
+необязательные url и title.
+"""
+import asyncio
+import sys
+import httpx
+import orjson
+from utils.logger import logger
+from utils.redis_client import redis_client
+from config import LISTINGS_SOURCE_URL, INGEST_INTERVAL, INGEST_CONCURRENCY, INGEST_PAGE_SIZE
+
+CURSORS_KEY = "ingest:cursors"  # hash "<city>:<deal_type>" -> курсор источника
+REQUEST_TIMEOUT = 10  # сек на запрос к источнику
+NUMERIC_FIELDS = ("price", "floor", "rooms", "bedrooms")
+
+
+def _number(value):
+    if value is None or value == "":
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_listing(raw: dict) -> dict | None:
+    """Объявление источника -> dict для матчера (числа float, строки интернированы) или None, если нет id."""
+    if not isinstance(raw, dict) or raw.get("id") in (None, ""):
+        return None
+    listing = {
+        "id": str(raw["id"]),
+        "city": sys.intern(str(raw.get("city") or "")),
+        "district": sys.intern(str(raw.get("district") or "")),
+        "deal_type": sys.intern(str(raw.get("deal_type") or "")),
+        "owner": bool(raw.get("owner")),
+        "url": raw.get("url") or "",
+        "title": raw.get("title") or "",
+    }
+    for field in NUMERIC_FIELDS:
+        listing[field] = _number(raw.get(field))
+    return listing
+
+
+class ListingPoller:
+    """
+    Фоновый опрос источника по всем (city, deal_type), на которые кто-то подписан.
+
+    Каждый цикл (раз в interval секунд) идёт только за объявлениями новее
+    сохранённого в CURSORS_KEY курсора. Ленты опрашиваются параллельно, но
+    не больше concurrency запросов сразу, а страницы одной ленты — по очереди.
+    Один httpx.AsyncClient с keep-alive пулом на весь процесс. Каждая страница
+    сразу сопоставляется с подписчиками (match_batch) и уходит в
+    sink(listings, listing_rows, chat_ids); курсор сдвигается только после
+    sink, так что при сбое страница придёт ещё раз (повторы отсекает
+    SeenListings). Лента без курсора сначала только запоминает курсор свежей
+    страницы — историю подписчикам не рассылаем. При шардировании у каждого
+    воркера свои подписчики, а значит и свои курсоры (cursors_key).
+    """
+
+    def __init__(self, manager, sink, source_url: str = LISTINGS_SOURCE_URL, interval: float = INGEST_INTERVAL,
+                 concurrency: int = INGEST_CONCURRENCY, page_size: int = INGEST_PAGE_SIZE, cursors_key: str = CURSORS_KEY):
+        self.manager = manager
+        self.sink = sink
+        self.source_url = source_url
+        self.interval = interval
+        self.concurrency = concurrency
+        self.page_size = page_size
+        self.cursors_key = cursors_key
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._client = None
+        self._task = None
+
+    async def start(self):
+        self._client = httpx.AsyncClient(
+            timeout=REQUEST_TIMEOUT,
+            limits=httpx.Limits(max_connections=self.concurrency, max_keepalive_connections=self.concurrency),
+        )
+        self._task = asyncio.create_task(self._run())
+        logger.info(f"🛰 Listing poller started: {self.source_url}, every {self.interval}s")
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def feeds(self) -> list:
+        """(city, deal_type), на которые есть подписчики."""
+        return sorted({(sub["filter"].city, sub["filter"].deal_type) for sub in self.manager.subscribers.values()})
+
+    async def poll(self) -> int:
+        """Один цикл по всем лентам; возвращает число новых объявлений."""
+        feeds = self.feeds()
+        cursors = await redis_client.hgetall(self.cursors_key)
+        results = await asyncio.gather(
+            *(self.poll_feed(city, deal_type, cursors.get(f"{city}:{deal_type}")) for city, deal_type in feeds),
+            return_exceptions=True,
+        )
+        total = 0
+        for (city, deal_type), result in zip(feeds, results):
+            if isinstance(result, Exception):
+                logger.warning(f"⚠️ Polling {city}:{deal_type} failed: {result!r}")
+            else:
+                total += result
+        return total
+
+    async def poll_feed(self, city: str, deal_type: str, cursor: str | None) -> int:
+        field = f"{city}:{deal_type}"
+        if cursor is None:
+            page = await self._fetch(city, deal_type, None)
+            if page.get("cursor"):
+                await redis_client.hset(self.cursors_key, field, page["cursor"])
+            return 0
+        total = 0
+        while True:
+            page = await self._fetch(city, deal_type, cursor)
+            items = page.get("items") or []
+            listings = [listing for listing in map(parse_listing, items) if listing is not None]
+            if listings:
+                listing_rows, chat_ids = self.manager.match_batch(listings)
+                if len(chat_ids):
+                    await self.sink(listings, listing_rows, chat_ids)
+                total += len(listings)
+            next_cursor = page.get("cursor") or (str(items[-1].get("id")) if items else None)
+            if not next_cursor or next_cursor == cursor:
+                return total
+            cursor = next_cursor
+            await redis_client.hset(self.cursors_key, field, cursor)
+            if len(items) < self.page_size:
+                return total
+
+    async def _fetch(self, city: str, deal_type: str, cursor: str | None) -> dict:
+        params = {"city": city, "deal_type": deal_type, "limit": self.page_size}
+        if cursor is not None:
+            params["after"] = cursor
+        async with self._semaphore:
+            response = await self._client.get(self.source_url, params=params)
+        response.raise_for_status()
+        return orjson.loads(response.content)
+
+    async def _run(self):
+        # Пока кэш подписчиков не загружен, сопоставлять не с кем: курсоры ушли бы вперёд мимо них
+        await self.manager.ready.wait()
+        while True:
+            try:
+                new = await self.poll()
+                if new:
+                    logger.info(f"🛰 Ingested {new} new listings")
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("❌ Listing poll error")
+            await asyncio.sleep(self.interval)
@@ -0,0 +1,173 @@
+# monitoring/matcher.py
+from bisect import bisect_right
+from monitoring.filters import SubscriberFilter
+
+_ANY = object()  # ключ "все районы города" в индексе районов
+
+
+def build_interval_tree(intervals: list):
+    """
+    Статическое центрированное дерево интервалов по (low, high, chat_id).
+
+    Узел: [center, lows, ids_by_low, neg_highs, ids_by_high, left, right];
+    интервалы узла отсортированы по low и по убыванию high, чтобы запрос
+    отрезал нужную часть одним bisect и срезом списка.
+    """
+    if not intervals:
+        return None
+    endpoints = sorted(x for low, high, _ in intervals for x in (low, high) if x not in (float("inf"), float("-inf")))
+    if not endpoints:
+        center = 0.0
+    else:
+        center = endpoints[len(endpoints) // 2]
+    left, right, here = [], [], []
+    for interval in intervals:
+        if interval[1] < center:
+            left.append(interval)
+        elif interval[0] > center:
+            right.append(interval)
+        else:
+            here.append(interval)
+    by_low = sorted(here, key=lambda iv: iv[0])
+    by_high = sorted(here, key=lambda iv: -iv[1])
+    return [
+        center,
+        [iv[0] for iv in by_low], [iv[2] for iv in by_low],
+        [-iv[1] for iv in by_high], [iv[2] for iv in by_high],
+        build_interval_tree(left), build_interval_tree(right),
+    ]
+
+
+def stab(node, x: float) -> list:
+    """chat_id всех интервалов, содержащих x: O(log n + k)."""
+    hits = []
+    while node is not None:
+        center, lows, ids_by_low, neg_highs, ids_by_high, left, right = node
+        if x < center:
+            hits += ids_by_low[:bisect_right(lows, x)]
+            node = left
+        elif x > center:
+            hits += ids_by_high[:bisect_right(neg_highs, -x)]
+            node = right
+        else:
+            hits += ids_by_low
+            break
+    return hits
+
+
+class _Bucket:
+    """
+    Подписчики одного (city, deal_type): обратный индекс по районам и для
+    каждого района (и "все районы") своё дерево интервалов цены.
+    """
+
+    __slots__ = ("filters", "residual", "districts", "_trees")
+
+    def __init__(self):
+        self.filters = {}  # chat_id -> фильтр
+        self.residual = {}  # chat_id -> (own_ads, границы RANGE_FIELDS по порядку) для досмотра кандидатов
+        self.districts = {}  # district | _ANY -> set(chat_id)
+        self._trees = {}  # district | _ANY -> дерево цен, строится лениво
+
+    def add(self, chat_id: int, flt: SubscriberFilter):
+        self.filters[chat_id] = flt
+        self.residual[chat_id] = (flt.own_ads,) + flt.bounds
+        for district in flt.districts or (_ANY,):
+            self.districts.setdefault(district, set()).add(chat_id)
+            self._trees.pop(district, None)
+
+    def remove(self, chat_id: int):
+        flt = self.filters.pop(chat_id)
+        del self.residual[chat_id]
+        for district in flt.districts or (_ANY,):
+            members = self.districts[district]
+            members.discard(chat_id)
+            if not members:
+                del self.districts[district]
+            self._trees.pop(district, None)
+
+    def _candidates(self, district, price) -> list:
+        members = self.districts.get(district)
+        if not members:
+            return []
+        if price is None or len(members) < 32:
+            # Маленький район дешевле досмотреть целиком
+            return list(members)
+        tree = self._trees.get(district)
+        if tree is None:
+            filters = self.filters
+            tree = self._trees[district] = build_interval_tree(
+                [(filters[chat_id].bounds[0], filters[chat_id].bounds[1], chat_id) for chat_id in members]
+            )
+        return stab(tree, price)
+
+    def candidates(self, listing: dict) -> list:
+        price = listing.get("price")
+        return self._candidates(str(listing.get("district")), price) + self._candidates(_ANY, price)
+
+
+class SubscriberIndex:
+    """
+    Индекс фильтров подписчиков для match(listing) -> chat_ids.
+
+    Корзины по (city, deal_type), внутри — множества по районам, а в каждом
+    районе дерево интервалов по цене. Кандидаты (район + цена) досматриваются
+    по остальным полям (та же логика, что monitoring.filters.matches). Дерево района перестраивается лениво после его изменений.
+    """
+
+    def __init__(self):
+        self._buckets = {}  # (city, deal_type) -> _Bucket
+        self._keys = {}  # chat_id -> (city, deal_type)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def add(self, chat_id: int, flt: SubscriberFilter):
+        if chat_id in self._keys:
+            self.remove(chat_id)
+        key = (flt.city, flt.deal_type)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = _Bucket()
+        bucket.add(chat_id, flt)
+        self._keys[chat_id] = key
+
+    def remove(self, chat_id: int):
+        key = self._keys.pop(chat_id, None)
+        if key is None:
+            return
+        bucket = self._buckets[key]
+        bucket.remove(chat_id)
+        if not bucket.filters:
+            del self._buckets[key]
+
+    def rebuild(self, items):
+        """Полная пересборка из (chat_id, фильтр)."""
+        self._buckets = {}
+        self._keys = {}
+        for chat_id, flt in items:
+            self.add(chat_id, flt)
+
+    def match(self, listing: dict) -> list:
+        bucket = self._buckets.get((str(listing.get("city")), str(listing.get("deal_type"))))
+        if bucket is None:
+            return []
+        # Город, сделка и район гарантированы индексом; досматриваем остальное без вызова matches()
+        owner = listing.get("owner")
+        price, floor, rooms, bedrooms = (listing.get("price"), listing.get("floor"), listing.get("rooms"), listing.get("bedrooms"))
+        residual = bucket.residual
+        result = []
+        for chat_id in bucket.candidates(listing):
+            own_ads, p_lo, p_hi, f_lo, f_hi, r_lo, r_hi, b_lo, b_hi = residual[chat_id]
+            if own_ads and not owner:
+                continue
+            if price is not None and not p_lo <= price <= p_hi:
+                continue
+            if floor is not None and not f_lo <= floor <= f_hi:
+                continue
+            if rooms is not None and not r_lo <= rooms <= r_hi:
+                continue
+            if bedrooms is not None and not b_lo <= bedrooms <= b_hi:
+                continue
+            result.append(chat_id)
+        return result
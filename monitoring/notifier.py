@@ -0,0 +1,123 @@
+# monitoring/notifier.py
+import asyncio
+from monitoring.seen_listings import SeenListings
+from utils.logger import logger
+from utils.outbound import PRIORITY_LOW, deliver
+from utils.translations import translations
+from config import DIGEST_MAX_DELAY, DIGEST_MAX_ITEMS
+
+MAX_MESSAGE_LENGTH = 4096  # лимит Telegram на текст одного сообщения
+
+
+def format_listing(listing: dict, lang: str) -> str:
+    price = listing.get("price")
+    return translations['new_listing'][lang].format(
+        title=listing.get("title") or listing["id"],
+        price=f"{price:,.0f}" if price is not None else "—",
+        url=listing.get("url") or "",
+    ).rstrip()
+
+
+def digest_messages(entries: list, lang: str) -> list:
+    """Тексты объявлений -> сообщения дайджеста: заголовок с числом и объявления, не длиннее MAX_MESSAGE_LENGTH."""
+    if len(entries) == 1:
+        return entries
+    messages = []
+    current = translations['digest_header'][lang].format(count=len(entries))
+    for entry in entries:
+        if len(current) + 2 + len(entry) > MAX_MESSAGE_LENGTH:
+            messages.append(current)
+            current = entry
+        else:
+            current = f"{current}\n\n{entry}"
+    messages.append(current)
+    return messages
+
+
+class ListingNotifier:
+    """
+    sink для ListingPoller: отсекает уже отправленные пары (chat_id, listing_id)
+    одним check_and_mark на страницу и шлёт новые совпадения через deliver()
+    с низким приоритетом.
+
+    С max_delay > 0 совпадения копятся по чату: первое открывает окно, и через
+    max_delay секунд (или сразу, как наберётся max_items) всё накопленное уходит
+    одним сообщением-дайджестом. Всплеск объявлений стоит чату одного вызова
+    Bot API вместо N, а лимиты rate_limiter (1 msg/s на чат, 30 msg/s всего)
+    тратятся на доставку, а не на ожидание. Отправка идёт в фоновых задачах,
+    так что опрос источника не ждёт лимитов.
+    """
+
+    def __init__(self, bot, manager, seen: SeenListings | None = None,
+                 max_delay: float = DIGEST_MAX_DELAY, max_items: int = DIGEST_MAX_ITEMS):
+        self.bot = bot
+        self.manager = manager
+        self.seen = seen or SeenListings()
+        self.max_delay = max_delay
+        self.max_items = max_items
+        self._pending = {}  # chat_id -> (lang, [тексты объявлений])
+        self._timers = {}  # chat_id -> задача отложенной отправки
+        self._sending = set()
+
+    def _language(self, chat_id: int) -> str:
+        sub = self.manager.subscribers.get(chat_id)
+        return sub["language"] if sub and sub["language"] in ("ru", "en") else "en"
+
+    async def __call__(self, listings: list, listing_rows, chat_ids) -> int:
+        """Возвращает число новых совпадений (отправленных сразу или поставленных в дайджест)."""
+        matches = list(zip(listing_rows.tolist(), chat_ids.tolist()))
+        fresh = await self.seen.check_and_mark((chat_id, listings[row]["id"]) for row, chat_id in matches)
+        accepted = 0
+        for (row, chat_id), new in zip(matches, fresh):
+            if not new:
+                continue
+            lang = self._language(chat_id)
+            text = format_listing(listings[row], lang)
+            if self.max_delay > 0:
+                self._add(chat_id, lang, text)
+                accepted += 1
+            elif await self._send(chat_id, text):
+                accepted += 1
+        return accepted
+
+    def _add(self, chat_id: int, lang: str, text: str):
+        _, entries = self._pending.setdefault(chat_id, (lang, []))
+        entries.append(text)
+        if len(entries) >= self.max_items:
+            self._flush(chat_id)
+        elif chat_id not in self._timers:
+            self._timers[chat_id] = asyncio.create_task(self._flush_later(chat_id))
+
+    def _flush(self, chat_id: int):
+        """Забирает накопленное по чату (синхронно, чтобы новые совпадения открыли новое окно) и отправляет в фоне."""
+        pending = self._pending.pop(chat_id, None)
+        timer = self._timers.pop(chat_id, None)
+        if timer is not None and timer is not asyncio.current_task():
+            timer.cancel()
+        if pending is not None:
+            task = asyncio.create_task(self._send_digest(chat_id, *pending))
+            self._sending.add(task)
+            task.add_done_callback(self._sending.discard)
+
+    async def _flush_later(self, chat_id: int):
+        await asyncio.sleep(self.max_delay)
+        self._flush(chat_id)
+
+    async def _send_digest(self, chat_id: int, lang: str, entries: list):
+        for text in digest_messages(entries, lang):
+            await self._send(chat_id, text)
+
+    async def _send(self, chat_id: int, text: str) -> bool:
+        try:
+            await deliver(self.bot, "send_message", {"chat_id": chat_id, "text": text}, priority=PRIORITY_LOW)
+            return True
+        except Exception as e:
+            logger.warning("⚠️ Listing notification to chat_id=%s failed: %s", chat_id, e, extra={"event": "listing_notification_failed"})
+            return False
+
+    async def stop(self):
+        """Отправляет всё накопленное, не дожидаясь окон."""
+        for chat_id in list(self._pending):
+            self._flush(chat_id)
+        if self._sending:
+            await asyncio.gather(*self._sending, return_exceptions=True)
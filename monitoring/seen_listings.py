@@ -0,0 +1,182 @@
+# monitoring/seen_listings.py
+import hashlib
+import math
+import time
+from authorization.transitions import INACTIVITY_TTL
+from utils.redis_client import redis_client
+from config import SEEN_CAPACITY, SEEN_INITIAL_CAPACITY, SEEN_FP_RATE, SEEN_BUCKETS
+
+HEADER_BITS = 32  # u32 в начале каждого бакета: сколько объявлений в нём отмечено
+
+# Проверка и отметка пачки (chat_id, listing_id) за один вызов.
+# KEYS: бакеты каждого чата подряд по `buckets` штук, текущий — первый.
+# ARGV: buckets, ttl, число ступеней, затем на каждую ступень: накопленная ёмкость, смещение, m, k;
+# затем на каждую пару: номер чата в KEYS (с 0), h1, h2. Позиция j-го бита ступени — смещение + (h1 + j*шаг) % m,
+# шаг = 1 + h2 % (m - 1): m простое, поэтому k позиций всегда разные.
+# Пара "уже видели", если все k битов стоят хотя бы в одной заполненной ступени хотя бы одного бакета;
+# иначе биты ставятся в ступени текущего бакета, куда попадает его счётчик.
+# Возвращает 1 — новое (отмечено), 0 — уже отправляли.
+CHECK_AND_MARK_LUA = """
+local buckets, ttl, nstages = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+local stages = {}
+for s = 1, nstages do
+  local base = 3 + (s - 1) * 4
+  stages[s] = {tonumber(ARGV[base + 1]), tonumber(ARGV[base + 2]), tonumber(ARGV[base + 3]), tonumber(ARGV[base + 4])}
+end
+local counts = {}
+local function count(key)
+  local n = counts[key]
+  if n == nil then
+    n = redis.call('BITFIELD', key, 'GET', 'u32', 0)[1]
+    counts[key] = n
+  end
+  return n
+end
+local function stage_of(n)
+  for s = 1, nstages do
+    if n < stages[s][1] then return s end
+  end
+  return nstages  -- сверх ёмкости — в последнюю ступень (растёт доля ошибок, не память)
+end
+local function has(key, st, h1, h2)
+  local step = 1 + h2 % (st[3] - 1)
+  for j = 0, st[4] - 1 do
+    if redis.call('GETBIT', key, st[2] + (h1 + j * step) % st[3]) == 0 then return false end
+  end
+  return true
+end
+local result, touched = {}, {}
+local i = 4 + nstages * 4
+while i <= #ARGV do
+  local base, h1, h2 = tonumber(ARGV[i]) * buckets, tonumber(ARGV[i + 1]), tonumber(ARGV[i + 2])
+  local seen = false
+  for b = 1, buckets do
+    local key = KEYS[base + b]
+    local n = count(key)
+    if n > 0 then
+      for s = 1, stage_of(n - 1) do
+        if has(key, stages[s], h1, h2) then seen = true break end
+      end
+    end
+    if seen then break end
+  end
+  if seen then
+    table.insert(result, 0)
+  else
+    local current = KEYS[base + 1]
+    local n = count(current)
+    local st = stages[stage_of(n)]
+    local step = 1 + h2 % (st[3] - 1)
+    for j = 0, st[4] - 1 do redis.call('SETBIT', current, st[2] + (h1 + j * step) % st[3], 1) end
+    counts[current] = n + 1
+    touched[current] = true
+    table.insert(result, 1)
+  end
+  i = i + 3
+end
+for key in pairs(touched) do
+  redis.call('BITFIELD', key, 'SET', 'u32', 0, math.min(counts[key], 4294967295))
+  redis.call('EXPIRE', key, ttl)
+end
+return result
+"""
+
+_check_and_mark_script = redis_client.register_script(CHECK_AND_MARK_LUA)
+
+
+def _next_prime(n: int) -> int:
+    """Наименьшее простое >= n (m ступени — десятки тысяч, перебора делителей хватает)."""
+    while any(n % d == 0 for d in range(2, math.isqrt(n) + 1)):
+        n += 1
+    return n
+
+
+class SeenListings:
+    """
+    Какие объявления уже отправлены пользователю: скользящее окно Bloom-фильтров
+    в битовых картах Redis вместо множества listing_id.
+
+    Окно (по умолчанию INACTIVITY_TTL) разбито на buckets бакетов по времени;
+    отметка пишется в текущий, проверка смотрит все. Бакет — масштабируемый
+    Bloom-фильтр: ступени на initial, 2*initial, 4*initial... объявлений
+    (всего capacity) лежат в одной битовой карте друг за другом, счётчик
+    в заголовке выбирает ступень для записи. Redis выделяет строку только до
+    последнего поставленного бита, поэтому бакет с n объявлениями занимает
+    память первых ступеней, покрывающих n, а не всего capacity.
+
+    Доля ошибок ступеней — fp_rate / buckets / 2, / 4, ..., так что ложное
+    "уже видели" по всему окну не чаще fp_rate. Сверх capacity объявлений
+    в бакете отметки идут в последнюю ступень: растёт доля ошибок этого
+    пользователя, но не память. Худший случай памяти — bytes_per_user
+    (все ступени во всех бакетах): при умолчаниях (SEEN_CAPACITY=1000,
+    SEEN_BUCKETS=4) это ~11 КБ на пользователя, ~1.1 ГБ на 100k, только если
+    каждый получает больше 448 объявлений в каждом бакете (~9 дней). Пользователь
+    с десятками объявлений за окно занимает ~150 Б на бакет.
+    Старые бакеты удаляет TTL Redis.
+    """
+
+    def __init__(self, capacity: int = SEEN_CAPACITY, fp_rate: float = SEEN_FP_RATE,
+                 buckets: int = SEEN_BUCKETS, window: int = INACTIVITY_TTL, initial: int = SEEN_INITIAL_CAPACITY):
+        self.fp_rate = fp_rate
+        per_bucket = fp_rate / buckets  # проверка смотрит все бакеты — ошибки складываются
+        self.stages = []  # (накопленная ёмкость, смещение в битах, m, k)
+        offset, total, size = HEADER_BITS, 0, initial
+        while total < capacity:
+            if capacity - total < 3 * size:
+                size = capacity - total  # остаток меньше двух ступеней — последняя ступень забирает его целиком
+            stage_fp = per_bucket / 2 ** (len(self.stages) + 1)  # сумма по ступеням < per_bucket
+            bits = _next_prime(math.ceil(-size * math.log(stage_fp) / math.log(2) ** 2))
+            total += size
+            self.stages.append((total, offset, bits, max(1, round(bits / size * math.log(2)))))
+            offset += bits
+            size *= 2
+        self.bits = offset  # бакет целиком, с заголовком
+        self.buckets = buckets
+        self.bucket_width = math.ceil(window / buckets)
+        self.ttl = window + self.bucket_width  # бакет живёт, пока попадает в окно
+        self._stage_args = [value for stage in self.stages for value in stage]
+
+    @property
+    def bytes_per_user(self) -> int:
+        """Худший случай: во всех бакетах заполнены все ступени."""
+        return self.buckets * math.ceil(self.bits / 8)
+
+    def bucket_bytes(self, listings: int) -> int:
+        """Байт бакета с listings отмеченными объявлениями (до конца ступени последнего из них)."""
+        if not listings:
+            return 0
+        for total, offset, bits, _ in self.stages:
+            if listings <= total:
+                return math.ceil((offset + bits) / 8)
+        return math.ceil(self.bits / 8)
+
+    @staticmethod
+    def hashes(listing_id) -> tuple:
+        """h1, h2 для двойного хеширования (32 бита: Lua считает в double без потери точности)."""
+        digest = hashlib.blake2b(str(listing_id).encode(), digest_size=8).digest()
+        return int.from_bytes(digest[:4], "little"), int.from_bytes(digest[4:], "little")
+
+    def keys(self, chat_id: int, now: float | None = None) -> list:
+        current = int((time.time() if now is None else now) // self.bucket_width)
+        return [f"seen:v2:{chat_id}:{current - b}" for b in range(self.buckets)]
+
+    async def check_and_mark(self, pairs, now: float | None = None) -> list:
+        """
+        pairs — (chat_id, listing_id), например весь результат match_batch.
+        Возвращает bool на каждую пару: True — не отправляли (и теперь отмечено),
+        False — уже отправляли. Один round-trip на всю пачку.
+        """
+        pairs = list(pairs)
+        if not pairs:
+            return []
+        slots = {}
+        keys = []
+        args = [self.buckets, self.ttl, len(self.stages), *self._stage_args]
+        for chat_id, listing_id in pairs:
+            slot = slots.get(chat_id)
+            if slot is None:
+                slot = slots[chat_id] = len(slots)
+                keys += self.keys(chat_id, now)
+            args.append(slot)
+            args += self.hashes(listing_id)
+        return [bool(flag) for flag in await _check_and_mark_script(keys=keys, args=args)]
@@ -0,0 +1,138 @@
+# monitoring/sharding.py
+import asyncio
+import os
+import socket
+import time
+from utils.logger import logger
+from utils.redis_client import redis_client
+from config import SHARD_COUNT, SHARD_LEASE_TTL, SHARD_WORKER_ID
+
+WORKERS_KEY = "shard:workers"  # zset worker_id -> время последнего heartbeat, мс
+LEASE_PREFIX = "shard:lease:"  # shard:lease:<n> = worker_id, PX ttl
+
+# Heartbeat воркера за один вызов: отмечается в WORKERS_KEY, выкидывает молчащих
+# дольше ttl, продлевает свои аренды в пределах честной доли ceil(shards / живых),
+# лишние отпускает (пришёл новый воркер), свободные (в т.ч. истёкшие у упавших) забирает до доли.
+# KEYS: workers, затем аренды shard:lease:0..shards-1; ARGV: worker_id, now_ms, ttl_ms.
+# Возвращает номера своих шардов.
+HEARTBEAT_LUA = """
+local workers = KEYS[1]
+local me = ARGV[1]
+local now, ttl, shards = tonumber(ARGV[2]), tonumber(ARGV[3]), #KEYS - 1
+redis.call('ZADD', workers, now, me)
+redis.call('ZREMRANGEBYSCORE', workers, '-inf', now - ttl)
+local fair = math.ceil(shards / redis.call('ZCARD', workers))
+local mine, free = {}, {}
+for i = 0, shards - 1 do
+  local key = KEYS[i + 2]
+  local owner = redis.call('GET', key)
+  if owner == me then
+    if #mine < fair then
+      redis.call('PEXPIRE', key, ttl)
+      table.insert(mine, i)
+    else
+      redis.call('DEL', key)
+    end
+  elseif not owner then
+    table.insert(free, i)
+  end
+end
+for _, i in ipairs(free) do
+  if #mine >= fair then break end
+  redis.call('SET', KEYS[i + 2], me, 'PX', ttl)
+  table.insert(mine, i)
+end
+return mine
+"""
+
+# Отпускает аренды воркера при остановке. KEYS: workers, затем аренды; ARGV: worker_id.
+RELEASE_LUA = """
+redis.call('ZREM', KEYS[1], ARGV[1])
+for i = 2, #KEYS do
+  if redis.call('GET', KEYS[i]) == ARGV[1] then redis.call('DEL', KEYS[i]) end
+end
+return 1
+"""
+
+_heartbeat_script = redis_client.register_script(HEARTBEAT_LUA)
+_release_script = redis_client.register_script(RELEASE_LUA)
+
+
+def shard_of(chat_id: int, shards: int) -> int:
+    """Jump consistent hash: при изменении числа шардов переезжает только ~1/shards чатов."""
+    key = chat_id & 0xFFFFFFFFFFFFFFFF
+    bucket, jump = -1, 0
+    while jump < shards:
+        bucket = jump
+        key = (key * 2862933555777941757 + 1) & 0xFFFFFFFFFFFFFFFF
+        jump = int((bucket + 1) * ((1 << 31) / ((key >> 33) + 1)))
+    return bucket
+
+
+class ShardLeases:
+    """
+    Какие шарды subscribed_users обрабатывает этот воркер.
+
+    chat_id раскладывается по shards виртуальным шардам (shard_of), шарды —
+    по живым воркерам через аренды в Redis с TTL. Heartbeat раз в ttl/3
+    продлевает свои аренды, отдаёт лишние новым воркерам и забирает шарды
+    упавших, когда истекут их аренды. Если Redis не отвечает дольше ttl,
+    воркер сам считает свои аренды потерянными. При изменении набора
+    вызывается on_change(owned).
+    """
+
+    def __init__(self, worker_id: str | None = None, shards: int = SHARD_COUNT, ttl: float = SHARD_LEASE_TTL, on_change=None):
+        self.worker_id = worker_id or SHARD_WORKER_ID or f"{socket.gethostname()}-{os.getpid()}"
+        self.shards = shards
+        self.ttl = ttl
+        self.on_change = on_change
+        self.owned = frozenset()
+        self._keys = [WORKERS_KEY, *(f"{LEASE_PREFIX}{shard}" for shard in range(shards))]  # KEYS обоих скриптов
+        self._renewed = 0.0  # monotonic последнего успешного heartbeat
+        self._task = None
+
+    def owns(self, chat_id: int) -> bool:
+        return shard_of(int(chat_id), self.shards) in self.owned
+
+    async def start(self):
+        await self.heartbeat()
+        self._task = asyncio.create_task(self._run())
+        logger.info(f"🧩 Worker {self.worker_id} owns {len(self.owned)}/{self.shards} shards")
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await _release_script(keys=self._keys, args=[self.worker_id])
+        self.owned = frozenset()
+
+    async def heartbeat(self):
+        owned = await _heartbeat_script(
+            keys=self._keys,
+            args=[self.worker_id, int(time.time() * 1000), int(self.ttl * 1000)],
+        )
+        self._renewed = time.monotonic()
+        await self._set_owned(frozenset(int(shard) for shard in owned))
+
+    async def _set_owned(self, owned: frozenset):
+        if owned == self.owned:
+            return
+        gained, lost = len(owned - self.owned), len(self.owned - owned)
+        self.owned = owned
+        logger.info(f"🧩 Worker {self.worker_id}: +{gained} -{lost} shards, owns {len(owned)}/{self.shards}")
+        if self.on_change is not None:
+            await self.on_change(owned)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.ttl / 3)
+            try:
+                await self.heartbeat()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("❌ Shard heartbeat error")
+                if self.owned and time.monotonic() - self._renewed > self.ttl:
+                    # Аренды уже истекли и могли уйти другим воркерам
+                    await self._set_owned(frozenset())
@@ -0,0 +1,30 @@
+# monitoring/subscriber_scan.py
+from utils.redis_client import redis_client
+
+SCAN_BATCH = 1000  # chat_id за один SSCAN и один pipeline HMGET
+
+
+async def scan_subscribers(fields: tuple, batch_size: int = SCAN_BATCH, key: str = "subscribed_users", keep=None):
+    """
+    Потоково обходит key через SSCAN и отдаёт пачки [(chat_id, значения fields)].
+
+    На каждую пачку — SSCAN и один pipeline HMGET только нужных полей, так что
+    ни весь набор, ни все хэши сразу в памяти не держатся и Redis не блокируется
+    O(N)-командой. SSCAN может вернуть участника дважды — потребитель должен
+    быть к этому готов (например, складывать в dict по chat_id). keep(chat_id) —
+    необязательный отбор до HMGET (например, только свои шарды).
+    """
+    cursor = 0
+    while True:
+        cursor, members = await redis_client.sscan(key, cursor, count=batch_size)
+        if members:
+            chat_ids = [int(chat_id) for chat_id in members]
+            if keep is not None:
+                chat_ids = [chat_id for chat_id in chat_ids if keep(chat_id)]
+            if chat_ids:
+                pipe = redis_client.pipeline(transaction=False)
+                for chat_id in chat_ids:
+                    pipe.hmget(f"user:{chat_id}", fields)
+                yield list(zip(chat_ids, await pipe.execute()))
+        if cursor == 0:
+            return
@@ -0,0 +1,283 @@
+# monitoring/subscription_manager.py
+import asyncio
+import contextvars
+import time
+import orjson
+from redis.exceptions import ConnectionError as RedisConnectionError, TimeoutError as RedisTimeoutError
+from authorization.transitions import CHANGES_CHANNEL
+from monitoring.filters import parse_filter
+from monitoring.filter_codec import FILTER_VERSION, UnknownDistrict, decode_filter, district_registry, migrate_legacy
+from monitoring.matcher import SubscriberIndex
+from monitoring.subscriber_scan import SCAN_BATCH, scan_subscribers
+from utils import metrics
+from utils.logger import logger
+from utils.redis_client import redis_client
+from config import REFRESH_DEBOUNCE
+
+SUBSCRIBER_FIELDS = ("bot_status", "subscription_end", "filter", "settings", "language")
+RECONNECT_DELAY = 1  # сек между попытками переподписаться на канал изменений
+LISTEN_TIMEOUT = 1  # сек ожидания одного сообщения из канала
+
+REFRESH_REQUESTS = metrics.counter("subscription_refresh_requests_total", "Запросы обновления кэша подписчиков")
+REFRESH_BATCH = metrics.histogram("subscription_refresh_batch_chats", "chat_id в одном перечитывании кэша",
+                                  buckets=metrics.COUNT_BUCKETS)
+
+
+def parse_subscriber(fields: list) -> dict | None:
+    """
+    Значения SUBSCRIBER_FIELDS (HMGET) -> запись кэша или None, если пользователь не подписан.
+    Фильтр берётся из компактного поля filter, у ещё не переведённых — из JSON settings.
+    """
+    bot_status, subscription_end, encoded, settings, language = fields
+    if bot_status != "running":
+        return None
+    sub_end = int(subscription_end or 0)
+    if sub_end <= time.time():
+        return None
+    return {
+        "filter": decode_filter(encoded) if encoded else parse_filter(orjson.loads(settings) if settings else {}),
+        "language": language or "ru",
+        "subscription_end": sub_end,
+    }
+
+
+class SubscriptionManager:
+    """
+    In-process кэш запущенных подписчиков с разобранными settings.
+
+    Полная загрузка subscribed_users запускается в start() фоном — старт
+    процесса её не ждёт, а кто читает кэш, ждёт ready. Дальше кэш
+    обновляется по одному chat_id: transition() публикует chat_id в
+    CHANGES_CHANNEL, а менеджер перечитывает только этого пользователя.
+    Вместе с кэшем поддерживается SubscriberIndex для match(listing).
+    С shards (monitoring.sharding.ShardLeases) держит только подписчиков
+    своих шардов и перезагружается, когда набор шардов меняется.
+
+    Запросы обновления (refresh_subscriptions из handlers и сообщения канала)
+    не выполняются сразу: за REFRESH_DEBOUNCE сек они собираются в одно
+    перечитывание — один pipeline на все chat_id. Перечитывание одно на процесс:
+    запросы, пришедшие во время него, уходят в следующее.
+    """
+
+    def __init__(self, shards=None):
+        self.shards = shards
+        if shards is not None:
+            shards.on_change = self._on_shards_changed
+        self.subscribers = {}  # chat_id -> {"filter", "language", "subscription_end"}
+        self.index = SubscriberIndex()
+        self._columns = None  # FilterColumns: строятся лениво, дальше правятся по одной строке
+        self._listener = None
+        self._pending = set()  # chat_id, ждущие перечитывания
+        self._pending_all = False  # запрошена полная перезагрузка
+        self._batch = None  # Future следующего перечитывания: его ждут те, кому нужен результат
+        self._refresher = None  # задача, выполняющая перечитывания по очереди
+        self.ready = asyncio.Event()  # первая полная загрузка завершена
+
+    def __len__(self):
+        return len(self.subscribers)
+
+    def active_subscribers(self):
+        """(chat_id, запись) подписчиков, у которых подписка ещё не истекла."""
+        now = time.time()
+        return [(chat_id, sub) for chat_id, sub in self.subscribers.items() if sub["subscription_end"] > now]
+
+    def match(self, listing: dict) -> list:
+        """chat_id подписчиков, чьи фильтры подходят под объявление."""
+        now = time.time()
+        return [chat_id for chat_id in self.index.match(listing) if self.subscribers[chat_id]["subscription_end"] > now]
+
+    def match_batch(self, listings: list):
+        """Пакетное сопоставление страницы объявлений: (индексы объявлений, chat_id) совпадений."""
+        if self._columns is None or self._columns.needs_rebuild:
+            from monitoring.batch_matcher import FilterColumns  # NumPy грузится только при первом пакетном сопоставлении
+            self._columns = FilterColumns((chat_id, sub["filter"]) for chat_id, sub in self.subscribers.items())
+        listing_rows, chat_ids = self._columns.match_batch(listings)
+        now = time.time()
+        subscribers = self.subscribers
+        alive = [i for i, chat_id in enumerate(chat_ids.tolist()) if chat_id in subscribers and subscribers[chat_id]["subscription_end"] > now]
+        return listing_rows[alive], chat_ids[alive]
+
+    async def start(self):
+        # Подписываемся до загрузки, чтобы не потерять изменения, сделанные во время неё.
+        # Сама загрузка — первое перечитывание очереди: дельты, пришедшие во время SSCAN,
+        # применяются следующим перечитыванием поверх её снимка
+        pubsub = await self._subscribe()
+        self.refresh_subscriptions()
+        self._listener = asyncio.create_task(self._listen(pubsub))
+
+    async def stop(self):
+        if self._listener:
+            self._listener.cancel()
+            self._listener = None
+        if self._refresher is not None:
+            self._refresher.cancel()
+            self._refresher = None
+        if self._batch is not None:
+            self._batch.cancel()
+            self._batch = None
+
+    async def load_all(self):
+        """Холодная загрузка всего subscribed_users (старт или потеря pub/sub соединения)."""
+        started = time.perf_counter()
+        await district_registry.load()
+        subscribers = {}
+        legacy = {}
+        keep = self.shards.owns if self.shards is not None else None
+        async for batch in scan_subscribers(SUBSCRIBER_FIELDS, keep=keep):
+            for chat_id, fields in batch:
+                try:
+                    sub = parse_subscriber(fields)
+                except UnknownDistrict:
+                    # Бит района выдан уже после загрузки реестра
+                    await district_registry.load()
+                    sub = parse_subscriber(fields)
+                if sub is not None:
+                    subscribers[chat_id] = sub
+                    if not fields[2] and fields[3]:
+                        legacy[chat_id] = (chat_id, fields[3], sub["filter"])
+        self.subscribers = subscribers
+        self.index.rebuild((chat_id, sub["filter"]) for chat_id, sub in subscribers.items())
+        self._columns = None
+        self.ready.set()
+        logger.info(f"📦 Loaded {len(subscribers)} subscribers in {time.perf_counter() - started:.3f}s")
+        if legacy:
+            migrated = await migrate_legacy(list(legacy.values()))
+            logger.info(f"🗜 Migrated {migrated}/{len(legacy)} subscribers to compact filter v{FILTER_VERSION}")
+
+    async def _on_shards_changed(self, owned: frozenset):
+        # Перезагрузка — через очередь перечитываний, а не отдельной задачей: иначе её снимок,
+        # подменяющий кэш в конце load_all, затёр бы дельты, применённые во время SSCAN.
+        # heartbeat её не ждёт, иначе аренды истекут
+        self.refresh_subscriptions()
+
+    async def refresh_chat(self, chat_id: int):
+        """Перечитывает одного пользователя сразу, без очереди refresh_subscriptions."""
+        await self.refresh_chats((chat_id,))
+
+    async def refresh_chats(self, chat_ids):
+        """Перечитывает пользователей: HMGET + SISMEMBER на каждого, один pipeline на SCAN_BATCH chat_id."""
+        chat_ids = list(chat_ids)
+        if self.shards is not None:
+            # Чужие шарды обрабатывают другие воркеры
+            for chat_id in [chat_id for chat_id in chat_ids if not self.shards.owns(chat_id)]:
+                self._drop(chat_id)
+            chat_ids = [chat_id for chat_id in chat_ids if self.shards.owns(chat_id)]
+        for start in range(0, len(chat_ids), SCAN_BATCH):
+            chunk = chat_ids[start:start + SCAN_BATCH]
+            pipe = redis_client.pipeline(transaction=False)
+            for chat_id in chunk:
+                pipe.hmget(f"user:{chat_id}", SUBSCRIBER_FIELDS)
+                pipe.sismember("subscribed_users", chat_id)
+            replies = await pipe.execute()
+            for chat_id, fields, is_member in zip(chunk, replies[::2], replies[1::2]):
+                try:
+                    sub = parse_subscriber(fields) if is_member else None
+                except UnknownDistrict:
+                    # Район появился после нашей загрузки реестра
+                    await district_registry.load()
+                    sub = parse_subscriber(fields)
+                if sub is None:
+                    self._drop(chat_id)
+                else:
+                    self.subscribers[chat_id] = sub
+                    self.index.add(chat_id, sub["filter"])
+                    if self._columns is not None:
+                        self._columns.upsert(chat_id, sub["filter"])
+
+    def _drop(self, chat_id: int):
+        self.subscribers.pop(chat_id, None)
+        self.index.remove(chat_id)
+        if self._columns is not None:
+            self._columns.remove(chat_id)
+
+    def refresh_subscriptions(self, chat_ids=None) -> asyncio.Future:
+        """
+        Ставит обновление кэша в очередь и сразу возвращается: handler не ждёт Redis.
+
+        С chat_ids перечитываются только они, без них — полная перезагрузка
+        (поглощает и накопленные chat_id). Возвращает Future перечитывания,
+        в которое попал запрос: True — кэш обновлён, False — ошибка (она в логе).
+        Ждать его не обязательно.
+        """
+        REFRESH_REQUESTS.value += 1
+        if chat_ids is None:
+            self._pending_all = True
+        else:
+            self._pending.update(int(chat_id) for chat_id in chat_ids)
+        if self._batch is None:
+            self._batch = asyncio.get_running_loop().create_future()
+        if self._refresher is None:
+            # Чистый контекст: чтения кэша не засчитываются в метрики апдейта, запустившего задачу
+            self._refresher = asyncio.create_task(self._refresh_loop(), context=contextvars.Context())
+        return self._batch
+
+    async def _refresh_loop(self):
+        try:
+            while self._batch is not None:
+                await asyncio.sleep(REFRESH_DEBOUNCE)  # окно, в котором копятся запросы
+                batch, self._batch = self._batch, None
+                chat_ids, self._pending = self._pending, set()
+                full, self._pending_all = self._pending_all, False
+                started = time.perf_counter()
+                try:
+                    if full:
+                        await self.load_all()
+                    else:
+                        REFRESH_BATCH.observe(len(chat_ids))
+                        await self.refresh_chats(chat_ids)
+                except asyncio.CancelledError:
+                    batch.cancel()
+                    raise
+                except (RedisConnectionError, RedisTimeoutError) as e:
+                    # Изменения всё равно придут через канал или перезагрузку после переподписки
+                    logger.warning("⚠️ Subscription cache refresh failed: %s", e, extra={"event": "cache_refresh_failed"})
+                    batch.set_result(False)
+                    if full:
+                        await self._retry_full()
+                    continue
+                except Exception:
+                    logger.exception("❌ Subscription cache refresh error")
+                    batch.set_result(False)
+                    if full:
+                        await self._retry_full()
+                    continue
+                logger.info("🔄 Cache refreshed: %s in %.3fs", "all" if full else f"{len(chat_ids)} chats",
+                            time.perf_counter() - started, extra={"event": "cache_refreshed"})
+                batch.set_result(True)
+        finally:
+            self._refresher = None
+
+    async def _retry_full(self):
+        # Без повтора кэш остался бы неполным (на старте — пустым, и ready не наступил бы)
+        await asyncio.sleep(RECONNECT_DELAY)
+        self.refresh_subscriptions()
+
+    async def _subscribe(self):
+        pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+        await pubsub.subscribe(CHANGES_CHANNEL)
+        return pubsub
+
+    async def _listen(self, pubsub):
+        while True:
+            try:
+                if pubsub is None:
+                    pubsub = await self._subscribe()
+                    # Пока канал был недоступен, изменения могли потеряться. Перезагрузка — через
+                    # очередь, а не здесь: параллельно с ней дельты подменились бы её снимком
+                    self.refresh_subscriptions()
+                while True:
+                    # get_message с таймаутом, а не listen(): иначе простой канала упирается в socket_timeout пула
+                    message = await pubsub.get_message(timeout=LISTEN_TIMEOUT)
+                    if message is not None:
+                        # Тот же chat_id обычно уже запрошен handler'ом — оба запроса сольются в одно чтение
+                        self.refresh_subscriptions((message["data"],))
+            except (RedisConnectionError, RedisTimeoutError) as e:
+                logger.warning(f"⚠️ Subscription changes channel lost: {e}, resubscribing in {RECONNECT_DELAY}s")
+                if pubsub is not None:
+                    await pubsub.aclose()
+                    pubsub = None
+                await asyncio.sleep(RECONNECT_DELAY)
+            except asyncio.CancelledError:
+                if pubsub is not None:
+                    await pubsub.aclose()
+                raise
@@ -0,0 +1,35 @@
+# tests/conftest.py
+"""
+Общие фикстуры: Redis — BENCH_REDIS_URL или fakeredis TCP-сервер (как в бенчмарках,
+Lua через lupa), config читает окружение при импорте, поэтому оно задаётся здесь.
+Асинхронные тесты идут через плагин anyio (pytestmark = pytest.mark.anyio).
+"""
+import os
+
+import pytest
+
+from benchmarks._redis import redis_url
+
+os.environ.setdefault("TELEGRAM_TOKEN", "0:test")
+os.environ["REDIS_URL"] = redis_url()
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+async def redis():
+    """Пустая база на тест; соединения пула закрываются в цикле теста (у anyio свой цикл на тест)."""
+    from utils.redis_client import redis_client, redis_pool
+    await redis_client.flushdb()
+    yield redis_client
+    await redis_pool.disconnect()
+
+
+@pytest.fixture
+def no_rate_limit(monkeypatch):
+    """Снимает лимиты Telegram: тесты проверяют Redis и порядок, а не ожидание слотов."""
+    from utils import telegram_utils
+    monkeypatch.setattr(telegram_utils, "rate_limiter", telegram_utils.RateLimiter(10**9, 10**9))
@@ -0,0 +1,62 @@
+"""FilterColumns: правка строк (upsert/remove) даёт те же совпадения, что и попарный matches()."""
+import random
+
+from benchmarks._synthetic import make_listing, make_settings
+from monitoring.batch_matcher import FilterColumns
+from monitoring.filters import matches, parse_filter
+
+
+def _expected(filters: dict, listings: list) -> set:
+    return {(i, chat_id) for i, listing in enumerate(listings) for chat_id, flt in filters.items() if matches(flt, listing)}
+
+
+def _matched(columns: FilterColumns, listings: list) -> set:
+    listing_rows, chat_ids = columns.match_batch(listings)
+    return set(zip(listing_rows.tolist(), chat_ids.tolist()))
+
+
+def test_patched_rows_match_pairwise():
+    rng = random.Random(11)
+    listings = [make_listing(rng, i) for i in range(40)]
+    filters = {chat_id: parse_filter(make_settings(rng)) for chat_id in range(500)}
+    columns = FilterColumns(filters.items())
+
+    for step in range(600):
+        chat_id = rng.randrange(700)
+        if rng.random() < 0.2:
+            filters.pop(chat_id, None)
+            columns.remove(chat_id)
+        else:
+            filters[chat_id] = parse_filter(make_settings(rng))
+            columns.upsert(chat_id, filters[chat_id])
+        if step % 100 == 0:
+            assert _matched(columns, listings) == _expected(filters, listings)
+
+    assert len(columns) == len(filters)
+    assert columns.size > columns.sorted_rows and columns.dead > 0  # были и дописывания, и надгробия
+    assert _matched(columns, listings) == _expected(filters, listings)
+    assert _matched(FilterColumns(filters.items()), listings) == _expected(filters, listings)
+
+
+def test_new_district_widens_masks():
+    listing = {"city": "1", "deal_type": "1", "district": "new", "price": 100}
+    columns = FilterColumns([])
+    for chat_id in range(70):  # 70 районов — больше одного слова uint64
+        columns.upsert(chat_id, parse_filter({"city": "1", "deal_type": "1", "districts": {f"d{chat_id}": ""}}))
+    assert columns.district_masks.shape[1] == 2
+    assert _matched(columns, [listing]) == set()
+
+    columns.upsert(69, parse_filter({"city": "1", "deal_type": "1", "districts": {"new": ""}}))
+    assert _matched(columns, [listing]) == {(0, 69)}
+    assert _matched(columns, [{**listing, "district": "d69"}]) == set()
+
+
+def test_needs_rebuild_after_many_changes():
+    columns = FilterColumns([])
+    flt = parse_filter({"city": "1", "deal_type": "1"})
+    for chat_id in range(1000):
+        columns.upsert(chat_id, flt)
+    assert not columns.needs_rebuild
+    for chat_id in range(1000, 1100):
+        columns.upsert(chat_id, flt)
+    assert columns.needs_rebuild
@@ -0,0 +1,16 @@
+"""Шаблоны catalog общие для всех апдейтов: собираются один раз и не меняются вызовами."""
+import orjson
+import pytest
+
+from authorization.catalog import INVOICE_AMOUNT, INVOICES, LANGUAGES
+from utils.outbound import _serialize
+
+
+@pytest.mark.parametrize("lang", LANGUAGES)
+def test_invoice_template_is_shared_and_read_only(lang):
+    template = INVOICES[lang]
+    with pytest.raises(TypeError):
+        template["chat_id"] = 1
+    params = {**template, "chat_id": 1, "payload": "toggle_bot_status:1:stopped"}
+    assert "chat_id" not in template
+    assert orjson.loads(_serialize(params))["prices"] == [{"label": template["prices"][0]["label"], "amount": INVOICE_AMOUNT}]
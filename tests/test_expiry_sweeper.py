@@ -0,0 +1,63 @@
+# tests/test_expiry_sweeper.py
+import time
+
+import pytest
+
+from authorization.transitions import EXPIRY_KEY
+from monitoring import expiry_sweeper
+from monitoring.expiry_sweeper import ExpirySweeper
+
+pytestmark = pytest.mark.anyio
+
+
+class StubBot:
+    def __init__(self):
+        self.sent = []
+
+    async def send_message(self, **kwargs):
+        self.sent.append(kwargs)
+
+
+async def subscribe(redis, chat_id: int, sub_end: int, indexed_end: int | None = None, status: str = "running"):
+    await redis.hset(f"user:{chat_id}", mapping={"bot_status": status, "subscription_end": sub_end, "language": "en"})
+    await redis.sadd("subscribed_users", chat_id)
+    await redis.zadd(EXPIRY_KEY, {chat_id: sub_end if indexed_end is None else indexed_end})
+
+
+async def test_sweep_stops_expired_and_keeps_extended(redis, no_rate_limit, monkeypatch):
+    monkeypatch.setattr(expiry_sweeper, "SWEEP_BATCH", 2)  # несколько пачек
+    now = int(time.time())
+    for chat_id in (1, 2, 3):
+        await subscribe(redis, chat_id, now - 10)
+    await subscribe(redis, 4, now + 3600, indexed_end=now - 10)  # продлили, индекс отстал
+    await subscribe(redis, 5, now + 3600)
+    await redis.zadd(EXPIRY_KEY, {6: now - 10})  # хэш уже истёк по TTL
+
+    bot = StubBot()
+    assert await ExpirySweeper(bot).sweep() == 3
+    assert sorted(message["chat_id"] for message in bot.sent) == [1, 2, 3]
+    assert await redis.smembers("subscribed_users") == {"4", "5"}
+    assert await redis.hget("user:1", "bot_status") == "stopped"
+    assert await redis.zscore(EXPIRY_KEY, 4) == now + 3600
+    assert await redis.zcard(EXPIRY_KEY) == 2
+    assert await ExpirySweeper(bot).sweep() == 0  # повторный проход никого не трогает
+
+
+async def test_backfill_sets_flag_only_after_full_scan(redis, monkeypatch):
+    for chat_id in range(1, 6):
+        await redis.hset(f"user:{chat_id}", "subscription_end", 4_000_000_000)
+        await redis.sadd("subscribed_users", chat_id)
+
+    async def crashing_scan(fields):
+        yield [(1, ["4000000000"])]
+        raise ConnectionError("redeploy")
+
+    monkeypatch.setattr(expiry_sweeper, "scan_subscribers", crashing_scan)
+    with pytest.raises(ConnectionError):
+        await ExpirySweeper(StubBot()).backfill()
+    assert not await redis.exists(expiry_sweeper.BACKFILL_FLAG)
+
+    monkeypatch.undo()
+    await ExpirySweeper(StubBot()).backfill()
+    assert await redis.zcard(EXPIRY_KEY) == 5
+    assert await redis.exists(expiry_sweeper.BACKFILL_FLAG)
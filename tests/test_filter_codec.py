@@ -0,0 +1,98 @@
+"""Компактный filter: кодирование совпадает с parse_filter, реестр районов общий, миграция не затирает правки."""
+import base64
+import random
+
+import orjson
+import pytest
+
+from benchmarks._synthetic import make_settings
+from monitoring import filter_codec
+from authorization import payloads
+from authorization.payloads import PayloadError, decode_web_app_data
+from monitoring.filter_codec import (_RECORD, _UNSET, REGISTRY_KEY, DistrictRegistry, RegistryFull, UnknownDistrict,
+                                     decode_filter, encode_filter, migrate_legacy, storage_fields)
+from monitoring.filters import parse_filter
+
+pytestmark = pytest.mark.anyio
+
+
+def _same(a, b) -> bool:
+    return all(getattr(a, slot) == getattr(b, slot) for slot in a.__slots__)
+
+
+@pytest.fixture
+def registry(redis, monkeypatch):
+    """Свой реестр на тест: глобальный district_registry пережил бы flushdb."""
+    registry = DistrictRegistry()
+    monkeypatch.setattr(filter_codec, "district_registry", registry)
+    return registry
+
+
+async def test_roundtrip_fits_listpack(registry):
+    rng = random.Random(3)
+    for _ in range(500):
+        settings = make_settings(rng)
+        fields = await storage_fields(settings)
+        assert fields["settings"] == "" and len(fields["filter"]) <= 64
+        assert _same(decode_filter(fields["filter"], registry), parse_filter(settings))
+
+
+async def test_unknown_district_until_reload(registry):
+    fields = await storage_fields({"city": "1", "deal_type": "2", "districts": {"101": "", "102": ""}})
+    other = DistrictRegistry()  # другой процесс, реестр ещё не перечитан
+    with pytest.raises(UnknownDistrict):
+        decode_filter(fields["filter"], other)
+    await other.load()
+    assert decode_filter(fields["filter"], other).districts == {"101", "102"}
+
+
+async def test_fractional_bounds_round_outward_and_v1_reads(registry):
+    flt = decode_filter(encode_filter(parse_filter({"city": "1", "deal_type": "1", "price_from": "99.5", "price_to": "100.5"}), 0))
+    assert flt.bounds[:2] == (99, 101)
+
+    bounds = [_UNSET] * len(flt.bounds)
+    bounds[0], bounds[1] = 100, 200
+    v1 = base64.b64encode(_RECORD.pack(1, 1, 2, 1, *bounds)).decode()
+    old = decode_filter(v1, registry)
+    assert (old.city, old.deal_type, old.own_ads, old.bounds[:2]) == ("2", "1", True, (100, 200))
+
+
+async def test_non_numeric_city_stays_json(registry):
+    settings = {"city": "Tbilisi", "deal_type": "1"}
+    fields = await storage_fields(settings)
+    assert fields["filter"] == "" and orjson.loads(fields["settings"]) == settings
+
+
+async def test_migrate_skips_changed_settings(redis, registry):
+    settings = orjson.dumps({"city": "1", "deal_type": "1", "districts": {"105": ""}}).decode()
+    for chat_id in (1, 2):
+        await redis.hset(f"user:{chat_id}", "settings", settings)
+    stale = parse_filter(orjson.loads(settings))
+    await redis.hset("user:2", "settings", "{}")  # пользователь сохранил новые settings после чтения
+
+    assert await migrate_legacy([(1, settings, stale), (2, settings, stale)]) == 1
+    assert await redis.hget("user:1", "settings") is None
+    assert decode_filter(await redis.hget("user:1", "filter"), registry).districts == {"105"}
+    assert await redis.hgetall("user:2") == {"settings": "{}"}
+
+
+async def test_full_registry_rejects_new_districts(redis, registry, monkeypatch):
+    monkeypatch.setattr(filter_codec, "MAX_REGISTRY_DISTRICTS", 2)
+    monkeypatch.setattr(payloads, "district_registry", registry)
+    await storage_fields({"city": "1", "deal_type": "1", "districts": {"101": "", "102": ""}})
+    assert registry.full
+
+    with pytest.raises(RegistryFull) as e:
+        await storage_fields({"city": "1", "deal_type": "1", "districts": {"101": "", "103": ""}})
+    assert e.value.districts == {"103"}
+    assert sorted(await redis.hkeys(REGISTRY_KEY)) == ["101", "102"]
+    # Известные районы сохраняются как раньше, неизвестные отсекает уже разбор payload
+    assert (await storage_fields({"city": "1", "deal_type": "1", "districts": {"102": ""}}))["filter"]
+    data = orjson.dumps({"type": "settings", "city": 1, "deal_type": 1, "districts": {"104": "x"}}).decode()
+    with pytest.raises(PayloadError):
+        decode_web_app_data(data)
+
+    settings = orjson.dumps({"city": "1", "deal_type": "1", "districts": {"105": ""}}).decode()
+    await redis.hset("user:1", "settings", settings)
+    assert await migrate_legacy([(1, settings, parse_filter(orjson.loads(settings)))]) == 0
+    assert await redis.hgetall("user:1") == {"settings": settings}
@@ -0,0 +1,139 @@
+"""ListingPoller против локальной HTTP-заглушки источника: курсоры, страницы, keep-alive и повтор после сбоя sink."""
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+from monitoring.filters import parse_filter
+from monitoring.ingestion import ListingPoller
+from monitoring.subscription_manager import SubscriptionManager
+
+pytestmark = pytest.mark.anyio
+
+CURSORS = "test:cursors"
+
+
+class StubSource:
+    """Ленты "<city>:<deal_type>" -> объявления по возрастанию id; broken — ленты, отвечающие 500."""
+
+    def __init__(self):
+        self.feeds = {"1:1": [], "2:1": []}
+        self.broken = set()
+        self.requests = 0
+        self.connections = 0
+
+    def publish(self, feed: str, *ids: int):
+        self.feeds[feed] += [{"id": i, "city": feed[0], "deal_type": "1", "price": 100} for i in ids]
+
+    def page(self, query: dict) -> tuple[int, dict]:
+        feed = f"{query['city'][0]}:{query['deal_type'][0]}"
+        if feed in self.broken:
+            return 500, {}
+        limit = int(query["limit"][0])
+        if "after" in query:
+            items = [item for item in self.feeds[feed] if item["id"] > int(query["after"][0])][:limit]
+        else:
+            items = self.feeds[feed][-limit:]
+        return 200, {"items": items, "cursor": str(items[-1]["id"]) if items else query.get("after", [None])[0]}
+
+    def serve(self) -> tuple[str, ThreadingHTTPServer]:
+        source = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def setup(self):
+                source.connections += 1
+                super().setup()
+
+            def do_GET(self):
+                source.requests += 1
+                status, page = source.page(parse_qs(urlparse(self.path).query))
+                body = json.dumps(page).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return f"http://127.0.0.1:{server.server_address[1]}/listings", server
+
+
+@pytest.fixture
+async def poller(redis):
+    source = StubSource()
+    url, server = source.serve()
+    manager = SubscriptionManager()
+    manager.subscribers = {
+        10: {"filter": parse_filter({"city": "1", "deal_type": "1"}), "language": "ru", "subscription_end": 4_000_000_000},
+        20: {"filter": parse_filter({"city": "2", "deal_type": "1"}), "language": "ru", "subscription_end": 4_000_000_000},
+    }
+    delivered = []
+    failures = []
+
+    async def sink(listings, listing_rows, chat_ids):
+        error = failures.pop(0) if failures else None  # по одному исходу на вызов: None — успех
+        if error is not None:
+            raise error
+        delivered.extend((listings[row]["id"], chat_id) for row, chat_id in zip(listing_rows.tolist(), chat_ids.tolist()))
+
+    poller = ListingPoller(manager, sink, source_url=url, interval=3600, concurrency=2, page_size=2, cursors_key=CURSORS)
+    await poller.start()
+    poller._task.cancel()  # циклы запускаем вручную
+    poller.source, poller.delivered, poller.failures = source, delivered, failures
+    yield poller
+    await poller.stop()
+    server.shutdown()
+    server.server_close()
+
+
+async def test_pages_after_cursor_over_keep_alive(poller, redis):
+    source = poller.source
+    source.publish("1:1", 1, 2)
+    assert await poller.poll() == 0  # первая встреча с лентой: только курсор, история не рассылается
+    assert await redis.hget(CURSORS, "1:1") == "2"
+    assert poller.delivered == []
+
+    source.publish("1:1", 3, 4, 5, 6, 7)
+    source.publish("2:1", 1)
+    await poller.poll()  # у 2:1 курсора не было — запоминается; 1:1 — три страницы по 2
+    assert poller.delivered == [(str(i), 10) for i in range(3, 8)]
+    assert await redis.hgetall(CURSORS) == {"1:1": "7", "2:1": "1"}
+    assert source.connections <= 2  # пул keep-alive, а не соединение на запрос
+    assert source.requests >= 6
+
+
+async def test_failed_sink_redelivers_page(poller, redis):
+    source = poller.source
+    source.publish("1:1", 1)
+    await poller.poll()
+    source.publish("1:1", 2, 3, 4, 5)
+    poller.failures += [None, RuntimeError("send failed")]
+    await poller.poll()  # ошибка ленты логируется, цикл не падает
+    assert poller.delivered == [("2", 10), ("3", 10)]
+    assert await redis.hget(CURSORS, "1:1") == "3"  # страница 4, 5 не подтверждена — курсор на месте
+
+    assert await poller.poll() == 2
+    assert poller.delivered[2:] == [("4", 10), ("5", 10)]
+    assert await redis.hget(CURSORS, "1:1") == "5"
+
+
+async def test_broken_feed_does_not_block_others(poller, redis):
+    source = poller.source
+    source.publish("1:1", 1)
+    source.publish("2:1", 1)
+    await poller.poll()
+    source.broken.add("1:1")
+    source.publish("1:1", 2)
+    source.publish("2:1", 2)
+    assert await poller.poll() == 1
+    assert poller.delivered == [("2", 20)]
+    assert await redis.hget(CURSORS, "1:1") == "1"
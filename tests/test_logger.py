@@ -0,0 +1,56 @@
+# tests/test_logger.py
+import queue
+
+from utils.logger import BotLogger, EventFilter, LazyQueueHandler
+
+
+def make_logger(name: str, event_filter: EventFilter):
+    records = queue.Queue()
+    handler = LazyQueueHandler(records)
+    handler.addFilter(event_filter)
+    log = BotLogger(name)
+    log.event_filter = event_filter
+    log.addHandler(handler)
+    log.propagate = False
+    return log, records
+
+
+def drain(records: queue.Queue) -> list:
+    out = []
+    while not records.empty():
+        out.append(records.get_nowait())
+    return out
+
+
+def test_mutable_args_are_snapshotted():
+    log, records = make_logger("test_snapshot", EventFilter({}, limit=100, window=10))
+    settings, tags = {"a": 1}, ["x"]
+    log.info("settings %s", settings)
+    log.info("plain %s %d", "chat", 5)
+    log.info("extra", extra={"event": "e", "tags": tags})
+    settings["a"] = 2
+    tags.append("y")
+    snapshot, lazy, extra = drain(records)
+    assert snapshot.getMessage() == "settings {'a': 1}"
+    assert lazy.args == ("chat", 5)  # скаляры — форматирование остаётся в потоке вывода
+    assert extra.tags == ["x"]
+
+
+def test_dedupe_keeps_distinct_records_of_one_event():
+    log, records = make_logger("test_dedupe", EventFilter({}, limit=3, window=10))
+    for chat_id in range(10):
+        log.info("saved %s", chat_id, extra={"event": "settings_saved"})
+    for _ in range(10):
+        log.info("saved %s", 42, extra={"event": "settings_saved"})
+        log.warning("same call site")
+    written = drain(records)
+    assert sum(r.__dict__.get("event") == "settings_saved" for r in written) == 10 + 3
+    assert sum(r.msg == "same call site" for r in written) == 3
+
+
+def test_sampling_and_suppressed_count():
+    event_filter = EventFilter({"noisy": 0.1}, limit=2, window=10)
+    assert [event_filter.allow("noisy", 0) is not None for _ in range(20)].count(True) == 2
+    for now in (0, 1, 2, 3):
+        event_filter.allow("dup", now)
+    assert event_filter.allow("dup", 11) == 2  # первая запись нового окна несёт число подавленных
@@ -0,0 +1,95 @@
+"""POST /webhook от Netlify и web_app_data: ответы пользователю идут через deliver."""
+import types
+
+import orjson
+import pytest
+
+from api import webhook
+from authorization import webhook as web_app
+from authorization.payloads import MAX_WEB_APP_DATA, PayloadError, decode_web_app_data
+from utils.translations import translations
+
+pytestmark = pytest.mark.anyio
+
+
+class StubRequest:
+    def __init__(self, payload: dict):
+        self._body = orjson.dumps(payload)
+        self.headers = {"content-length": str(len(self._body))}
+
+    async def body(self):
+        return self._body
+
+
+@pytest.fixture
+def sent(monkeypatch):
+    calls = []
+
+    async def deliver(bot, method, params, priority=None):
+        calls.append((method, params))
+
+    async def save_user_data(chat_id, data):
+        calls.append(("save", data))
+
+    monkeypatch.setattr(webhook, "application", types.SimpleNamespace(bot=object()))
+    monkeypatch.setattr(webhook, "deliver", deliver)
+    monkeypatch.setattr(webhook, "save_user_data", save_user_data)
+    return calls
+
+
+async def test_filters_url_is_confirmed(sent):
+    result = await webhook.netlify_webhook(StubRequest({"chat_id": "42", "url": "https://example.com/f"}))
+    assert result == {"status": "filters saved"}
+    assert sent[0][0] == "save" and sent[0][1]["filters_url"] == "https://example.com/f"
+    assert sent[1] == ("send_message", {"chat_id": 42, "text": "✅ Фильтры сохранены!"})
+
+
+async def test_support_message_is_forwarded_and_confirmed(sent):
+    result = await webhook.netlify_webhook(StubRequest({"chat_id": 42, "supportMessage": " помогите "}))
+    assert result == {"status": "support sent"}
+    assert [params["chat_id"] for _, params in sent] == ["6770986953", 42]
+
+
+def test_web_app_data_limit_is_in_bytes():
+    text = "я" * (MAX_WEB_APP_DATA // 2)  # в символах влезает, в байтах UTF-8 — нет
+    data = orjson.dumps({"type": "support", "message": text}).decode()
+    assert len(data) < MAX_WEB_APP_DATA
+    with pytest.raises(PayloadError, match="bytes"):
+        decode_web_app_data(data)
+
+
+def web_app_update(chat_id: int, data: str):
+    return types.SimpleNamespace(
+        message=types.SimpleNamespace(web_app_data=types.SimpleNamespace(data=data)),
+        effective_user=types.SimpleNamespace(id=chat_id, language_code="ru", first_name="", username=None),
+    )
+
+
+@pytest.fixture
+def replies(monkeypatch):
+    calls = []
+
+    async def deliver(bot, method, params, priority=None):
+        calls.append(params["text"])
+
+    monkeypatch.setattr(web_app, "deliver", deliver)
+    return calls
+
+
+async def test_invalid_web_app_data_skips_user_context(redis, replies, monkeypatch):
+    async def load(chat_id):
+        raise AssertionError("HGETALL before the payload is decoded")
+
+    monkeypatch.setattr(web_app.UserContext, "load", load)
+    await redis.hset("user:42", "language", "en")
+    context = types.SimpleNamespace(bot=object())
+    await web_app.webhook_update(web_app_update(42, '{"type": "settings", "city": "x"'), context)
+    await web_app.webhook_update(web_app_update(42, '{"type": "other"}'), context)
+    assert replies == [translations["invalid_data"]["en"], translations["unknown_type"]["en"]]
+
+
+async def test_null_support_message_gets_empty_reply(redis, replies):
+    assert decode_web_app_data('{"type": "support", "message": null}').message == ""
+    await web_app.webhook_update(web_app_update(42, '{"type": "support", "message": null}'),
+                                 types.SimpleNamespace(bot=object()))
+    assert replies == [translations["support_empty"]["ru"]]
@@ -0,0 +1,109 @@
+# tests/test_outbound.py
+"""OutboundDispatcher: ACK после отправки, приоритеты, передоставка через XCLAIM и предел доставок."""
+import asyncio
+
+import pytest
+from telegram.error import RetryAfter, TelegramError
+
+from utils import outbound
+from utils.outbound import GROUP, PRIORITY_HIGH, PRIORITY_LOW, STREAMS, OutboundDispatcher, enqueue
+
+pytestmark = pytest.mark.anyio
+
+
+class FakeBot:
+    """send_message пишет chat_id в sent; errors — исключения для первых вызовов."""
+
+    def __init__(self):
+        self.errors = []
+        self.calls = 0
+        self.sent = []
+
+    async def send_message(self, chat_id, text):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        self.sent.append(chat_id)
+
+
+@pytest.fixture
+async def dispatcher(redis, monkeypatch, no_rate_limit):
+    """
+    Диспетчер без воркеров: тест сам вызывает _read/_send (fakeredis не блокирует XREADGROUP BLOCK,
+    и воркер крутился бы вхолостую). Зависшей запись считается через 50 мс.
+    """
+    monkeypatch.setattr(outbound, "BLOCK_MS", 20)
+    monkeypatch.setattr(outbound, "CLAIM_IDLE_MS", 50)
+    for stream in STREAMS:
+        await redis.xgroup_create(stream, GROUP, id="0", mkstream=True)
+    return OutboundDispatcher(FakeBot(), workers=0)
+
+
+async def _drain(dispatcher) -> int:
+    """Один проход воркера до пустых потоков; возвращает число прочитанных записей."""
+    read = 0
+    while entries := await dispatcher._read():
+        for stream, entry_id, fields in entries:
+            read += 1
+            await dispatcher._send(stream, entry_id, fields)
+    return read
+
+
+async def _reclaim_until(dispatcher, predicate, timeout: float = 3.0):
+    """Крутит только _reclaim (xpending_range + XCLAIM), пока predicate не выполнится."""
+    task = asyncio.create_task(dispatcher._reclaim())
+    deadline = asyncio.get_running_loop().time() + timeout
+    try:
+        while not await predicate():
+            assert asyncio.get_running_loop().time() < deadline, "condition not reached"
+            await asyncio.sleep(0.01)
+    finally:
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+
+async def _pending(redis, stream: str = PRIORITY_HIGH) -> int:
+    return (await redis.xpending(stream, GROUP))["pending"]
+
+
+async def test_ack_after_send(redis, dispatcher):
+    await enqueue("send_message", {"chat_id": 1, "text": "hi"})
+    assert await _drain(dispatcher) == 1
+    assert dispatcher.bot.sent == [1]
+    assert await _pending(redis) == 0 and await redis.xlen(PRIORITY_HIGH) == 0
+
+
+async def test_high_priority_drained_first(redis, dispatcher):
+    for chat_id in (11, 12, 13):
+        await enqueue("send_message", {"chat_id": chat_id, "text": "ad"}, PRIORITY_LOW)
+    for chat_id in (1, 2, 3):
+        await enqueue("send_message", {"chat_id": chat_id, "text": "status"})
+    await _drain(dispatcher)
+    assert dispatcher.bot.sent == [1, 2, 3, 11, 12, 13]
+
+
+async def test_retry_after_stays_pending_until_reclaimed(redis, dispatcher):
+    dispatcher.bot.errors = [RetryAfter(0)]
+    await enqueue("send_message", {"chat_id": 1, "text": "hi"})
+    await _drain(dispatcher)
+    assert dispatcher.bot.calls == 1 and dispatcher.bot.sent == []
+    assert await _pending(redis) == 1 and await redis.xlen(PRIORITY_HIGH) == 1
+
+    async def redelivered():
+        return dispatcher.bot.sent == [1] and await _pending(redis) == 0
+    await _reclaim_until(dispatcher, redelivered)
+    assert dispatcher.bot.calls == 2 and await redis.xlen(PRIORITY_HIGH) == 0
+
+
+async def test_dropped_after_max_deliveries(redis, dispatcher, monkeypatch):
+    monkeypatch.setattr(outbound, "MAX_DELIVERIES", 2)
+    dispatcher.bot.errors = [TelegramError("boom")] * 10
+    await enqueue("send_message", {"chat_id": 1, "text": "hi"})
+    await _drain(dispatcher)
+
+    async def dropped():
+        return await redis.xlen(PRIORITY_HIGH) == 0
+    await _reclaim_until(dispatcher, dropped)
+    # Первая доставка из XREADGROUP, вторая — через XCLAIM, на третьей запись выброшена без отправки
+    assert dispatcher.bot.calls == 2 and dispatcher.bot.sent == []
+    assert await _pending(redis) == 0
@@ -0,0 +1,86 @@
+"""RateLimiter: память ограничена max_chats/idle_ttl, ожидание — точное по token bucket; общий лимит через Redis."""
+import asyncio
+import time
+import tracemalloc
+
+import pytest
+
+from utils.telegram_utils import RateLimiter, RedisRateLimiter, TokenBucket
+
+pytestmark = pytest.mark.anyio
+
+
+def test_bucket_debt_is_fifo():
+    bucket = TokenBucket(rate=2, capacity=2, now=0.0)
+    assert [bucket.reserve(0.0) for _ in range(4)] == [0.0, 0.0, 0.5, 1.0]
+    bucket.refund()  # последний ожидающий отменился — его слот достаётся следующему
+    assert bucket.reserve(0.0) == 1.0
+
+
+async def test_chat_buckets_memory_is_bounded():
+    limiter = RateLimiter(10**9, 10**9, max_chats=1000, idle_ttl=60)
+    tracemalloc.start()
+    for chat_id in range(20_000):
+        await limiter.wait_for_slot(chat_id)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert len(limiter.chat_buckets) <= 1000
+    assert peak < 1_000_000  # ~1000 бакетов, а не 20 000
+    assert list(limiter.chat_buckets)[-1] == 19_999  # вытесняются самые давние
+
+
+async def test_idle_chats_are_evicted(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(time, "monotonic", lambda: clock[0])
+    limiter = RateLimiter(10**9, 10**9, max_chats=1000, idle_ttl=60)
+    for chat_id in range(10):
+        await limiter.wait_for_slot(chat_id)
+    clock[0] += 61
+    await limiter.wait_for_slot("fresh")
+    assert list(limiter.chat_buckets) == ["fresh"]
+
+
+def test_indebted_bucket_survives_overflow(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(time, "monotonic", lambda: clock[0])
+    limiter = RateLimiter(messages_per_second=1, global_messages_per_second=10**9, max_chats=2, idle_ttl=60)
+    assert limiter._chat_bucket("busy", clock[0]).reserve(clock[0]) == 0.0
+    assert limiter._chat_bucket("busy", clock[0]).reserve(clock[0]) == 1.0  # второе сообщение ждёт секунду
+    for chat_id in ("a", "b", "c"):  # переполнение, пока "busy" в долгу
+        limiter._chat_bucket(chat_id, clock[0]).reserve(clock[0])
+    assert "busy" in limiter.chat_buckets
+    assert limiter._chat_bucket("busy", clock[0]).reserve(clock[0]) == 2.0  # встаёт за ожидающим, а не в t=0
+
+    clock[0] += 10  # все восстановились — граница max_chats снова соблюдается
+    limiter._chat_bucket("d", clock[0])
+    assert len(limiter.chat_buckets) <= 2
+
+
+def test_burst_of_indebted_chats_stays_linear(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(time, "monotonic", lambda: clock[0])
+    limiter = RateLimiter(messages_per_second=1, global_messages_per_second=10**9, max_chats=100)
+    started = time.perf_counter()
+    for chat_id in range(20_000):  # все в одну "секунду": никто не успевает восстановиться
+        limiter._chat_bucket(chat_id, clock[0]).reserve(clock[0])
+    assert time.perf_counter() - started < 1  # без O(n) обхода на каждую вставку
+    clock[0] += 2
+    limiter._chat_bucket("next", clock[0])
+    assert len(limiter.chat_buckets) <= 100  # восстановившиеся вытеснены все разом
+
+
+async def test_per_chat_rate():
+    limiter = RateLimiter(messages_per_second=20, global_messages_per_second=10**9)
+    started = time.monotonic()
+    for _ in range(25):  # 20 сразу из ёмкости, ещё 5 — по 1/20 с
+        await limiter.wait_for_slot(1)
+    assert 0.2 <= time.monotonic() - started < 0.5
+
+
+async def test_redis_global_limit_is_shared(redis):
+    limiters = [RedisRateLimiter(redis, key="test:ratelimit", lease_size=1, messages_per_second=10**9,
+                                 global_messages_per_second=50) for _ in range(2)]
+    started = time.monotonic()
+    # 80 отправок двумя "процессами": 50 из ёмкости, остальные 30 — со скоростью 50/с на двоих
+    await asyncio.gather(*(limiter.wait_for_slot(chat_id) for limiter in limiters for chat_id in range(40)))
+    assert 0.55 <= time.monotonic() - started < 1.5
@@ -0,0 +1,31 @@
+# tests/test_seen_listings.py
+import pytest
+
+from monitoring.seen_listings import SeenListings
+
+pytestmark = pytest.mark.anyio
+
+NOW = 1_700_000_000
+
+
+async def test_marks_once_and_memory_follows_volume(redis):
+    seen = SeenListings()
+    pairs = [(chat_id, 10_000 + listing) for chat_id, volume in ((1, 10), (2, 300)) for listing in range(volume)]
+    assert all(await seen.check_and_mark(pairs, now=NOW))
+    assert not any(await seen.check_and_mark(pairs, now=NOW))
+    # Повтор внутри одной пачки — тоже "уже видели"
+    assert await seen.check_and_mark([(1, 5), (1, 5)], now=NOW) == [True, False]
+
+    light = sum([await redis.strlen(key) for key in seen.keys(1, NOW)])
+    heavy = sum([await redis.strlen(key) for key in seen.keys(2, NOW)])
+    assert light <= seen.bucket_bytes(11) < 200  # первая ступень, а не весь бакет (Redis — до последнего бита)
+    assert heavy <= seen.bucket_bytes(300) <= seen.bytes_per_user / seen.buckets
+    assert seen.bytes_per_user < 12_000  # худший случай на пользователя при умолчаниях
+
+
+async def test_window_spans_buckets(redis):
+    seen = SeenListings()
+    assert await seen.check_and_mark([(1, 42)], now=NOW) == [True]
+    # Следующий бакет: отметка в нём, но прежний ещё в окне
+    assert await seen.check_and_mark([(1, 42)], now=NOW + seen.bucket_width) == [False]
+    assert await seen.check_and_mark([(1, 43)], now=NOW + seen.bucket_width) == [True]
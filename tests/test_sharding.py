@@ -0,0 +1,100 @@
+# tests/test_sharding.py
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+from monitoring.sharding import ShardLeases, shard_of
+
+SHARDS = 16
+
+# Воркер без кэша подписчиков: только аренды, состояние — строкой JSON раз в 0.1 с
+WORKER = """
+import asyncio, json, sys
+from monitoring.sharding import ShardLeases
+
+async def main():
+    leases = ShardLeases(worker_id=sys.argv[1], shards=int(sys.argv[2]), ttl=float(sys.argv[3]))
+    await leases.start()
+    while True:
+        print(json.dumps(sorted(leases.owned)), flush=True)
+        await asyncio.sleep(0.1)
+
+asyncio.run(main())
+"""
+
+
+def test_jump_hash_moves_few_chats():
+    chat_ids = range(100_000, 110_000)
+    before = [shard_of(chat_id, 64) for chat_id in chat_ids]
+    after = [shard_of(chat_id, 65) for chat_id in chat_ids]
+    assert all(0 <= shard < 64 for shard in before)
+    moved = sum(a != b for a, b in zip(before, after))
+    assert moved < len(chat_ids) * 2 / 65  # ~1/65 переезжает, не половина
+
+
+@pytest.mark.anyio
+async def test_leases_are_fair_and_exclusive(redis):
+    first, second = ShardLeases("a", SHARDS, ttl=5), ShardLeases("b", SHARDS, ttl=5)
+    await first.heartbeat()
+    assert first.owned == frozenset(range(SHARDS))
+    await second.heartbeat()  # доля второго: ceil(16 / 2), свободных пока нет
+    await first.heartbeat()  # первый отдаёт лишние
+    await second.heartbeat()
+    assert not first.owned & second.owned
+    assert first.owned | second.owned == frozenset(range(SHARDS))
+    assert len(first.owned) == len(second.owned) == SHARDS // 2
+    await second.stop()  # release: шарды свободны сразу
+    await first.heartbeat()
+    assert first.owned == frozenset(range(SHARDS))
+    await first.stop()
+
+
+class Worker:
+    def __init__(self, name: str, ttl: float):
+        self.owned = None
+        self.proc = subprocess.Popen([sys.executable, "-c", WORKER, name, str(SHARDS), str(ttl)],
+                                     stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True,
+                                     env=os.environ.copy(), cwd=os.path.dirname(os.path.dirname(__file__)))
+        threading.Thread(target=self._read, daemon=True).start()
+
+    def _read(self):
+        for line in self.proc.stdout:
+            if line.startswith("["):
+                self.owned = json.loads(line)
+
+
+def wait_covered(workers: list, timeout: float = 30):
+    """Каждый шард ровно у одного живого воркера."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        owned = [shard for w in workers if w.owned is not None for shard in w.owned]
+        if sorted(owned) == list(range(SHARDS)) and all(w.owned for w in workers):
+            return
+        time.sleep(0.05)
+    raise AssertionError([w.owned for w in workers])
+
+
+def test_processes_split_shards_and_take_over_a_dead_worker():
+    """Три процесса на одном Redis; SIGKILL одного — его шарды забирают остальные по истечении аренд."""
+    import redis as sync_redis
+    sync_redis.Redis.from_url(os.environ["REDIS_URL"]).flushdb()
+    ttl = 1.0
+    workers = [Worker(f"w{i}", ttl) for i in range(3)]
+    try:
+        wait_covered(workers)
+        assert all(len(w.owned) <= -(-SHARDS // 3) for w in workers)
+        victim = workers.pop()
+        victim.proc.kill()  # без release: аренды истекают сами
+        victim.proc.wait()
+        started = time.monotonic()
+        wait_covered(workers)
+        assert time.monotonic() - started < ttl * 5
+        assert all(len(w.owned) == SHARDS // 2 for w in workers)
+    finally:
+        for w in workers:
+            w.proc.kill()
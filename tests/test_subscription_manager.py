@@ -0,0 +1,173 @@
+"""SubscriptionManager: загрузка подписчиков в фоне и правки кэша после неё."""
+import asyncio
+
+import orjson
+import pytest
+from redis.asyncio.client import PubSub
+from redis.exceptions import ConnectionError as RedisConnectionError
+
+from authorization.transitions import SUBSCRIPTION_PERIOD, transition
+from monitoring import subscription_manager
+from monitoring.subscription_manager import SubscriptionManager
+
+pytestmark = pytest.mark.anyio
+
+
+async def _subscribe(redis, chat_id: int, city: str = "1"):
+    await redis.hdel(f"user:{chat_id}", "filter")  # компактный filter от migrate_legacy читался бы первым
+    await redis.hset(f"user:{chat_id}", mapping={
+        "bot_status": "running", "subscription_end": "4000000000", "language": "ru",
+        "settings": orjson.dumps({"city": city, "deal_type": "1"}).decode(),
+    })
+    await redis.sadd("subscribed_users", chat_id)
+
+
+async def _settled(manager, timeout: float = 5):
+    """Ждёт, пока очередь перечитываний опустеет."""
+    async with asyncio.timeout(timeout):
+        while manager._refresher is not None:
+            await asyncio.sleep(0.01)
+
+
+@pytest.fixture
+def paused_scan(monkeypatch):
+    """
+    Останавливает следующий полный SSCAN после чтения пачки: scanned — снимок прочитан,
+    resume — дать загрузке закончиться. Так изменение гарантированно попадает внутрь скана.
+    """
+    scan = subscription_manager.scan_subscribers
+    scanned, resume = asyncio.Event(), asyncio.Event()
+
+    async def paused(*args, **kwargs):
+        async for batch in scan(*args, **kwargs):
+            yield batch
+            scanned.set()
+            await resume.wait()
+
+    def install():
+        monkeypatch.setattr(subscription_manager, "scan_subscribers", paused)
+        return scanned, resume
+    return install
+
+
+class StubShards:
+    def __init__(self, owned: set):
+        self.owned = owned
+        self.on_change = None
+
+    def owns(self, chat_id: int) -> bool:
+        return chat_id % 2 in self.owned
+
+
+async def test_delta_during_shard_reload_is_not_lost(redis, paused_scan):
+    for chat_id in range(6):
+        await _subscribe(redis, chat_id)
+    shards = StubShards({0})
+    manager = SubscriptionManager(shards)
+    await manager.start()
+    try:
+        await asyncio.wait_for(manager.ready.wait(), 5)
+        assert sorted(manager.subscribers) == [0, 2, 4]
+
+        scanned, resume = paused_scan()
+        shards.owned = {0, 1}
+        await shards.on_change(frozenset(shards.owned))
+        await asyncio.wait_for(scanned.wait(), 5)
+        await transition(2, "stop")  # Stop во время скана: снимок скана ещё считает его подписанным
+        await asyncio.sleep(0.2)  # окно, в котором дельта успела бы примениться до подмены кэша
+        resume.set()
+        await _settled(manager)
+
+        assert await redis.hget("user:2", "bot_status") == "stopped"
+        assert sorted(manager.subscribers) == [0, 1, 3, 4, 5]
+    finally:
+        await manager.stop()
+
+
+async def test_start_does_not_wait_for_load(redis):
+    for chat_id in range(3):
+        await _subscribe(redis, chat_id)
+    manager = SubscriptionManager()
+    await manager.start()
+    try:
+        assert not manager.ready.is_set()  # старт вернулся до SSCAN
+        await asyncio.wait_for(manager.ready.wait(), 5)
+        assert len(manager) == 3
+
+        # Правка одного подписчика после загрузки доходит до колонок без полной пересборки
+        listing = {"city": "2", "deal_type": "1"}
+        assert manager.match_batch([listing])[1].tolist() == []
+        columns = manager._columns
+        await _subscribe(redis, 1, city="2")
+        await manager.refresh_chat(1)
+        assert manager._columns is columns
+        assert manager.match_batch([listing])[1].tolist() == [1]
+    finally:
+        await manager.stop()
+
+
+async def test_cache_follows_transitions_over_channel(redis):
+    manager = SubscriptionManager()
+    await manager.start()
+    try:
+        await asyncio.wait_for(manager.ready.wait(), 5)
+        assert 7 not in manager.subscribers
+
+        # Только transition(): кэш обновляется по chat_id из CHANGES_CHANNEL, без прямых вызовов
+        await transition(7, "payment", {"status": "running", "period": SUBSCRIPTION_PERIOD})
+        await _eventually(lambda: 7 in manager.subscribers)
+        await transition(7, "settings", {"settings": orjson.dumps({"city": "2", "deal_type": "1"}).decode()})
+        await _eventually(lambda: manager.subscribers[7]["filter"].city == "2")
+        await transition(7, "stop")
+        await _eventually(lambda: 7 not in manager.subscribers)
+        await transition(7, "start")
+        await _eventually(lambda: 7 in manager.subscribers)
+    finally:
+        await manager.stop()
+
+
+async def test_delta_during_reconnect_reload_is_not_lost(redis, paused_scan, monkeypatch):
+    for chat_id in range(3):
+        await _subscribe(redis, chat_id)
+    monkeypatch.setattr(subscription_manager, "RECONNECT_DELAY", 0.01)
+    get_message = PubSub.get_message
+    drop = asyncio.Event()
+
+    async def flaky_get_message(self, *args, **kwargs):
+        if drop.is_set():
+            drop.clear()
+            raise RedisConnectionError("connection reset")
+        return await get_message(self, *args, **kwargs)
+
+    monkeypatch.setattr(PubSub, "get_message", flaky_get_message)
+    manager = SubscriptionManager()
+    await manager.start()
+    try:
+        await asyncio.wait_for(manager.ready.wait(), 5)
+        scanned, resume = paused_scan()
+        reloads = []
+        load_all = manager.load_all
+
+        async def counted_load_all():
+            await load_all()
+            reloads.append(True)
+        manager.load_all = counted_load_all
+        drop.set()  # канал рвётся — после переподписки полная перезагрузка
+        await asyncio.wait_for(scanned.wait(), 5)
+        # Изменение без сообщения в канале: только запрос handler'а, канал этот chat_id не повторит
+        await redis.hset("user:1", "bot_status", "stopped")
+        await redis.srem("subscribed_users", 1)
+        manager.refresh_subscriptions([1])
+        await asyncio.sleep(0.2)
+        resume.set()
+        await _eventually(lambda: reloads)
+        await _settled(manager)
+        assert sorted(manager.subscribers) == [0, 2]
+    finally:
+        await manager.stop()
+
+
+async def _eventually(predicate, timeout: float = 5):
+    async with asyncio.timeout(timeout):
+        while not predicate():
+            await asyncio.sleep(0.01)
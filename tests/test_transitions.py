@@ -0,0 +1,69 @@
+"""Переходы подписки (TRANSITION_LUA): состояние хэша, subscribed_users, индекс истечений и публикация."""
+import asyncio
+
+import pytest
+
+from authorization.transitions import (CHANGES_CHANNEL, EXPIRY_KEY, INACTIVITY_TTL, LEGACY_TRIAL_PREFIX, TRIAL_TTL,
+                                       SUBSCRIPTION_PERIOD, transition, trial_key)
+from authorization.user_context import UserContext
+
+pytestmark = pytest.mark.anyio
+
+
+async def _published(pubsub) -> list:
+    # None приходит и вместо подтверждения подписки (ignore_subscribe_messages), поэтому — фиксированное число чтений
+    messages = [await pubsub.get_message(timeout=0.05) for _ in range(8)]
+    return [message["data"] for message in messages if message is not None]
+
+
+async def test_trial_start_stop(redis):
+    pubsub = redis.pubsub(ignore_subscribe_messages=True)
+    await pubsub.subscribe(CHANGES_CHANNEL)
+    try:
+        assert (await transition(1, "start"))["result"] == "inactive"  # подписки ещё нет
+
+        trial = await transition(1, "trial", {"ttl": TRIAL_TTL})
+        assert trial["result"] == "ok" and trial["bot_status"] == "stopped"
+        assert await redis.hexists(trial_key(1), "1")
+        assert await redis.ttl("user:1") >= INACTIVITY_TTL - 5  # ключ живёт дольше триала
+
+        user = await UserContext.load(1)
+        assert (await transition(1, "start", user=user))["bot_status"] == "running"
+        assert user.get("bot_status") == "running"  # снимок обновлён результатом, без HGETALL
+        assert await redis.sismember("subscribed_users", "1")
+        assert await redis.zscore(EXPIRY_KEY, "1") == trial["subscription_end"]
+
+        assert (await transition(1, "trial", {"ttl": TRIAL_TTL}))["result"] == "active"
+        await transition(1, "stop")
+        assert not await redis.sismember("subscribed_users", "1")
+        assert await redis.zscore(EXPIRY_KEY, "1") is None
+        # Публикуются только реальные изменения: неудачный start и отказ в триале — нет
+        assert await _published(pubsub) == ["1", "1", "1"]
+    finally:
+        await pubsub.aclose()
+
+
+async def test_trial_is_used_once(redis):
+    await redis.set(f"{LEGACY_TRIAL_PREFIX}2", 1)  # флаг до миграции на корзины trials:*
+    assert (await transition(2, "trial", {"ttl": TRIAL_TTL}))["result"] == "used"
+    assert await redis.hexists(trial_key(2), "2") and not await redis.exists(f"{LEGACY_TRIAL_PREFIX}2")
+
+    await transition(3, "trial", {"ttl": 1})
+    await asyncio.sleep(1.1)
+    assert (await transition(3, "trial", {"ttl": TRIAL_TTL}))["result"] == "used"
+
+
+async def test_payment_extends_and_settings_delete_fields(redis):
+    first = await transition(4, "payment", {"status": "running", "period": SUBSCRIPTION_PERIOD})
+    second = await transition(4, "payment", {"status": "running", "period": SUBSCRIPTION_PERIOD})
+    assert second["subscription_end"] == first["subscription_end"] + SUBSCRIPTION_PERIOD
+    assert await redis.zscore(EXPIRY_KEY, "4") == second["subscription_end"]
+
+    user = await UserContext.load(4)
+    await transition(4, "settings", {"settings": "{}", "language": "en"}, user=user)
+    await transition(4, "settings", {"settings": ""}, user=user)
+    assert await redis.hgetall("user:4") == {**user.data, "language": "en"}
+    assert "settings" not in user.data
+
+    with pytest.raises(Exception, match="unknown transition"):
+        await transition(4, "refund")
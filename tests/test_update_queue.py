@@ -0,0 +1,58 @@
+# tests/test_update_queue.py
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from utils.update_processor import PerChatUpdateProcessor
+from utils.update_queue import QueueFull, UpdateQueue
+
+pytestmark = pytest.mark.anyio
+
+HOT_CHAT = 1
+
+
+def update(update_id: int, chat_id: int):
+    return SimpleNamespace(update_id=update_id, effective_chat=SimpleNamespace(id=chat_id))
+
+
+async def test_hot_chat_does_not_hold_cold_chats(redis):
+    """20 медленных апдейтов одного чата на 4 воркера: холодные чаты не ждут их очереди."""
+    processor = PerChatUpdateProcessor(64)
+    received, cold_latency, hot_order = {}, [], []
+
+    async def handle(upd):
+        if upd.effective_chat.id == HOT_CHAT:
+            await asyncio.sleep(0.05)
+            hot_order.append(upd.update_id)
+        else:
+            await asyncio.sleep(0.001)
+            cold_latency.append(time.perf_counter() - received[upd.update_id])
+
+    async def process(upd):
+        await processor.process_update(upd, handle(upd))
+
+    queue = UpdateQueue(process, maxsize=1000, workers=4)
+    await queue.start()
+    updates = [update(i, HOT_CHAT) for i in range(20)] + [update(100 + i, 1000 + i) for i in range(50)]
+    for upd in updates:
+        received[upd.update_id] = time.perf_counter()
+        assert await queue.put(upd)
+    await queue.join()
+    await queue.stop()
+
+    assert hot_order == sorted(hot_order) and len(hot_order) == 20
+    # С общей очередью все 4 воркера ждали бы блокировку горячего чата: холодные — ~1 с (20 x 50 мс)
+    assert max(cold_latency) < 0.3
+    assert queue.stats()["processed"] == 70 and queue.depth == 0
+
+
+async def test_duplicates_and_overflow(redis):
+    queue = UpdateQueue(lambda upd: asyncio.sleep(0), maxsize=2, workers=1)  # воркеры не запущены
+    assert await queue.put(update(1, 10))
+    assert not await queue.put(update(1, 10))  # повтор Telegram
+    assert await queue.put(update(2, 10))
+    with pytest.raises(QueueFull):
+        await queue.put(update(3, 11))
+    assert queue.stats()["duplicates"] == 1 and queue.stats()["rejected"] == 1
@@ -0,0 +1,74 @@
+# tests/test_update_roundtrips.py
+from types import SimpleNamespace
+
+import pytest
+
+from authorization.subscription import handle_buttons
+from utils.redis_client import redis_pool
+from utils.translations import translations
+
+pytestmark = pytest.mark.anyio
+
+# Загрузка UserContext + один скрипт transition(); обычный текст в Redis не ходит
+BUDGET = {"start_button": 2, "stop_button": 2, "free_button": 2}
+
+
+class StubBot:
+    def __init__(self):
+        self.sent = []
+
+    async def send_message(self, **kwargs):
+        self.sent.append(kwargs)
+
+    async def send_invoice(self, **kwargs):
+        self.sent.append(kwargs)
+
+
+class StubSubscriptionManager:
+    def refresh_subscriptions(self, chat_ids=None):
+        return None
+
+
+def make_update(chat_id: int, text: str):
+    return SimpleNamespace(
+        message=SimpleNamespace(chat_id=chat_id, text=text),
+        effective_user=SimpleNamespace(language_code="ru"),
+        effective_chat=SimpleNamespace(id=chat_id),
+    )
+
+
+async def count_roundtrips(coro) -> int:
+    calls = 0
+    get_connection = redis_pool.get_connection
+
+    async def counting_get_connection(*args, **kwargs):
+        nonlocal calls
+        calls += 1
+        return await get_connection(*args, **kwargs)
+
+    redis_pool.get_connection = counting_get_connection
+    try:
+        await coro
+    finally:
+        redis_pool.get_connection = get_connection
+    return calls
+
+
+@pytest.fixture
+async def context(redis, no_rate_limit):
+    await redis.hset("user:1001", mapping={"bot_status": "stopped", "subscription_end": "4000000000", "language": "ru"})
+    context = SimpleNamespace(bot=StubBot(), application=SimpleNamespace(subscription_manager=StubSubscriptionManager()))
+    # Первый transition() делает SCRIPT LOAD — проверяем установившийся режим
+    for button in BUDGET:
+        await handle_buttons(make_update(1001, translations[button]["ru"]), context)
+    return context
+
+
+@pytest.mark.parametrize("button", BUDGET)
+async def test_button_roundtrip_budget(context, button):
+    roundtrips = await count_roundtrips(handle_buttons(make_update(1001, translations[button]["ru"]), context))
+    assert roundtrips <= BUDGET[button]
+
+
+async def test_plain_text_does_not_touch_redis(context):
+    assert await count_roundtrips(handle_buttons(make_update(1001, "Привет"), context)) == 0
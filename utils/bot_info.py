@@ -0,0 +1,56 @@
+# utils/bot_info.py
+import orjson
+from telegram import User
+from telegram.ext import ExtBot
+from telegram.request import HTTPXRequest
+from utils.logger import logger
+from utils.redis_client import redis_client
+
+BOT_INFO_TTL = 86400  # сек: username/флаги бота меняются редко
+CONNECTION_POOL_SIZE = 256  # как у ApplicationBuilder по умолчанию
+
+
+class CachedInfoBot(ExtBot):
+    """
+    ExtBot, который не ходит в getMe при initialize(), если данные бота уже известны.
+
+    На холодном старте это экономит один запрос к Telegram; данные берутся из
+    Redis (их кладёт первый инстанс после настоящего getMe).
+    """
+
+    __slots__ = ()
+
+    def set_bot_info(self, info: dict):
+        self._bot_user = User.de_json(info, self)
+
+    async def get_me(self, *args, **kwargs):
+        if self._bot_user is not None and not args and not kwargs:
+            return self._bot_user
+        return await super().get_me(*args, **kwargs)
+
+
+def _key(token: str) -> str:
+    return f"bot_info:{token.split(':', 1)[0]}"
+
+
+def build_bot(token: str, base_url: str = "https://api.telegram.org/bot") -> CachedInfoBot:
+    return CachedInfoBot(
+        token=token,
+        base_url=base_url,
+        request=HTTPXRequest(connection_pool_size=CONNECTION_POOL_SIZE),
+        get_updates_request=HTTPXRequest(),
+    )
+
+
+async def load_bot_info(bot: CachedInfoBot) -> bool:
+    """Подставляет закэшированные данные бота. False — кэша нет, initialize() сделает getMe."""
+    cached = await redis_client.get(_key(bot.token))
+    if not cached:
+        return False
+    bot.set_bot_info(orjson.loads(cached))
+    return True
+
+
+async def save_bot_info(bot: CachedInfoBot):
+    await redis_client.set(_key(bot.token), orjson.dumps(bot.bot.to_dict()), ex=BOT_INFO_TTL)
+    logger.info(f"💾 Cached bot info for @{bot.username}")
@@ -1,16 +1,218 @@
 # utils/logger.py
+"""
+Логгер бота. Handlers только кладут LogRecord в очередь (QueueHandler), в stderr
+пишет отдельный поток (QueueListener): event loop не ждёт вывода.
+
+Форматирование ленивое: на горячем пути создаётся только запись с шаблоном и
+аргументами (logger.info("... %s", value), не f-строка), сообщение и JSON
+собираются в потоке вывода. Откладывается только то, что нельзя изменить:
+запись с аргументами не из скаляров (dict, list, объекты) форматируется сразу
+в вызывающем потоке, изменяемые поля extra копируются — в лог попадает
+значение на момент вызова.
+
+До очереди записи проходят EventFilter:
+- выборка: для событий из LOG_SAMPLE_RATES ("событие=доля,...") пишется каждая
+  round(1/доля)-я запись, первая — всегда;
+- подавление повторов: одна и та же запись (событие, шаблон и аргументы)
+  пишется не больше LOG_DUPLICATE_LIMIT раз за LOG_DUPLICATE_WINDOW сек, число
+  пропущенных попадает в первую запись следующего окна (поле suppressed).
+  Записи одного события с разными аргументами (settings_saved разных
+  пользователей) повторами не считаются.
+Событие — extra={"event": ...}, без него — место вызова (файл и строка).
+
+LOG_FORMAT=json — одна строка orjson на запись: ts, level, logger, event, msg
+и остальные поля extra; LOG_FORMAT=text — прежний формат.
+"""
+import atexit
+import copy
 import logging
+import queue
+import time
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+import orjson
+from utils import metrics
+from config import LOG_FORMAT, LOG_SAMPLE_RATES, LOG_DUPLICATE_LIMIT, LOG_DUPLICATE_WINDOW, LOG_QUEUE_SIZE
+
+LOG_DROPPED = metrics.counter("log_records_dropped_total", "Записи лога, не дошедшие до вывода", label="reason")
+_DROPPED_SAMPLED = LOG_DROPPED.labels("sampled")
+_DROPPED_DUPLICATE = LOG_DROPPED.labels("duplicate")
+_DROPPED_QUEUE_FULL = LOG_DROPPED.labels("queue_full")
+
+# Стандартные атрибуты LogRecord: всё остальное в записи — поля extra
+_RECORD_FIELDS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "taskName", "event"}
+# Значения, которые можно отдать потоку вывода без копии
+_SCALARS = (str, int, float, bool, type(None), bytes)
+
+
+def _immutable(args) -> bool:
+    return all(arg.__class__ in _SCALARS or isinstance(arg, _SCALARS) for arg in args)
+
+
+def _dedupe_key(source, msg, args):
+    """Ключ повтора: источник (событие или место вызова), шаблон и аргументы."""
+    key = (source, msg, args)
+    try:
+        hash(key)
+    except TypeError:  # dict в аргументах — редкий путь
+        return source, msg, repr(args)
+    return key
+
+
+def parse_sample_rates(value: str) -> dict:
+    """'a=0.01,b=0.1' -> {'a': 0.01, 'b': 0.1}."""
+    rates = {}
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        event, _, rate = item.partition("=")
+        rates[event.strip()] = float(rate)
+    return rates
+
+
+class EventFilter(logging.Filter):
+    """Выборка частых событий и ограничение повторов одного события (см. docstring модуля)."""
+
+    def __init__(self, sample_rates: dict, limit: int, window: float):
+        super().__init__()
+        self.every = {event: max(1, round(1 / rate)) if rate > 0 else 0 for event, rate in sample_rates.items()}
+        self.limit = limit
+        self.window = window
+        self._seen = {}  # событие -> записей всего (для выборки)
+        self._windows = {}  # ключ повтора -> [начало окна, записано в окне, подавлено в окне]
+        self._pruned = 0.0
+
+    def allow(self, event, now: float, key=None):
+        """
+        None — запись не пишется, иначе — сколько её повторов подавлено перед ней.
+        Выборка — по событию, повторы — по key (_dedupe_key; без него — по событию).
+        """
+        every = self.every.get(event)
+        if every is not None:
+            seen = self._seen.get(event, 0)
+            self._seen[event] = seen + 1
+            if not every or seen % every:
+                _DROPPED_SAMPLED.value += 1
+                return None
+        if key is None:
+            key = event
+        if now - self._pruned >= self.window:
+            self._prune(now)
+        window = self._windows.get(key)
+        suppressed = 0
+        if window is None or now - window[0] >= self.window:
+            suppressed = window[2] if window is not None else 0
+            window = self._windows[key] = [now, 0, 0]
+        if window[1] >= self.limit:
+            window[2] += 1
+            _DROPPED_DUPLICATE.value += 1
+            return None
+        window[1] += 1
+        return suppressed
+
+    def _prune(self, now: float):
+        """Окна без подавленных записей, которые уже истекли: ключей с аргументами много, копить их незачем."""
+        self._pruned = now
+        stale = [key for key, window in self._windows.items() if now - window[0] >= self.window and not window[2]]
+        for key in stale:
+            del self._windows[key]
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        """Записи без event (их событие — место вызова: ключей не больше, чем вызовов в коде)."""
+        if "event" in record.__dict__:
+            return True  # уже решено в BotLogger._log, до создания записи
+        site = (record.pathname, record.lineno)
+        suppressed = self.allow(site, record.created, _dedupe_key(site, record.msg, record.args))
+        if suppressed is None:
+            return False
+        if suppressed:
+            record.suppressed = suppressed
+        return True
+
+
+class BotLogger(logging.Logger):
+    """
+    Logger, который для записей с extra={"event": ...} решает выборку и повторы
+    до создания LogRecord: отброшенная запись стоит поиска в словаре, а не
+    findCaller и конструктора LogRecord.
+    """
+
+    event_filter = None
+
+    def _log(self, level, msg, args, exc_info=None, extra=None, stack_info=False, stacklevel=1):
+        if extra is not None and self.event_filter is not None:
+            event = extra.get("event")
+            if event is not None:
+                suppressed = self.event_filter.allow(event, time.time(), _dedupe_key(event, msg, args))
+                if suppressed is None:
+                    return
+                if suppressed:
+                    extra = {**extra, "suppressed": suppressed}
+        super()._log(level, msg, args, exc_info, extra, stack_info, stacklevel + 1)
+
+
+class LazyQueueHandler(QueueHandler):
+    """QueueHandler без форматирования в вызывающем потоке и без блокировки на полной очереди."""
+
+    def prepare(self, record):
+        # Сообщение соберёт formatter в потоке QueueListener, если аргументы уже не изменятся
+        if record.args and not (isinstance(record.args, tuple) and _immutable(record.args)) or not isinstance(record.msg, str):
+            record.msg = record.getMessage()
+            record.args = None
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_FIELDS and not isinstance(value, _SCALARS):
+                record.__dict__[key] = copy.deepcopy(value)
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            _DROPPED_QUEUE_FULL.value += 1
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc),
+            "level": record.levelname,
+            "logger": record.name,
+            "event": record.__dict__.get("event"),
+            "msg": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_FIELDS:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return orjson.dumps(entry, default=str).decode()
+
+
+class TextFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        text = super().format(record)
+        suppressed = record.__dict__.get("suppressed")
+        return f"{text} (+{suppressed} similar suppressed)" if suppressed else text
+
 
 # Настройка логгера
+logging.setLoggerClass(BotLogger)
 logger = logging.getLogger("real_estate_bot")
+logging.setLoggerClass(logging.Logger)  # остальные логгеры (PTB, httpx) — обычные
 logger.setLevel(logging.INFO)
 
 # Чтобы не дублировать хендлеры, если модуль импортируется несколько раз
 if not logger.handlers:
-    handler = logging.StreamHandler()
-    formatter = logging.Formatter("%(asctime)s | %(levelname)s | %(name)s | %(message)s")
-    handler.setFormatter(formatter)
+    output = logging.StreamHandler()
+    output.setFormatter(JsonFormatter() if LOG_FORMAT == "json" else TextFormatter("%(asctime)s | %(levelname)s | %(name)s | %(message)s"))
+    log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    handler = LazyQueueHandler(log_queue)
+    event_filter = EventFilter(parse_sample_rates(LOG_SAMPLE_RATES), LOG_DUPLICATE_LIMIT, LOG_DUPLICATE_WINDOW)
+    if isinstance(logger, BotLogger):
+        logger.event_filter = event_filter
+    handler.addFilter(event_filter)
     logger.addHandler(handler)
+    listener = QueueListener(log_queue, output)
+    listener.start()
+    atexit.register(listener.stop)  # дописывает очередь при выходе процесса
 
 # Отключаем подробный лог httpx, если используется
-logging.getLogger("httpx").setLevel(logging.WARNING)
\ No newline at end of file
+logging.getLogger("httpx").setLevel(logging.WARNING)
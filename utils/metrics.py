@@ -0,0 +1,197 @@
+# utils/metrics.py
+"""
+Метрики процесса в текстовом формате Prometheus (GET /metrics).
+
+Счётчики и гистограммы — обычные поля объектов без блокировок: всё работает
+в одном event loop, а инкремент между await не прерывается. На горячем пути —
+только сложение и bisect по границам корзин; имена, метки и текст формата
+собираются один раз при создании серии и при скрейпе.
+"""
+import inspect
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 50)
+
+_registry = {}  # имя -> метрика, в порядке регистрации
+
+
+class Counter:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+
+class Histogram:
+    __slots__ = ("bounds", "counts", "sum")
+
+    def __init__(self, bounds: tuple):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # последняя корзина — +Inf
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Family:
+    """Метрика с необязательной меткой label: серия на каждое значение, создаётся при первом обращении."""
+
+    def __init__(self, name: str, help: str, kind: str, label: str | None = None, buckets: tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.kind = kind
+        self.label = label
+        self.buckets = buckets
+        self.series = {}  # значение метки (None без метки) -> Counter | Histogram
+
+    def labels(self, value=None):
+        series = self.series.get(value)
+        if series is None:
+            series = self.series[value] = Histogram(self.buckets) if self.kind == "histogram" else Counter()
+        return series
+
+    def _labels(self, value, extra: str = "") -> str:
+        pairs = [f'{self.label}="{_escape(value)}"'] if self.label else []
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    async def collect(self, lines: list):
+        lines.append(f"# HELP {self.name} {self.help}")
+        lines.append(f"# TYPE {self.name} {self.kind}")
+        for value, series in list(self.series.items()):
+            if self.kind == "counter":
+                lines.append(f"{self.name}{self._labels(value)} {series.value}")
+                continue
+            cumulative = 0
+            for bound, count in zip((*series.bounds, "+Inf"), series.counts):
+                cumulative += count
+                le = bound if bound == "+Inf" else f"{bound:g}"
+                labels = self._labels(value, f'le="{le}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            lines.append(f"{self.name}_sum{self._labels(value)} {series.sum}")
+            lines.append(f"{self.name}_count{self._labels(value)} {cumulative}")
+
+
+class Gauge:
+    """Значение снимается при скрейпе: callback() -> число или {значение метки: число}, можно async."""
+
+    def __init__(self, name: str, help: str, callback, label: str | None = None):
+        self.name = name
+        self.help = help
+        self.callback = callback
+        self.label = label
+
+    async def collect(self, lines: list):
+        value = self.callback()
+        if inspect.isawaitable(value):
+            value = await value
+        lines.append(f"# HELP {self.name} {self.help}")
+        lines.append(f"# TYPE {self.name} gauge")
+        items = value.items() if self.label else [(None, value)]
+        for label_value, number in items:
+            labels = f'{{{self.label}="{_escape(label_value)}"}}' if self.label else ""
+            lines.append(f"{self.name}{labels} {number}")
+
+
+def counter(name: str, help: str, label: str | None = None):
+    """Без label возвращает сам Counter, с label — Family (серия через .labels(value))."""
+    family = _registry[name] = Family(name, help, "counter", label)
+    return family if label else family.labels()
+
+
+def histogram(name: str, help: str, label: str | None = None, buckets: tuple = LATENCY_BUCKETS):
+    family = _registry[name] = Family(name, help, "histogram", label, buckets)
+    return family if label else family.labels()
+
+
+def gauge(name: str, help: str, callback, label: str | None = None):
+    """Регистрирует (или заменяет) gauge; вызывается при сборке приложения, когда есть что измерять."""
+    _registry[name] = Gauge(name, help, callback, label)
+
+
+async def render() -> str:
+    lines = []
+    for metric in list(_registry.values()):
+        await metric.collect(lines)
+    return "\n".join(lines) + "\n"
+
+
+HANDLER_SECONDS = histogram("bot_handler_duration_seconds", "Время работы handler'а Telegram", label="handler")
+UPDATE_SECONDS = histogram("bot_update_duration_seconds", "Время обработки апдейта целиком")
+UPDATE_REDIS_COMMANDS = histogram("bot_update_redis_commands", "Команд Redis за один апдейт", buckets=COUNT_BUCKETS)
+UPDATE_REDIS_SECONDS = histogram("bot_update_redis_seconds", "Суммарное ожидание Redis за один апдейт")
+REDIS_COMMANDS = counter("redis_commands_total", "Команды Redis, включая команды внутри pipeline", label="command")
+REDIS_ROUNDTRIP_SECONDS = histogram("redis_roundtrip_seconds", "Round-trip в Redis: команда или PIPELINE целиком", label="command")
+RATE_LIMIT_WAIT_SECONDS = histogram("rate_limiter_wait_seconds", "Ожидание слота RateLimiter перед отправкой")
+SEND_ATTEMPTS = histogram("telegram_send_attempts", "Попыток retry_on_timeout на одну отправку", buckets=(1, 2, 3, 5))
+SEND_TIMEOUTS = counter("telegram_timeouts_total", "TimedOut от Bot API в retry_on_timeout")
+SEND_FAILURES = counter("telegram_send_failures_total", "Отправки, не прошедшие после всех попыток retry_on_timeout")
+
+# [команд Redis, сек в Redis] текущего апдейта; None вне track_update
+_update_redis = ContextVar("update_redis", default=None)
+
+
+def record_redis(name: str, commands, elapsed: float):
+    """Round-trip в Redis: name — команда или PIPELINE, commands — имена выполненных команд."""
+    roundtrip = REDIS_ROUNDTRIP_SECONDS.series.get(name) or REDIS_ROUNDTRIP_SECONDS.labels(name)
+    roundtrip.observe(elapsed)
+    series = REDIS_COMMANDS.series
+    count = 0
+    for command in commands:
+        (series.get(command) or REDIS_COMMANDS.labels(command)).value += 1
+        count += 1
+    update = _update_redis.get()
+    if update is not None:
+        update[0] += count
+        update[1] += elapsed
+
+
+class track_update:
+    """
+    Контекст обработки апдейта: время целиком и число/время команд Redis внутри
+    (задачи, созданные внутри, пишут в тот же счётчик — ContextVar копирует ссылку).
+    """
+
+    __slots__ = ("_token", "_started")
+
+    def __enter__(self):
+        self._token = _update_redis.set([0, 0.0])
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        UPDATE_SECONDS.observe(time.perf_counter() - self._started)
+        commands, seconds = _update_redis.get()
+        _update_redis.reset(self._token)
+        UPDATE_REDIS_COMMANDS.observe(commands)
+        UPDATE_REDIS_SECONDS.observe(seconds)
+        return False
+
+
+def timed_handler(callback):
+    """Оборачивает handler PTB: его время попадает в bot_handler_duration_seconds{handler=<имя функции>}."""
+    series = HANDLER_SECONDS.labels(callback.__name__)
+
+    async def wrapper(update, context):
+        started = time.perf_counter()
+        try:
+            return await callback(update, context)
+        finally:
+            series.observe(time.perf_counter() - started)
+
+    wrapper.__name__ = callback.__name__
+    wrapper.__doc__ = callback.__doc__
+    return wrapper
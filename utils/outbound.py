@@ -0,0 +1,162 @@
+# utils/outbound.py
+import asyncio
+import os
+import socket
+import orjson
+from redis.exceptions import ResponseError
+from telegram import TelegramObject
+from telegram.error import BadRequest, Forbidden, RetryAfter, TelegramError
+from config import OUTBOUND_QUEUE, OUTBOUND_WORKERS
+from utils.logger import logger
+from utils.redis_client import redis_client
+from utils.telegram_utils import retry_on_timeout
+
+# Приоритеты: платежи, статусы и поддержка идут раньше объявлений
+PRIORITY_HIGH = "outbound:high"
+PRIORITY_LOW = "outbound:low"
+STREAMS = (PRIORITY_HIGH, PRIORITY_LOW)
+GROUP = "senders"
+ALLOWED_METHODS = {"send_message", "send_invoice", "send_media_group"}
+
+STREAM_MAXLEN = 100_000  # приблизительный потолок длины потока (XADD MAXLEN ~)
+BLOCK_MS = 1000  # ожидание новых записей в XREADGROUP (меньше socket_timeout пула)
+CLAIM_IDLE_MS = 60_000  # запись без ACK дольше этого считается зависшей и передоставляется
+MAX_DELIVERIES = 5  # после стольких доставок запись выбрасывается
+
+
+def _serialize(params: dict) -> bytes:
+    return orjson.dumps({key: value.to_dict() if isinstance(value, TelegramObject) else value for key, value in params.items()})
+
+
+async def enqueue(method: str, params: dict, priority: str = PRIORITY_HIGH):
+    """Кладёт вызов Bot API (method — имя метода Bot, params — его kwargs) в поток приоритета."""
+    await redis_client.xadd(
+        priority,
+        {"method": method, "params": _serialize(params)},
+        maxlen=STREAM_MAXLEN,
+        approximate=True,
+    )
+
+
+async def stream_lengths() -> dict:
+    """Длины потоков исходящих по приоритетам (для /metrics)."""
+    pipe = redis_client.pipeline(transaction=False)
+    for stream in STREAMS:
+        pipe.xlen(stream)
+    return dict(zip(STREAMS, await pipe.execute()))
+
+
+async def deliver(bot, method: str, params: dict, priority: str = PRIORITY_HIGH):
+    """
+    Отправка из handlers. С OUTBOUND_QUEUE=1 только ставит в очередь (отправит OutboundDispatcher),
+    иначе вызывает Bot API сразу через retry_on_timeout.
+    """
+    if OUTBOUND_QUEUE:
+        await enqueue(method, params, priority)
+        return
+    async def send():
+        return await getattr(bot, method)(**params)
+    await retry_on_timeout(send, chat_id=params.get("chat_id"), message_text=params.get("text"))
+
+
+class OutboundDispatcher:
+    """
+    Пул отправителей поверх Redis Streams с consumer group.
+
+    Воркеры сначала выбирают PRIORITY_HIGH, затем блокируются на обоих потоках;
+    лимиты Telegram соблюдает retry_on_timeout (rate_limiter). ACK — после
+    успешной отправки или окончательной ошибки (бот заблокирован, неверный запрос).
+    Записи, висящие без ACK дольше CLAIM_IDLE_MS (процесс упал, сеть), забираются
+    через XCLAIM и доставляются заново, но не больше MAX_DELIVERIES раз.
+    """
+
+    def __init__(self, bot, workers: int = OUTBOUND_WORKERS):
+        self.bot = bot
+        self.workers = workers
+        self.consumer = f"{socket.gethostname()}-{os.getpid()}"
+        self._tasks = []
+
+    async def start(self):
+        for stream in STREAMS:
+            try:
+                await redis_client.xgroup_create(stream, GROUP, id="0", mkstream=True)
+            except ResponseError as e:
+                if "BUSYGROUP" not in str(e):
+                    raise
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._reclaim()))
+        logger.info(f"📤 Outbound dispatcher started: {self.workers} workers, consumer={self.consumer}")
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _read(self):
+        response = await redis_client.xreadgroup(GROUP, self.consumer, {PRIORITY_HIGH: ">"}, count=1)
+        if not response:
+            response = await redis_client.xreadgroup(
+                GROUP, self.consumer, {PRIORITY_HIGH: ">", PRIORITY_LOW: ">"}, count=1, block=BLOCK_MS
+            )
+        return [(stream, entry_id, fields) for stream, entries in response or [] for entry_id, fields in entries]
+
+    async def _work(self):
+        while True:
+            try:
+                for stream, entry_id, fields in await self._read():
+                    await self._send(stream, entry_id, fields)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("❌ Outbound worker error")
+                await asyncio.sleep(1)
+
+    async def _ack(self, stream: str, entry_id: str):
+        pipe = redis_client.pipeline(transaction=False)
+        pipe.xack(stream, GROUP, entry_id)
+        pipe.xdel(stream, entry_id)
+        await pipe.execute()
+
+    async def _send(self, stream: str, entry_id: str, fields: dict):
+        method = fields.get("method")
+        if method not in ALLOWED_METHODS:
+            logger.warning("⚠️ Dropping outbound entry %s: unsupported method %s", entry_id, method)
+            await self._ack(stream, entry_id)
+            return
+        params = orjson.loads(fields["params"])
+        async def send():
+            return await getattr(self.bot, method)(**params)
+        try:
+            await retry_on_timeout(send, chat_id=params.get("chat_id"), message_text=params.get("text"))
+        except (Forbidden, BadRequest) as e:
+            # Повтор не поможет: пользователь заблокировал бота или запрос некорректен
+            logger.warning("⚠️ Dropping outbound %s to chat_id=%s: %s", method, params.get("chat_id"), e, extra={"event": "outbound_dropped"})
+        except RetryAfter as e:
+            logger.warning("⚠️ Flood control for chat_id=%s, pausing worker %ss", params.get("chat_id"), e.retry_after, extra={"event": "flood_control"})
+            await asyncio.sleep(e.retry_after)
+            return  # без ACK — передоставит _reclaim
+        except TelegramError as e:
+            logger.warning("⚠️ Outbound %s to chat_id=%s failed, will redeliver: %s", method, params.get("chat_id"), e, extra={"event": "outbound_failed"})
+            return
+        await self._ack(stream, entry_id)
+
+    async def _reclaim(self):
+        while True:
+            await asyncio.sleep(CLAIM_IDLE_MS / 1000)
+            try:
+                for stream in STREAMS:
+                    pending = await redis_client.xpending_range(stream, GROUP, min="-", max="+", count=100, idle=CLAIM_IDLE_MS)
+                    for entry in pending:
+                        entry_id = entry["message_id"]
+                        if entry["times_delivered"] >= MAX_DELIVERIES:
+                            logger.error("❌ Dropping outbound entry %s after %s deliveries", entry_id, entry["times_delivered"])
+                            await self._ack(stream, entry_id)
+                            continue
+                        for claimed_id, fields in await redis_client.xclaim(stream, GROUP, self.consumer, CLAIM_IDLE_MS, [entry_id]):
+                            if fields:  # None/пусто — запись уже удалена из потока
+                                await self._send(stream, claimed_id, fields)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("❌ Outbound reclaim error")
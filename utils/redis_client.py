@@ -1,4 +1,51 @@
-import redis
-from config import REDIS_URL
+# utils/redis_client.py
+import time
+import redis.asyncio as redis
+from redis.asyncio.client import Pipeline
+from utils.metrics import record_redis
+from config import REDIS_URL, REDIS_MAX_CONNECTIONS, REDIS_POOL_TIMEOUT, REDIS_SOCKET_TIMEOUT
 
-redis_client = redis.from_url(REDIS_URL, decode_responses=True)
\ No newline at end of file
+
+class InstrumentedPipeline(Pipeline):
+    """Pipeline, который учитывает round-trip и выполненные команды в utils.metrics."""
+
+    async def execute(self, raise_on_error: bool = True):
+        stack = self.command_stack  # reset() заменяет список, а не очищает
+        started = time.perf_counter()
+        try:
+            return await super().execute(raise_on_error)
+        finally:
+            if stack:
+                record_redis("PIPELINE", (args[0] for args, _ in stack), time.perf_counter() - started)
+
+
+class InstrumentedRedis(redis.Redis):
+    """Redis, который учитывает каждую команду (и pipeline целиком) в utils.metrics."""
+
+    async def execute_command(self, *args, **options):
+        started = time.perf_counter()
+        try:
+            return await super().execute_command(*args, **options)
+        finally:
+            record_redis(args[0], (args[0],), time.perf_counter() - started)
+
+    def pipeline(self, transaction: bool = True, shard_hint=None) -> InstrumentedPipeline:
+        return InstrumentedPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+
+
+# Один пул на процесс: BlockingConnectionPool ждёт свободное соединение вместо ошибки,
+# поэтому всплеск апдейтов не открывает больше REDIS_MAX_CONNECTIONS соединений
+redis_pool = redis.BlockingConnectionPool.from_url(
+    REDIS_URL,
+    max_connections=REDIS_MAX_CONNECTIONS,
+    timeout=REDIS_POOL_TIMEOUT,
+    socket_timeout=REDIS_SOCKET_TIMEOUT,
+    health_check_interval=30,
+    decode_responses=True,
+)
+redis_client = InstrumentedRedis(connection_pool=redis_pool)
+
+async def close_redis():
+    """Закрывает соединения пула (на shutdown приложения)."""
+    await redis_client.aclose()
+    await redis_pool.disconnect()
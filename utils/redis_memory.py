@@ -0,0 +1,230 @@
+# utils/redis_memory.py
+"""
+Отчёт о памяти Redis по группам ключей и миграция на компактное хранение.
+
+    python -m utils.redis_memory report [--sample 1000]
+    python -m utils.redis_memory migrate
+
+report: по каждой группе SCAN считает ключи, на выборке — MEMORY USAGE и
+OBJECT ENCODING, и экстраполирует на всю группу; для хэшей user:<id> не в
+listpack показывает, какие поля не укладываются в hash-max-listpack-*.
+
+migrate: переносит trial_used:<id> в корзины trials:<n> (authorization.transitions)
+и пересоздаёт хэши user:<id>, которые Redis уже перевёл в hashtable: JSON
+settings и filter прежних версий заменяются filter текущей версии, а сам хэш
+записывается заново — после HDEL длинного поля или замены его коротким Redis
+обратно в listpack его не переводит.
+"""
+import argparse
+import asyncio
+import random
+from collections import Counter
+import orjson
+from authorization.transitions import LEGACY_TRIAL_PREFIX, trial_key
+from monitoring.filter_codec import RegistryFull, UnknownDistrict, decode_filter, district_registry, encode_filter, storage_fields
+from utils.redis_client import close_redis, redis_client
+
+GROUPS = {"user": "user:*", "trial_used (legacy)": f"{LEGACY_TRIAL_PREFIX}*", "trials": "trials:*"}
+COMPACT_ENCODINGS = {"listpack", "ziplist"}  # ziplist — Redis < 7
+SCAN_COUNT = 1000
+
+# Пересоздаёт хэш пользователя с теми же полями и TTL, заменяя settings/filter новым filter.
+# KEYS: user:<id>; ARGV: прочитанные settings и filter ('' — поля не было), новый filter ('' — не менять).
+# Если settings или filter успели изменить после чтения — ничего не делает (вернёт 0).
+REWRITE_LUA = """
+local data = redis.call('HGETALL', KEYS[1])
+if #data == 0 then return 0 end
+local fields = {}
+for i = 1, #data, 2 do fields[data[i]] = data[i + 1] end
+if (fields['settings'] or '') ~= ARGV[1] or (fields['filter'] or '') ~= ARGV[2] then return 0 end
+if ARGV[3] ~= '' then
+  fields['filter'] = ARGV[3]
+  fields['settings'] = nil
+end
+local ttl = redis.call('PTTL', KEYS[1])
+local args = {}
+for field, value in pairs(fields) do
+  table.insert(args, field)
+  table.insert(args, value)
+end
+redis.call('DEL', KEYS[1])
+redis.call('HSET', KEYS[1], unpack(args))
+if ttl > 0 then redis.call('PEXPIRE', KEYS[1], ttl) end
+return 1
+"""
+
+_rewrite_script = redis_client.register_script(REWRITE_LUA)
+
+
+async def listpack_limits() -> tuple[int, int]:
+    """(max entries, max value bytes) хэша в listpack по конфигу сервера."""
+    limits = []
+    for name in ("entries", "value"):
+        config = await redis_client.config_get(f"hash-max-listpack-{name}") or await redis_client.config_get(f"hash-max-ziplist-{name}")
+        limits.append(int(next(iter(config.values()))))
+    return limits[0], limits[1]
+
+
+async def scan_keys(pattern: str):
+    async for key in redis_client.scan_iter(match=pattern, count=SCAN_COUNT):
+        yield key
+
+
+async def report(sample: int = 1000) -> dict:
+    """{группа: {"keys", "sampled", "avg_bytes", "total_bytes", "encodings", "oversized"}}."""
+    max_entries, max_value = await listpack_limits()
+    rng = random.Random(0)
+    result = {}
+    for name, pattern in GROUPS.items():
+        keys, count = [], 0
+        async for key in scan_keys(pattern):
+            # reservoir sampling: выборка равномерна по всей группе
+            count += 1
+            if len(keys) < sample:
+                keys.append(key)
+            elif (slot := rng.randrange(count)) < sample:
+                keys[slot] = key
+        pipe = redis_client.pipeline(transaction=False)
+        for key in keys:
+            pipe.memory_usage(key, samples=0)
+            pipe.object("ENCODING", key)
+        replies = await pipe.execute() if keys else []
+        sizes = [size or 0 for size in replies[::2]]
+        encodings = Counter(replies[1::2])
+        oversized = Counter()
+        if name == "user":
+            # Почему хэш не listpack: слишком много полей или длинные значения
+            loose = [key for key, encoding in zip(keys, replies[1::2]) if encoding not in COMPACT_ENCODINGS]
+            pipe = redis_client.pipeline(transaction=False)
+            for key in loose:
+                pipe.hgetall(key)
+            for data in (await pipe.execute() if loose else []):
+                if len(data) > max_entries:
+                    oversized["<entries>"] += 1
+                oversized.update(field for field, value in data.items() if len(field) > max_value or len(value) > max_value)
+        avg = sum(sizes) / len(sizes) if sizes else 0
+        result[name] = {
+            "keys": count, "sampled": len(keys), "avg_bytes": avg, "total_bytes": avg * count,
+            "encodings": dict(encodings), "oversized": dict(oversized),
+        }
+    return result
+
+
+def print_report(result: dict, users: int | None = None):
+    total = 0
+    for name, group in result.items():
+        total += group["total_bytes"]
+        encodings = ", ".join(f"{encoding} {n}" for encoding, n in sorted(group["encodings"].items())) or "-"
+        print(f"{name:<20} keys {group['keys']:9,}  avg {group['avg_bytes']:7.1f} B  total ~{group['total_bytes'] / 2**20:8.2f} MiB  [{encodings}]")
+        if group["oversized"]:
+            print(f"{'':<20} not listpack because of: {', '.join(f'{field} {n}' for field, n in group['oversized'].items())}")
+    users = users or result["user"]["keys"]
+    print(f"{'total':<20} ~{total / 2**20:.2f} MiB" + (f", {total / users:.1f} B per user" if users else ""))
+
+
+async def migrate_trials() -> int:
+    """trial_used:<id> -> поле chat_id в trials:<n>; возвращает число перенесённых."""
+    moved = 0
+    batch = []
+    async for key in scan_keys(f"{LEGACY_TRIAL_PREFIX}*"):
+        batch.append(key)
+        if len(batch) >= SCAN_COUNT:
+            moved += await _move_trials(batch)
+            batch = []
+    if batch:
+        moved += await _move_trials(batch)
+    return moved
+
+
+async def _move_trials(keys: list) -> int:
+    pipe = redis_client.pipeline(transaction=True)  # HSET и DEL пачки вместе: флаг не теряется и не двоится
+    for key in keys:
+        chat_id = key[len(LEGACY_TRIAL_PREFIX):]
+        pipe.hset(trial_key(int(chat_id)), chat_id, 1)
+        pipe.delete(key)
+    await pipe.execute()
+    return len(keys)
+
+
+async def compact_users() -> tuple[int, int]:
+    """Пересоздаёт хэши user:<id> не в listpack; возвращает (проверено, пересоздано)."""
+    limits = await listpack_limits()
+    await district_registry.load()
+    checked = rewritten = 0
+    batch = []
+    async for key in scan_keys("user:*"):
+        batch.append(key)
+        if len(batch) >= SCAN_COUNT:
+            rewritten += await _compact_batch(batch, limits)
+            checked += len(batch)
+            batch = []
+    if batch:
+        rewritten += await _compact_batch(batch, limits)
+        checked += len(batch)
+    return checked, rewritten
+
+
+async def _compact_batch(keys: list, limits: tuple[int, int]) -> int:
+    max_entries, max_value = limits
+    pipe = redis_client.pipeline(transaction=False)
+    for key in keys:
+        pipe.object("ENCODING", key)
+    loose = [key for key, encoding in zip(keys, await pipe.execute()) if encoding == "hashtable"]
+    if not loose:
+        return 0
+    pipe = redis_client.pipeline(transaction=False)
+    for key in loose:
+        pipe.hgetall(key)
+    rewrites = []
+    for key, data in zip(loose, await pipe.execute()):
+        settings, encoded = data.get("settings", ""), data.get("filter", "")
+        if encoded:
+            # Заодно перекодируем в текущую версию: v1 с масками районов бывает длиннее hash-max-listpack-value
+            try:
+                flt = decode_filter(encoded)
+            except UnknownDistrict:
+                await district_registry.load()  # район выдан уже после загрузки реестра
+                flt = decode_filter(encoded)
+            new_filter = encode_filter(flt, district_registry.mask(flt.districts))
+        elif settings:
+            try:
+                new_filter = (await storage_fields(orjson.loads(settings)))["filter"]
+            except RegistryFull:
+                continue  # районов нет в заполненном реестре — оставляем JSON
+            if not new_filter:
+                continue  # фильтр не кодируется компактно — оставляем JSON
+        else:
+            new_filter = ""
+        rewritten = {field: value for field, value in data.items() if field != "settings"} if new_filter else data
+        if new_filter:
+            rewritten["filter"] = new_filter
+        if len(rewritten) > max_entries or any(len(field) > max_value or len(value) > max_value for field, value in rewritten.items()):
+            continue  # и после переписывания останется hashtable
+        rewrites.append((key, settings, encoded, new_filter))
+    pipe = redis_client.pipeline(transaction=False)
+    for key, settings, encoded, new_filter in rewrites:
+        await _rewrite_script(keys=[key], args=[settings, encoded, new_filter], client=pipe)
+    return sum(await pipe.execute()) if rewrites else 0
+
+
+async def migrate():
+    moved = await migrate_trials()
+    print(f"trial flags moved to trials:* buckets: {moved:,}")
+    checked, rewritten = await compact_users()
+    print(f"user hashes checked: {checked:,}, rewritten as listpack: {rewritten:,}")
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("command", choices=("report", "migrate"))
+    parser.add_argument("--sample", type=int, default=1000, help="ключей на группу для MEMORY USAGE")
+    args = parser.parse_args()
+    if args.command == "report":
+        print_report(await report(args.sample))
+    else:
+        await migrate()
+    await close_redis()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -2,40 +2,176 @@
 from telegram.error import TimedOut
 import asyncio
 import time
-from collections import defaultdict
+from collections import OrderedDict
 from utils.logger import logger
+from utils.metrics import RATE_LIMIT_WAIT_SECONDS, SEND_ATTEMPTS, SEND_FAILURES, SEND_TIMEOUTS
+from config import RATE_LIMITER_BACKEND
+
+class TokenBucket:
+    """
+    Token bucket с резервированием: reserve() сразу забирает токен (при нехватке — в долг)
+    и возвращает точное время ожидания. Долг копится по порядку вызовов, поэтому
+    ожидающие получают токены строго FIFO без опроса.
+    """
+
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate: float, capacity: float, now: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = now
+
+    def reserve(self, now: float) -> float:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def refund(self):
+        """Возвращает токен, если ожидавший так и не отправил сообщение (отмена)."""
+        self.tokens += 1
+
+    def full(self, now: float) -> bool:
+        """Бакет восстановился до capacity: неотличим от нового, долгов и ожидающих нет."""
+        return self.tokens + (now - self.updated) * self.rate >= self.capacity
+
+
+EVICT_SKIPS = 8  # бакетов в долгу, переносимых в хвост за одно вытеснение: вставка остаётся O(1)
+
 
 class RateLimiter:
-    def __init__(self, messages_per_second=1, global_messages_per_second=30):
-        self.chat_timestamps = defaultdict(list)
-        self.global_timestamps = []
+    """
+    Лимиты Telegram: messages_per_second на чат и global_messages_per_second на бота.
+
+    Бакеты чатов лежат в OrderedDict в порядке последнего использования:
+    простаивающие дольше idle_ttl и всё сверх max_chats вытесняются с головы,
+    так что память ограничена, а каждая операция — O(1) амортизированно.
+    Вытесняется только восстановившийся бакет: бакет в долгу — это очередь
+    ожидающих, и новый полный бакет на его месте пропустил бы отправку вне
+    лимита чата. Такие бакеты при переполнении переносятся в хвост (не больше
+    EVICT_SKIPS за вызов), так что сверх max_chats могут ненадолго остаться
+    только чаты, писавшие последние секунды.
+    """
+
+    def __init__(self, messages_per_second=1, global_messages_per_second=30, max_chats=10_000, idle_ttl=60):
         self.messages_per_second = messages_per_second
         self.global_messages_per_second = global_messages_per_second
+        self.max_chats = max_chats
+        self.idle_ttl = idle_ttl
+        self.chat_buckets = OrderedDict()
+        self.global_bucket = TokenBucket(global_messages_per_second, global_messages_per_second, time.monotonic())
+
+    def _chat_bucket(self, chat_id, now: float) -> TokenBucket:
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is not None:
+            self.chat_buckets.move_to_end(chat_id)
+            return bucket
+        self._evict(now)
+        bucket = self.chat_buckets[chat_id] = TokenBucket(self.messages_per_second, self.messages_per_second, now)
+        return bucket
+
+    def _evict(self, now: float):
+        buckets = self.chat_buckets
+        skips = 0
+        while buckets and skips < EVICT_SKIPS:
+            chat_id, oldest = next(iter(buckets.items()))
+            overflow = len(buckets) >= self.max_chats
+            if not overflow and now - oldest.updated < self.idle_ttl:
+                break
+            if oldest.full(now):
+                buckets.popitem(last=False)
+            elif overflow:
+                buckets.move_to_end(chat_id)
+                skips += 1
+            else:
+                break
+
+    async def _acquire(self, bucket: TokenBucket):
+        delay = bucket.reserve(time.monotonic())
+        if delay:
+            try:
+                await asyncio.sleep(delay)
+            except asyncio.CancelledError:
+                bucket.refund()
+                raise
+
+    async def _acquire_global(self):
+        await self._acquire(self.global_bucket)
 
     async def wait_for_slot(self, chat_id):
-        current_time = time.time()
-        # Clean old timestamps
-        self.chat_timestamps[chat_id] = [t for t in self.chat_timestamps[chat_id] if current_time - t < 1]
-        self.global_timestamps = [t for t in self.global_timestamps if current_time - t < 1]
-        
-        # Wait for chat-specific slot
-        while len(self.chat_timestamps[chat_id]) >= self.messages_per_second:
-            await asyncio.sleep(0.1)
-            current_time = time.time()
-            self.chat_timestamps[chat_id] = [t for t in self.chat_timestamps[chat_id] if current_time - t < 1]
-        
-        # Wait for global slot
-        while len(self.global_timestamps) >= self.global_messages_per_second:
-            await asyncio.sleep(0.1)
-            current_time = time.time()
-            self.global_timestamps = [t for t in self.global_timestamps if current_time - t < 1]
-        
-        # Record timestamps
-        self.chat_timestamps[chat_id].append(current_time)
-        self.global_timestamps.append(current_time)
-
-# Initialize rate limiter
-rate_limiter = RateLimiter()
+        # Сначала слот чата, потом глобальный: глобальный токен не простаивает, пока ждём чат
+        started = time.monotonic()
+        await self._acquire(self._chat_bucket(chat_id, started))
+        await self._acquire_global()
+        RATE_LIMIT_WAIT_SECONDS.observe(time.monotonic() - started)
+
+
+# Глобальный token bucket в Redis. Время берётся с сервера (TIME), чтобы часы воркеров не расходились.
+# KEYS: ключ бакета; ARGV: rate, capacity, сколько токенов просим.
+# Возвращает {выдано, сколько ждать до следующего токена (сек, строкой)}.
+GLOBAL_BUCKET_LUA = """
+local rate, capacity, requested = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local granted = math.min(requested, math.floor(tokens))
+local wait = 0
+if granted < 1 then
+  granted = 0
+  wait = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens - granted), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+return {granted, tostring(wait)}
+"""
+
+
+class RedisRateLimiter(RateLimiter):
+    """
+    RateLimiter с глобальным лимитом, общим для всех процессов/инстансов через Redis.
+
+    Глобальные токены берутся из Redis пачками по lease_size и тратятся локально,
+    так что не каждая отправка стоит лишний RTT. Непотраченный остаток пачки
+    сгорает через lease_ttl, чтобы простаивающий воркер не держал чужую квоту.
+    Лимит на чат остаётся локальным.
+    """
+
+    def __init__(self, redis, key="ratelimit:global", lease_size=3, lease_ttl=0.5, **kwargs):
+        super().__init__(**kwargs)
+        self.key = key
+        self.lease_size = lease_size
+        self.lease_ttl = lease_ttl
+        self._script = redis.register_script(GLOBAL_BUCKET_LUA)
+        self._granted = 0
+        self._lease_expires = 0.0
+        self._lock = asyncio.Lock()  # FIFO между локальными ожидающими и один запрос в Redis за раз
+
+    async def _acquire_global(self):
+        async with self._lock:
+            while True:
+                if self._granted and time.monotonic() < self._lease_expires:
+                    self._granted -= 1
+                    return
+                granted, wait = await self._script(
+                    keys=[self.key],
+                    args=[self.global_messages_per_second, self.global_messages_per_second, self.lease_size],
+                )
+                if granted:
+                    self._granted = int(granted)
+                    self._lease_expires = time.monotonic() + self.lease_ttl
+                else:
+                    await asyncio.sleep(float(wait))
+
+# Initialize rate limiter: RATE_LIMITER_BACKEND=redis — общий лимит на все воркеры
+if RATE_LIMITER_BACKEND == "redis":
+    from utils.redis_client import redis_client
+    rate_limiter = RedisRateLimiter(redis_client)
+else:
+    rate_limiter = RateLimiter()
 
 async def retry_on_timeout(func, max_attempts=3, delay=1, chat_id=None, message_text=None):
     """
@@ -58,11 +194,18 @@ async def retry_on_timeout(func, max_attempts=3, delay=1, chat_id=None, message_
         try:
             if chat_id:
                 await rate_limiter.wait_for_slot(chat_id)
-            return await func()
+            result = await func()
+            SEND_ATTEMPTS.observe(attempt + 1)
+            return result
         except TimedOut as e:
+            SEND_TIMEOUTS.inc()
             if attempt == max_attempts - 1:
-                logger.error(f"❌ Failed to send to chat_id={chat_id} after {max_attempts} attempts: {e}, message={message_text}")
+                SEND_ATTEMPTS.observe(max_attempts)
+                SEND_FAILURES.inc()
+                logger.error("❌ Failed to send to chat_id=%s after %s attempts: %s, message=%s", chat_id, max_attempts, e, message_text,
+                             extra={"event": "telegram_send_failed"})
                 raise
-            logger.warning(f"⚠️ Telegram TimedOut for chat_id={chat_id}, retrying in {delay}s (attempt {attempt + 1}/{max_attempts}), message={message_text}")
+            logger.warning("⚠️ Telegram TimedOut for chat_id=%s, retrying in %ss (attempt %s/%s), message=%s",
+                           chat_id, delay, attempt + 1, max_attempts, message_text, extra={"event": "telegram_timeout"})
             await asyncio.sleep(delay)
             delay *= 2  # Exponential backoff
\ No newline at end of file
@@ -96,6 +96,16 @@ translations = {
 
     
 
+    # Сообщения из monitoring/notifier.py
+    "new_listing": {
+        "ru": "🏠 {title}\n💵 {price}$\n{url}",
+        "en": "🏠 {title}\n💵 {price}$\n{url}"
+    },
+    "digest_header": {
+        "ru": "🔔 Новых объявлений: {count}",
+        "en": "🔔 New announcements: {count}"
+    },
+
     # Сообщения из support.py
     "support_reply": {
         "ru": "💬 Ответ поддержки:\n{reply}",
@@ -0,0 +1,53 @@
+# utils/update_processor.py
+import asyncio
+from telegram.ext import BaseUpdateProcessor
+
+
+def chat_key(update):
+    """Чат, в пределах которого апдейты обрабатываются строго по порядку (None — без ограничений)."""
+    chat = getattr(update, "effective_chat", None)
+    if chat is not None:
+        return chat.id
+    user = getattr(update, "effective_user", None)  # pre_checkout_query и т.п. — без чата
+    return user.id if user is not None else None
+
+
+class PerChatUpdateProcessor(BaseUpdateProcessor):
+    """
+    До max_concurrent_updates апдейтов параллельно, но внутри одного чата — по одному
+    в порядке поступления: start/stop/оплата одного пользователя не перемешиваются.
+
+    Блокировка чата берётся до общего семафора, поэтому очередь апдейтов одного
+    чата не занимает слоты остальных. asyncio.Lock будит ожидающих FIFO; блокировка
+    удаляется, когда у чата не осталось ни обработки, ни ожидающих.
+    """
+
+    def __init__(self, max_concurrent_updates: int):
+        super().__init__(max_concurrent_updates)
+        self._chat_locks = {}  # chat_id -> [asyncio.Lock, сколько апдейтов держат/ждут]
+
+    async def process_update(self, update, coroutine):
+        key = chat_key(update)
+        if key is None:
+            await super().process_update(update, coroutine)
+            return
+        entry = self._chat_locks.get(key)
+        if entry is None:
+            entry = self._chat_locks[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                await super().process_update(update, coroutine)
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._chat_locks[key]
+
+    async def do_process_update(self, update, coroutine):
+        await coroutine
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
@@ -0,0 +1,127 @@
+# utils/update_queue.py
+import asyncio
+import time
+from collections import deque
+from utils.logger import logger
+from utils.redis_client import redis_client
+from utils.update_processor import chat_key
+from config import UPDATE_QUEUE_SIZE, UPDATE_WORKERS
+
+DEDUPE_TTL = 3600  # сек: Telegram повторяет недоставленные апдейты не дольше этого
+DRAIN_TIMEOUT = 5  # сек на дообработку очереди при остановке
+
+
+class QueueFull(Exception):
+    """Очередь апдейтов переполнена — эндпоинт отвечает 503, Telegram повторит позже."""
+
+
+class UpdateQueue:
+    """
+    Ограниченная in-process очередь апдейтов Telegram с пулом обработчиков.
+
+    Эндпоинт кладёт апдейт через put() и сразу отвечает 200, обработка
+    (Redis, исходящие) идёт в воркерах. Повторы Telegram отсекаются по
+    update_id через SET NX в Redis, общий для всех процессов.
+
+    Апдейты копятся по чатам (utils.update_processor.chat_key), воркеры берут
+    чаты из очереди готовых: чат, чей апдейт уже обрабатывается, в ней не стоит.
+    Поэтому апдейты одного чата идут по порядку и занимают не больше одного
+    воркера, а воркер не ждёт блокировку чата, пока остальные чаты стоят в
+    очереди. Чат с оставшимися апдейтами встаёт в конец очереди готовых —
+    частый чат чередуется с остальными.
+    """
+
+    def __init__(self, process, maxsize: int = UPDATE_QUEUE_SIZE, workers: int = UPDATE_WORKERS):
+        self.process = process  # async (update) -> None, обычно application.process_update
+        self.maxsize = maxsize
+        self.workers = workers
+        self.depth = 0  # принятых и ещё не обработанных апдейтов
+        self.processed = 0
+        self.duplicates = 0
+        self.rejected = 0
+        self.last_lag = 0.0  # сек от приёма до начала обработки последнего апдейта
+        self.max_lag = 0.0
+        self._chats = {}  # ключ чата -> deque[(update, время приёма)], пока у чата есть апдейты
+        self._ready = asyncio.Queue()  # ключи чатов с апдейтами, которые никто не обрабатывает
+        self._drained = asyncio.Event()
+        self._drained.set()
+        self._tasks = []
+
+    async def start(self):
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+        logger.info(f"📥 Update queue started: {self.workers} workers, maxsize={self.maxsize}")
+
+    async def join(self):
+        """Ждёт, пока все принятые апдейты обработаны."""
+        await self._drained.wait()
+
+    async def stop(self):
+        try:
+            await asyncio.wait_for(self.join(), DRAIN_TIMEOUT)
+        except asyncio.TimeoutError:
+            logger.warning(f"⚠️ Update queue not drained on shutdown, {self.depth} updates left")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def put(self, update) -> bool:
+        """Ставит апдейт в очередь. False — дубликат (уже принят), QueueFull — нет места."""
+        if self.depth >= self.maxsize:
+            self.rejected += 1
+            raise QueueFull()
+        key = f"update:{update.update_id}"
+        if not await redis_client.set(key, 1, nx=True, ex=DEDUPE_TTL):
+            self.duplicates += 1
+            return False
+        if self.depth >= self.maxsize:
+            # Место заняли, пока ждали Redis: снимаем отметку, чтобы повтор Telegram прошёл
+            await redis_client.delete(key)
+            self.rejected += 1
+            raise QueueFull()
+        chat = chat_key(update)
+        if chat is None:
+            chat = ("update", update.update_id)  # без чата — порядок не важен, свой ключ
+        pending = self._chats.get(chat)
+        if pending is None:
+            self._chats[chat] = deque([(update, time.monotonic())])
+            self._ready.put_nowait(chat)
+        else:
+            pending.append((update, time.monotonic()))
+        self.depth += 1
+        self._drained.clear()
+        return True
+
+    def stats(self) -> dict:
+        return {
+            "depth": self.depth,
+            "chats": len(self._chats),
+            "maxsize": self.maxsize,
+            "workers": self.workers,
+            "processed": self.processed,
+            "duplicates": self.duplicates,
+            "rejected": self.rejected,
+            "last_lag": round(self.last_lag, 3),
+            "max_lag": round(self.max_lag, 3),
+        }
+
+    async def _work(self):
+        while True:
+            chat = await self._ready.get()
+            pending = self._chats[chat]
+            update, received = pending.popleft()
+            try:
+                self.last_lag = time.monotonic() - received
+                self.max_lag = max(self.max_lag, self.last_lag)
+                await self.process(update)
+                self.processed += 1
+            except Exception:
+                logger.exception("❌ Error processing update %s", update.update_id)
+            finally:
+                if pending:
+                    self._ready.put_nowait(chat)  # следующий апдейт чата — после уже ждущих чатов
+                else:
+                    del self._chats[chat]
+                self.depth -= 1
+                if not self.depth:
+                    self._drained.set()